@@ -0,0 +1,260 @@
+"""
+Iterative execution mode for the OS Agent.
+Instead of planning once, the planner is called in a loop and the results of
+each step's commands are fed back to it as observations, so a task that needs
+several rounds (look, then act on what was found) completes in one request.
+The loop stops as soon as the model reports the goal is met, when it stops
+making progress, or when the step or token budget is spent. Independent
+read-only probes planned for the same step run concurrently.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from context_assembler import count_tokens, truncate_to_tokens
+from plan_store import PendingPlan, PlanStep
+from read_only import is_read_only_command
+
+DEFAULT_MAX_STEPS = 6
+DEFAULT_TOKEN_BUDGET = 40000
+DEFAULT_OBSERVATION_TOKENS = 300
+DEFAULT_HISTORY_TOKENS = 3000
+DEFAULT_PROBE_WORKERS = 4
+
+READ_ONLY_FILE_OPERATIONS = frozenset({
+    'list', 'du', 'largest_dirs', 'glob', 'search', 'locate', 'largest', 'recent', 'hash', 'info'
+})
+
+
+def is_read_only(step: PlanStep) -> bool:
+    """Whether a step only inspects the system and can run alongside other probes"""
+    if step.requires_confirmation:
+        return False
+    file_op = step.spec.get('file_operation')
+    if isinstance(file_op, dict):
+        return file_op.get('operation') in READ_ONLY_FILE_OPERATIONS
+    return is_read_only_command(step.command)
+
+
+class AgentLoop:
+    """Plan, execute, observe, repeat, within a step and token budget"""
+
+    def __init__(self, agent, max_steps: int = DEFAULT_MAX_STEPS, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 observation_tokens: int = DEFAULT_OBSERVATION_TOKENS, history_tokens: int = DEFAULT_HISTORY_TOKENS,
+                 probe_workers: int = DEFAULT_PROBE_WORKERS):
+        self.agent = agent
+        self.max_steps = max_steps
+        self.token_budget = token_budget
+        self.observation_tokens = observation_tokens
+        self.history_tokens = history_tokens
+        self.probe_workers = probe_workers
+
+    def run(self, user_request: str, confirmed_commands: Optional[List[str]] = None,
+            max_steps: Optional[int] = None, token_budget: Optional[int] = None) -> Dict[str, Any]:
+        state = {
+            'user_request': user_request,
+            'history': [],
+            'llm_calls': 0,
+            'tokens_used': 0,
+            'max_steps': max_steps or self.max_steps,
+            'token_budget': token_budget or self.token_budget,
+            'last_response': {}
+        }
+        return self._loop(state, confirmed_commands or [])
+
+    def resume(self, plan: PendingPlan, confirmed_commands: List[str]) -> Dict[str, Any]:
+        """Continue the loop after the confirmed part of a paused step has run"""
+        state = plan.loop_state
+        entry = state['history'][-1]
+        for result in entry['results']:
+            result.setdefault('step', entry['step'])
+        if plan.gemini_response.get('done'):
+            return self._finish(state, 'done')
+        return self._loop(state, confirmed_commands)
+
+    # --- Loop --------------------------------------------------------------
+
+    def _loop(self, state: Dict[str, Any], confirmed_commands: List[str]) -> Dict[str, Any]:
+        agent = self.agent
+        stop_reason = 'max_steps'
+        while len(state['history']) < state['max_steps']:
+            prompt = self._prompt(state)
+            prompt_tokens = count_tokens(prompt)
+            if state['tokens_used'] + prompt_tokens > state['token_budget']:
+                stop_reason = 'token_budget'
+                break
+
+            response = agent.model.generate_content(prompt)
+            state['llm_calls'] += 1
+            state['tokens_used'] += self._tokens_used(response, prompt_tokens)
+            gemini_response = agent._parse_gemini_response(response.text)
+            state['last_response'] = gemini_response
+
+            if gemini_response.get('learned_info'):
+                agent.memory.store_system_fact(
+                    f"learned_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                    gemini_response['learned_info']
+                )
+
+            steps = agent._plan_steps(gemini_response)
+            if not steps:
+                stop_reason = 'done'
+                break
+            commands = [s.command for s in steps]
+            if state['history'] and commands == state['history'][-1]['commands']:
+                # Asking for exactly the same thing again will not get any further
+                stop_reason = 'no_progress'
+                break
+
+            entry = {'step': len(state['history']) + 1, 'commands': commands, 'results': []}
+            state['history'].append(entry)
+            pending_index = self._execute(steps, state, confirmed_commands)
+            if pending_index is not None:
+                return self._pause(state, gemini_response, steps, pending_index, confirmed_commands)
+            if gemini_response.get('done'):
+                stop_reason = 'done'
+                break
+        return self._finish(state, stop_reason)
+
+    def _execute(self, steps: List[PlanStep], state: Dict[str, Any], confirmed_commands: List[str]) -> Optional[int]:
+        """Run the latest step's commands in order, read-only runs concurrently; returns the index
+        of the first command still needing confirmation, if any"""
+        entry = state['history'][-1]
+        index = 0
+        while index < len(steps):
+            step = steps[index]
+            if step.requires_confirmation and step.command not in confirmed_commands:
+                return index
+            # Anything after a background job of this loop waits for it, one command at a time
+            after_job = self.agent._last_job([r for e in state['history'] for r in e['results']])
+            if after_job is not None or not is_read_only(step):
+                entry['results'].append(self._run(step, entry['step'], after_job=after_job))
+                index += 1
+                continue
+
+            batch = [step]
+            while index + len(batch) < len(steps) and is_read_only(steps[index + len(batch)]):
+                batch.append(steps[index + len(batch)])
+            if len(batch) == 1:
+                entry['results'].append(self._run(step, entry['step']))
+            else:
+                with ThreadPoolExecutor(max_workers=min(len(batch), self.probe_workers)) as pool:
+                    entry['results'].extend(pool.map(lambda s: self._run(s, entry['step'], isolated=True), batch))
+            index += len(batch)
+        return None
+
+    def _run(self, step: PlanStep, step_number: int, isolated: bool = False,
+             after_job: Optional[str] = None) -> Dict[str, Any]:
+        try:
+            result = self.agent._run_step(step, isolated=isolated, after_job=after_job)
+        except Exception as e:
+            result = {'command': step.command, 'success': False, 'output_message': str(e)}
+        result['step'] = step_number
+        return result
+
+    def _pause(self, state: Dict[str, Any], gemini_response: Dict[str, Any], steps: List[PlanStep],
+               pending_index: int, confirmed_commands: List[str]) -> Dict[str, Any]:
+        """Park the loop as a stored plan until the user confirms the destructive command(s)"""
+        agent = self.agent
+        entry = state['history'][-1]
+        plan = PendingPlan(
+            plan_id=agent.plans.new_id(),
+            user_request=state['user_request'],
+            gemini_response=gemini_response,
+            steps=steps,
+            next_index=pending_index,
+            execution_results=entry['results'],
+            loop_state=state
+        )
+        agent._store_plan(plan)
+        result = self._result(state, 'pending_confirmation')
+        result['plan_id'] = plan.plan_id
+        result['pending_confirmation_commands'] = [
+            s.command for s in steps[pending_index:]
+            if s.requires_confirmation and s.command not in confirmed_commands
+        ]
+        return result
+
+    def _finish(self, state: Dict[str, Any], stop_reason: str) -> Dict[str, Any]:
+        result = self._result(state, stop_reason)
+        self.agent._record_conversation(state['user_request'], result['gemini_response'], result['execution_results'])
+        return result
+
+    def _result(self, state: Dict[str, Any], stop_reason: str) -> Dict[str, Any]:
+        return {
+            'request': state['user_request'],
+            'gemini_response': state['last_response'],
+            'timestamp': datetime.now().isoformat(),
+            'system': self.agent.system_info['system'],
+            'execution_results': [r for entry in state['history'] for r in entry['results']],
+            'pending_confirmation_commands': [],
+            'iterations': len(state['history']),
+            'llm_calls': state['llm_calls'],
+            'tokens_used': state['tokens_used'],
+            'stop_reason': stop_reason
+        }
+
+    # --- Prompt ------------------------------------------------------------
+
+    @staticmethod
+    def _tokens_used(response, prompt_tokens: int) -> int:
+        usage = getattr(response, 'usage_metadata', None)
+        total = getattr(usage, 'total_token_count', None) if usage is not None else None
+        if isinstance(total, int) and total > 0:
+            return total
+        return prompt_tokens + count_tokens(getattr(response, 'text', '') or '')
+
+    def _observations(self, state: Dict[str, Any]) -> str:
+        """Results of earlier steps, newest in full and older ones condensed to fit the history budget"""
+        blocks: List[str] = []
+        remaining = self.history_tokens
+        for entry in reversed(state['history']):
+            lines = [f"Step {entry['step']}:"]
+            for result in entry['results']:
+                status = 'ok' if result.get('success') else 'failed'
+                lines.append(f"$ {result.get('command', '')}  [{status}]")
+                output = str(result.get('output_message') or '').strip()
+                if output:
+                    lines.append(truncate_to_tokens(output, self.observation_tokens))
+            block = '\n'.join(lines)
+            if count_tokens(block) > remaining:
+                block = f"Step {entry['step']}: " + '; '.join(
+                    f"{r.get('command', '')} [{'ok' if r.get('success') else 'failed'}]" for r in entry['results'])
+                block = truncate_to_tokens(block, max(0, remaining))
+            remaining -= count_tokens(block)
+            blocks.append(block)
+            if remaining <= 0:
+                break
+        return '\n\n'.join(reversed(blocks))
+
+    def _prompt(self, state: Dict[str, Any]) -> str:
+        step_number = len(state['history']) + 1
+        observations = self._observations(state)
+        return f"""
+{self.agent._get_context_prompt(state['user_request'])}
+
+User Request: {state['user_request']}
+
+You are working on this request in steps. After each step you will see the results of the
+commands you asked for and can plan the next step from them.
+- Put independent read-only probes (listing, reading, searching, status queries) in the same step; they run in parallel.
+- Commands that depend on the output of earlier commands belong in a later step.
+- Set "done": true as soon as the request is fulfilled and put the answer for the user in "user_message". Commands in that response still run.
+- Return no commands when there is nothing left to do.
+- This is step {step_number} of at most {state['max_steps']}.
+
+{('Results of previous steps:' + chr(10) + observations) if observations else 'No steps have run yet.'}
+
+Response format should be JSON with the following structure:
+{{
+    "action_type": "command|info|file_operation|process_management|system_query",
+    "commands": [
+        {{"command": "command_string", "requires_confirmation": false}},
+        {{"file_operation": {{"operation": "list|du|largest_dirs|glob|locate|largest|recent|hash|info|copy|move|delete|create_dir", "source": "path"}}, "requires_confirmation": false}}
+    ],
+    "done": false,
+    "user_message": "A short, simple, user-friendly message; the final answer once done.",
+    "learned_info": "Any new critical information or preference learned from the interaction that should be stored."
+}}
+"""
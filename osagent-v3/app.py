@@ -1,23 +1,35 @@
 import os
 import sys
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, Request, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, StreamingResponse, Response
+from pydantic import BaseModel, ConfigDict, Field
 from dotenv import load_dotenv
 import asyncio
+import hashlib
+import json
 import logging
-from typing import List, Optional
+import random
+import time
+from typing import Any, Dict, List, Optional
 from fastapi.middleware.cors import CORSMiddleware
 # Import the OSAgent from your refactored file
 from os_agent import OSAgent # BrowserCode import removed
+from process_table import SORT_KEYS
+from live_feed import LiveFeed, CHANNELS
+from static_assets import AssetBundle, Asset
+from log_pipeline import configure_logging, log_event
 
 load_dotenv()
 
-# Configure logging for the FastAPI app
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Configure logging for the FastAPI app: records are written by a background thread
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# Fraction of /execute responses whose (truncated) body is also logged at INFO
+LOG_DETAIL_SAMPLE_RATE = float(os.getenv('OSAGENT_LOG_DETAIL_RATE', '0.01'))
+LOG_DETAIL_CHARS = 2048
+LOG_FIELD_CHARS = 200
+
 app = FastAPI()
 
 origins = [
@@ -36,8 +48,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files (for your HTML, CSS, JS)
-app.mount("/static", StaticFiles(directory="frontend"), name="static")
+# Frontend assets (HTML, CSS, JS), loaded, fingerprinted and compressed once at startup
+assets = AssetBundle("frontend")
 
 # Initialize the OS Agent
 gemini_api_key = os.getenv('GEMINI_API_KEY')
@@ -48,33 +60,334 @@ if not gemini_api_key:
 os_agent = OSAgent(gemini_api_key=gemini_api_key)
 logger.info("OSAgent initialized successfully for FastAPI.")
 
+# One sampler for every dashboard viewer
+live_feed = LiveFeed(os_agent, interval=os_agent.process_sampler.interval)
+
 class CommandRequest(BaseModel):
     command: str
     # Add an optional list of commands that the user has confirmed
     confirmed_commands: Optional[List[str]] = Field(default_factory=list)
+    # Plan returned with pending_confirmation_commands; confirming resumes it without re-planning
+    plan_id: Optional[str] = None
+    # Feed command results back to the planner until the goal is met (at most max_steps rounds)
+    iterative: bool = False
+    max_steps: Optional[int] = Field(default=None, ge=1, le=20)
+    # Top-level response fields to return (e.g. ["execution_results"]); all when omitted
+    fields: Optional[List[str]] = None
+
+class ExecutionResult(BaseModel):
+    model_config = ConfigDict(extra='allow')
+    command: str
+    success: bool
+    output_message: Optional[str] = None
+    output_id: Optional[str] = None
+    truncated: bool = False
+    step: Optional[int] = None
+    data: Optional[Dict[str, Any]] = None
+    hosts: Optional[Dict[str, Any]] = None
+    resources: Optional[Dict[str, Any]] = None
+    job: Optional[Dict[str, Any]] = None
+
+class ExecuteResponse(BaseModel):
+    model_config = ConfigDict(extra='allow')
+    request: str
+    gemini_response: Dict[str, Any] = Field(default_factory=dict)
+    timestamp: str
+    system: Optional[str] = None
+    execution_results: List[ExecutionResult] = Field(default_factory=list)
+    pending_confirmation_commands: List[str] = Field(default_factory=list)
+    plan_id: Optional[str] = None
+    speculative_commands: Optional[List[str]] = None
+    # Iterative mode
+    iterations: Optional[int] = None
+    llm_calls: Optional[int] = None
+    tokens_used: Optional[int] = None
+    stop_reason: Optional[str] = None
+    # Batch item position
+    index: Optional[int] = None
+    error: Optional[str] = None
+    user_message: Optional[str] = None
+
+class BatchItem(BaseModel):
+    command: str
+    confirmed_commands: Optional[List[str]] = Field(default_factory=list)
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem] = Field(..., min_length=1, max_length=500)
+
+def conditional_json(request: Request, payload) -> Response:
+    """JSON response with an ETag; 304 without a body when the client already has this version"""
+    body = json.dumps(payload, default=str, separators=(',', ':')).encode('utf-8')
+    etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if_none_match = request.headers.get('if-none-match', '')
+    if etag in (tag.strip() for tag in if_none_match.split(',')) or if_none_match.strip() == '*':
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type='application/json', headers=headers)
+
+def asset_response(request: Request, asset: Asset, cache_control: str) -> Response:
+    """In-memory asset in the best encoding the client accepts, 304 if its copy is current"""
+    encoding, body = asset.select(request.headers.get('accept-encoding', ''))
+    etag = asset.etag_for(encoding)
+    headers = {'ETag': etag, 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+    if etag in (tag.strip() for tag in request.headers.get('if-none-match', '').split(',')):
+        return Response(status_code=304, headers=headers)
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(content=body, media_type=asset.content_type, headers=headers)
 
 @app.get("/", response_class=HTMLResponse)
-async def read_root():
+async def read_root(request: Request):
     """Serve the main HTML page."""
-    with open("frontend/index.html", "r") as f:
-        return HTMLResponse(content=f.read())
+    if assets.index is None:
+        raise HTTPException(status_code=404, detail="frontend/index.html not found")
+    return asset_response(request, assets.index, 'no-cache')
+
+@app.get("/static/{path:path}")
+async def static_file(path: str, request: Request):
+    """Serve a frontend asset; fingerprinted URLs are cached by browsers indefinitely."""
+    asset, cache_control = assets.lookup(path)
+    if asset is None:
+        raise HTTPException(status_code=404, detail=f"Not found: {path}")
+    return asset_response(request, asset, cache_control)
 
-@app.post("/execute", response_model=dict)
+def log_result(user_command: str, payload: ExecuteResponse, elapsed_ms: float):
+    """One structured summary line per response; the body itself only for a sample, truncated"""
+    results = payload.execution_results
+    summary = {
+        'request': user_command[:LOG_FIELD_CHARS],
+        'commands': len(results),
+        'failed': sum(1 for r in results if not r.success),
+        'pending': len(payload.pending_confirmation_commands),
+        'elapsed_ms': round(elapsed_ms, 1)
+    }
+    for key in ('plan_id', 'stop_reason', 'error'):
+        value = getattr(payload, key)
+        if value is not None:
+            summary[key] = str(value)[:LOG_FIELD_CHARS]
+    log_event(logger, 'execute', **summary)
+    # Decided before serializing, so unsampled responses cost nothing here
+    sampled = random.random() < LOG_DETAIL_SAMPLE_RATE
+    if sampled or logger.isEnabledFor(logging.DEBUG):
+        detail = payload.model_dump_json(exclude_none=True)
+        if len(detail) > LOG_DETAIL_CHARS:
+            detail = detail[:LOG_DETAIL_CHARS] + f"... ({len(detail)} chars)"
+        log_event(logger, 'execute_detail', level=logging.INFO if sampled else logging.DEBUG, body=detail)
+
+@app.post("/execute", response_model=ExecuteResponse, response_model_exclude_none=True)
 async def execute_command(request: CommandRequest):
     """
     Endpoint to execute OS commands.
     """
     user_command = request.command
     confirmed_cmds = request.confirmed_commands
-    logger.info(f"Received command from frontend: {user_command}")
-    logger.info(f"Confirmed commands: {confirmed_cmds}")
-
+    log_event(logger, 'request', request=user_command[:LOG_FIELD_CHARS],
+              confirmed=len(confirmed_cmds or []), plan_id=request.plan_id)
 
+    started = time.monotonic()
     try:
         # Pass the confirmed_commands to the agent's process_request method
-        result = await os_agent.process_request(user_command, confirmed_commands=confirmed_cmds)
-        logger.info(f"OSAgent processing complete. Result: {result}")
-        return result
+        result = await os_agent.process_request(user_command, confirmed_commands=confirmed_cmds,
+                                                plan_id=request.plan_id, iterative=request.iterative,
+                                                max_steps=request.max_steps)
+        payload = ExecuteResponse.model_validate(result)
+        log_result(user_command, payload, (time.monotonic() - started) * 1000)
+        # Serialized once, by pydantic-core, straight to bytes
+        body = payload.model_dump_json(include=set(request.fields) if request.fields else None, exclude_none=True)
+        return Response(content=body, media_type='application/json')
     except Exception as e:
-        logger.error(f"Error processing command '{user_command}': {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
\ No newline at end of file
+        logger.error("Error processing command '%s': %s", user_command, e, exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
+
+@app.post("/execute/batch")
+async def execute_batch(request: BatchRequest):
+    """
+    Plan and run many requests at once. Streams one JSON line per request as it
+    finishes ({"index": i, ...same fields as /execute}), followed by a summary line.
+    """
+    items = [item.model_dump() for item in request.requests]
+    logger.info("Received batch of %s requests", len(items))
+
+    async def stream():
+        completed = failed = pending = 0
+        async for result in os_agent.batch_runner.run(items):
+            completed += 1
+            if result.get('error') or any(not r.get('success') for r in result.get('execution_results', [])):
+                failed += 1
+            if result.get('pending_confirmation_commands'):
+                pending += 1
+            yield ExecuteResponse.model_validate(result).model_dump_json(exclude_none=True) + "\n"
+        yield json.dumps({'summary': {'requests': completed, 'failed': failed,
+                                      'pending_confirmation': pending}}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.post("/plans/{plan_id}/cancel", response_model=dict)
+async def cancel_plan(plan_id: str):
+    """
+    Discard a plan that was waiting for confirmation.
+    """
+    result = os_agent.cancel_plan(plan_id)
+    if not result['success']:
+        raise HTTPException(status_code=404, detail=result['error'])
+    return result
+
+@app.get("/status")
+async def system_status(request: Request):
+    """
+    CPU, memory, disk and network status from the background sampler (no LLM call).
+    """
+    return conditional_json(request, os_agent.status_snapshot())
+
+@app.get("/processes")
+async def processes(request: Request, filter_name: Optional[str] = None, sort_by: str = 'cpu',
+                    limit: int = Query(20, ge=1, le=1000), user: Optional[str] = None,
+                    cgroup: Optional[str] = None):
+    """
+    Top processes from the latest sample, sorted by cpu, memory or io.
+    """
+    if sort_by not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort_by must be one of: {', '.join(SORT_KEYS)}")
+    return conditional_json(request, {'processes': os_agent.list_processes(
+        filter_name=filter_name, sort_by=sort_by, limit=limit, user=user, cgroup=cgroup)})
+
+@app.get("/info")
+async def system_info(request: Request):
+    """
+    Static information about the host the agent runs on.
+    """
+    return conditional_json(request, os_agent.system_info)
+
+@app.get("/memory/stats")
+async def memory_stats(request: Request):
+    """
+    Counts and retention metrics of the agent's memory store.
+    """
+    return conditional_json(request, await asyncio.to_thread(os_agent.get_memory_stats))
+
+@app.post("/memory/cleanup", response_model=dict)
+async def cleanup_memory(days: int = Query(30, ge=0)):
+    """
+    Remove memory data older than the given number of days.
+    """
+    stats = await asyncio.to_thread(os_agent.memory.cleanup_old_data, days)
+    if 'error' in stats:
+        raise HTTPException(status_code=500, detail=stats['error'])
+    return {'days_kept': days, **stats}
+
+@app.websocket("/ws")
+async def live_updates(websocket: WebSocket):
+    """
+    Live dashboard feed. Send {"op": "subscribe" | "unsubscribe", "channels": [...]}
+    (channels: cpu, memory, disk, network, processes); snapshots and deltas are pushed back.
+    """
+    await websocket.accept()
+    viewer = live_feed.join()
+
+    async def receive():
+        while True:
+            message = await websocket.receive_json()
+            channels = message.get('channels') or list(CHANNELS)
+            if message.get('op') == 'subscribe':
+                live_feed.subscribe(viewer, channels)
+            elif message.get('op') == 'unsubscribe':
+                live_feed.unsubscribe(viewer, channels)
+
+    receiver = asyncio.create_task(receive())
+    try:
+        while not receiver.done():
+            woken = asyncio.create_task(viewer.wakeup.wait())
+            await asyncio.wait({receiver, woken}, return_when=asyncio.FIRST_COMPLETED)
+            woken.cancel()
+            viewer.wakeup.clear()
+            # A slow viewer is only ever sent the latest version, never a backlog
+            for message in live_feed.pending_messages(viewer):
+                await websocket.send_text(message)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        receiver.cancel()
+        live_feed.leave(viewer)
+
+@app.get("/hosts", response_model=dict)
+async def list_hosts():
+    """
+    Reachability and system status of the remote worker hosts.
+    """
+    return await asyncio.to_thread(os_agent.get_hosts)
+
+@app.get("/outputs/{output_id}", response_model=dict)
+async def read_output(output_id: str, offset: int = 0, limit: int = 65536):
+    """
+    Page through the full output of a command whose response was truncated.
+    """
+    try:
+        return os_agent.read_output(output_id, offset=offset, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/transfers", response_model=dict)
+async def list_transfers():
+    """
+    Progress of recent copy/move transfers and interrupted ones that can be resumed.
+    """
+    return os_agent.get_transfers()
+
+@app.get("/transfers/{transfer_id}", response_model=dict)
+async def get_transfer(transfer_id: str):
+    """
+    Progress of one copy/move transfer.
+    """
+    status = os_agent.get_transfers(transfer_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown transfer: {transfer_id}")
+    return status
+
+@app.get("/jobs", response_model=dict)
+async def list_jobs(status: Optional[str] = None, limit: int = Query(50, ge=1, le=500)):
+    """
+    Background jobs, newest first, optionally only those with the given status.
+    """
+    jobs = await asyncio.to_thread(os_agent.jobs.list, status, limit)
+    return {'jobs': jobs, **os_agent.jobs.stats()}
+
+def _job_or_404(job_id: str):
+    job = os_agent.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}", response_model=dict)
+async def get_job(job_id: str):
+    """
+    Status, exit code and resource usage of one background job.
+    """
+    return _job_or_404(job_id).as_dict()
+
+@app.get("/jobs/{job_id}/log", response_model=dict)
+async def read_job_log(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(65536, ge=1)):
+    """
+    Page through a background job's combined output.
+    """
+    page = await asyncio.to_thread(os_agent.jobs.read_log, job_id, offset, limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return page
+
+@app.get("/jobs/{job_id}/attach")
+async def attach_job(job_id: str, offset: int = Query(0, ge=0)):
+    """
+    Stream a background job's output from offset as it is written, until the job finishes.
+    """
+    _job_or_404(job_id)
+    return StreamingResponse(os_agent.jobs.follow(job_id, offset), media_type="text/plain; charset=utf-8")
+
+@app.post("/jobs/{job_id}/cancel", response_model=dict)
+async def cancel_job(job_id: str):
+    """
+    Cancel a queued background job or terminate a running one.
+    """
+    _job_or_404(job_id)
+    return os_agent.jobs.cancel(job_id).as_dict()
@@ -0,0 +1,183 @@
+"""
+Batch execution of many requests for scripted and fleet use.
+Requests are planned together: each chunk of requests shares one planner call
+(one system prompt and memory context instead of one per request), and chunks
+are planned concurrently. Each request's commands start as soon as its chunk
+has been planned, with a bound on how many requests execute at once, and
+results are yielded per request in completion order.
+
+Requests whose plan contains a command needing confirmation are not run; their
+plan is stored and can be resumed through /execute with the returned plan ID.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from plan_store import PendingPlan
+
+DEFAULT_CHUNK_SIZE = 8
+DEFAULT_PLAN_CONCURRENCY = 4
+DEFAULT_EXEC_CONCURRENCY = 4
+
+
+class BatchRunner:
+    """Plans requests in shared LLM calls and runs them with bounded concurrency"""
+
+    def __init__(self, agent, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 plan_concurrency: int = DEFAULT_PLAN_CONCURRENCY,
+                 exec_concurrency: int = DEFAULT_EXEC_CONCURRENCY):
+        self.agent = agent
+        self.chunk_size = max(1, chunk_size)
+        self.plan_concurrency = max(1, plan_concurrency)
+        self.exec_concurrency = max(1, exec_concurrency)
+
+    async def run(self, items: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Yield one result per item ({'index': i, ...}) as each finishes"""
+        results: asyncio.Queue = asyncio.Queue()
+        plan_slots = asyncio.Semaphore(self.plan_concurrency)
+        exec_slots = asyncio.Semaphore(self.exec_concurrency)
+        # One snapshot of system state for every conversation recorded by this batch
+        system_state = asyncio.create_task(asyncio.to_thread(self.agent.get_system_status))
+
+        async def execute(index: int, item: Dict[str, Any], gemini_response: Dict[str, Any]):
+            async with exec_slots:
+                try:
+                    result = await asyncio.to_thread(self._execute_item, item, gemini_response)
+                except Exception as e:
+                    result = self._error(item, e)
+            result['index'] = index
+            await results.put(result)
+            if 'error' not in result and not result['pending_confirmation_commands']:
+                # Recorded after the result is out, so memory writes never delay it
+                await asyncio.to_thread(self.agent._record_conversation, item['command'],
+                                        gemini_response, result['execution_results'], await system_state)
+
+        async def plan_chunk(start: int, chunk: List[Dict[str, Any]]):
+            async with plan_slots:
+                try:
+                    plans = await asyncio.to_thread(self._plan_chunk, [item['command'] for item in chunk])
+                except Exception as e:
+                    self.agent.logger.error("Error planning batch chunk at %s: %s", start, e)
+                    for offset, item in enumerate(chunk):
+                        result = self._error(item, e)
+                        result['index'] = start + offset
+                        await results.put(result)
+                    return
+            await asyncio.gather(*(execute(start + offset, item, plan)
+                                   for offset, (item, plan) in enumerate(zip(chunk, plans))))
+
+        tasks = [asyncio.create_task(plan_chunk(start, items[start:start + self.chunk_size]))
+                 for start in range(0, len(items), self.chunk_size)]
+        finished = False
+        try:
+            for _ in range(len(items)):
+                yield await results.get()
+            finished = True
+        finally:
+            if not finished:
+                # Client went away: stop planning and starting requests
+                for task in tasks + [system_state]:
+                    task.cancel()
+            await asyncio.gather(*tasks, system_state, return_exceptions=True)
+
+    # --- Planning ----------------------------------------------------------
+
+    def _plan_chunk(self, requests: List[str]) -> List[Dict[str, Any]]:
+        """One planner call for several requests; requests missing from the answer are planned alone"""
+        plans = self._call_planner(requests)
+        for index, plan in enumerate(plans):
+            if plan is None:
+                self.agent.logger.info("Batch planner skipped request %s; planning it separately.", index)
+                plans[index] = self._call_planner([requests[index]])[0] or {
+                    'action_type': 'info', 'commands': [],
+                    'user_message': "I couldn't plan this request.", 'learned_info': ''
+                }
+        return plans
+
+    def _call_planner(self, requests: List[str]) -> List[Optional[Dict[str, Any]]]:
+        numbered = '\n'.join(f"[{i}] {request}" for i, request in enumerate(requests))
+        prompt = f"""
+{self.agent._get_context_prompt(' '.join(requests))}
+
+The following {len(requests)} requests are independent of each other. Plan each one separately,
+following the rules and response structure above for every request.
+
+Requests:
+{numbered}
+
+Respond with JSON of the form {{"plans": [{{"index": 0, "action_type": "...", "commands": [...], "user_message": "...", "learned_info": "..."}}, ...]}},
+with exactly one entry per request and "index" matching the request number.
+"""
+        response = self.agent.model.generate_content(prompt)
+        parsed = self.agent._parse_gemini_response(response.text)
+
+        plans: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+        entries = parsed.get('plans')
+        if isinstance(entries, list):
+            for position, entry in enumerate(entries):
+                if not isinstance(entry, dict):
+                    continue
+                index = entry.get('index', position)
+                if isinstance(index, int) and 0 <= index < len(requests) and plans[index] is None:
+                    plans[index] = entry
+        elif len(requests) == 1:
+            # A single request may come back in the plain one-plan format
+            plans[0] = parsed
+        return plans
+
+    # --- Execution ---------------------------------------------------------
+
+    def _execute_item(self, item: Dict[str, Any], gemini_response: Dict[str, Any]) -> Dict[str, Any]:
+        agent = self.agent
+        user_request = item['command']
+        confirmed_commands = item.get('confirmed_commands') or []
+        result = {
+            'request': user_request,
+            'gemini_response': gemini_response,
+            'timestamp': datetime.now().isoformat(),
+            'system': agent.system_info['system'],
+            'execution_results': [],
+            'pending_confirmation_commands': []
+        }
+
+        if gemini_response.get('learned_info'):
+            agent.memory.store_system_fact(
+                f"learned_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                gemini_response['learned_info']
+            )
+
+        steps = agent._plan_steps(gemini_response)
+        pending = [s.command for s in steps if s.requires_confirmation and s.command not in confirmed_commands]
+        if pending:
+            # Nothing runs unattended for a plan that needs approval; it is resumed by plan ID
+            plan = PendingPlan(
+                plan_id=agent.plans.new_id(),
+                user_request=user_request,
+                gemini_response=gemini_response,
+                steps=steps
+            )
+            agent._store_plan(plan)
+            result['plan_id'] = plan.plan_id
+            result['pending_confirmation_commands'] = pending
+            return result
+
+        for step in steps:
+            # Separate processes rather than the session shell, which would serialize the batch
+            try:
+                result['execution_results'].append(
+                    agent._run_step(step, isolated=True, after_job=agent._last_job(result['execution_results'])))
+            except Exception as e:
+                agent.logger.error("Error running batch step '%s': %s", step.command, e)
+                result['execution_results'].append({'command': step.command, 'success': False, 'output_message': str(e)})
+        return result
+
+    @staticmethod
+    def _error(item: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+        return {
+            'error': str(error),
+            'request': item['command'],
+            'timestamp': datetime.now().isoformat(),
+            'user_message': f"An internal error occurred: {error}. Please try again.",
+            'gemini_response': {}
+        }
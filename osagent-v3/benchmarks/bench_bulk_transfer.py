@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Throughput of the bulk transfer engine compared with shutil.copytree on a
+generated tree of many small files plus a few large ones.
+
+Usage: python benchmarks/bench_bulk_transfer.py [--small 5000] [--large 4] [--large-mb 256] [--dir /tmp]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bulk_transfer import TransferManager  # noqa: E402
+
+
+def build_tree(root: Path, small: int, large: int, large_mb: int):
+    for i in range(small):
+        directory = root / f"d{i % 100:03d}"
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"f{i}.txt").write_bytes(os.urandom(4096))
+    block = os.urandom(1024 * 1024)
+    for i in range(large):
+        with open(root / f"large{i}.bin", 'wb') as f:
+            for _ in range(large_mb):
+                f.write(block)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--small', type=int, default=5000)
+    parser.add_argument('--large', type=int, default=4)
+    parser.add_argument('--large-mb', type=int, default=256)
+    parser.add_argument('--dir', default=None, help='scratch directory (same filesystem for both runs)')
+    args = parser.parse_args()
+
+    scratch = Path(tempfile.mkdtemp(dir=args.dir))
+    try:
+        source = scratch / 'source'
+        build_tree(source, args.small, args.large, args.large_mb)
+        total = args.small * 4096 + args.large * args.large_mb * 1024 * 1024
+        os.sync()
+
+        start = time.perf_counter()
+        shutil.copytree(source, scratch / 'copytree', symlinks=True)
+        copytree_s = time.perf_counter() - start
+
+        manager = TransferManager(scratch / 'checkpoints')
+        start = time.perf_counter()
+        result = manager.transfer(str(source), str(scratch / 'bulk'))
+        bulk_s = time.perf_counter() - start
+
+        print(f"tree: {args.small} x 4 KiB + {args.large} x {args.large_mb} MiB = {total / 2**20:.0f} MiB")
+        print(f"{'shutil.copytree':<18}{copytree_s:>8.2f} s {total / copytree_s / 2**20:>9.1f} MiB/s")
+        print(f"{'bulk_transfer':<18}{bulk_s:>8.2f} s {total / bulk_s / 2**20:>9.1f} MiB/s  "
+              f"methods={result['methods']}")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Per-request cost of logging on the /execute path: logging disabled, a
+synchronous basicConfig-style handler (records formatted and written on the
+caller's thread) and the queue-based pipeline from log_pipeline. Each
+simulated request logs what the endpoint does: the request, every command
+started and finished, and the response summary. --sink-delay-ms makes the log
+destination slow (a busy disk or a pipe to a collector) to show that the
+pipeline keeps the caller off it.
+
+Usage: python benchmarks/bench_logging.py [--requests 1000] [--commands 3] [--sink-delay-ms 0]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import log_pipeline  # noqa: E402
+from log_pipeline import TextFormatter, configure_logging, log_event  # noqa: E402
+
+logger = logging.getLogger('bench')
+
+
+class SlowFile:
+    """File wrapper whose writes take at least delay seconds"""
+
+    def __init__(self, path: str, delay: float):
+        self.file = open(path, 'a', encoding='utf-8')
+        self.delay = delay
+
+    def write(self, text: str):
+        if self.delay:
+            time.sleep(self.delay)
+        return self.file.write(text)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def request(i: int, commands: int):
+    log_event(logger, 'request', request=f"ls -la /var/log/app{i}", confirmed=0, plan_id=None)
+    for n in range(commands):
+        logger.info("Executing command: %s", f"ls -la /var/log/app{i}/{n}")
+        log_event(logger, 'command', command=f"ls -la /var/log/app{i}/{n}", returncode=0,
+                  output_bytes=1024, elapsed_ms=3.2)
+    log_event(logger, 'execute', request=f"ls -la /var/log/app{i}", commands=commands, failed=0,
+              pending=0, elapsed_ms=12.5)
+
+
+def measure(label: str, request_fn, requests: int, commands: int) -> float:
+    started = time.perf_counter()
+    for i in range(requests):
+        request_fn(i, commands)
+    elapsed = time.perf_counter() - started
+    per_request = elapsed / requests * 1e6
+    print(f"{label:<28} {per_request:9.1f} us/request  ({elapsed:.2f}s total)")
+    return per_request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=1000, help='kept under the queue size, so nothing is dropped')
+    parser.add_argument('--commands', type=int, default=3, help='commands executed per request')
+    parser.add_argument('--sink-delay-ms', type=float, default=0.0, help='added latency per log write')
+    args = parser.parse_args()
+
+    root = logging.getLogger()
+    delay = args.sink_delay_ms / 1000
+    with tempfile.TemporaryDirectory() as scratch:
+        root.setLevel(logging.CRITICAL)
+        baseline = measure('logging off', request, args.requests, args.commands)
+
+        sync_sink = SlowFile(os.path.join(scratch, 'sync.log'), delay)
+        handler = logging.StreamHandler(sync_sink)
+        handler.setFormatter(TextFormatter())
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+        sync = measure('synchronous handler', request, args.requests, args.commands)
+        root.removeHandler(handler)
+        sync_sink.close()
+
+        for fmt in ('text', 'json'):
+            sink = SlowFile(os.path.join(scratch, f'{fmt}.log'), delay)
+            log_pipeline._configured = None  # configure_logging is once per process otherwise
+            pipeline = configure_logging(level='INFO', fmt=fmt, stream=sink, sample='')
+            queued = measure(f'pipeline ({fmt})', request, args.requests, args.commands)
+            started = time.perf_counter()
+            pipeline.stop()
+            drained = time.perf_counter() - started
+            print(f"{'':<28} drained in {drained:.2f}s, {pipeline.handler.dropped} records dropped")
+            sink.close()
+            print(f"{'':<28} {queued - baseline:.1f} us/request over logging off "
+                  f"(synchronous: {sync - baseline:.1f})")
+
+
+if __name__ == "__main__":
+    main()
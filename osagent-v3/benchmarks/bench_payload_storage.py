@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Size/throughput comparison of legacy JSON conversation rows against the
+compressed, deduplicated payload format.
+
+Usage: python benchmarks/bench_payload_storage.py [--rows 5000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from payload_store import PayloadStore  # noqa: E402
+
+SCHEMA = '''
+    CREATE TABLE conversations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT,
+        timestamp TEXT,
+        user_request TEXT,
+        agent_response TEXT,
+        execution_results TEXT,
+        system_state TEXT
+    )
+'''
+
+REQUESTS = [
+    ("list files in home directory", "ls -la ~"),
+    ("show disk usage", "df -h"),
+    ("what is my kernel", "uname -a"),
+    ("show memory", "free -m"),
+    ("find log files", "find /var/log -name '*.log'"),
+]
+
+
+def make_row(rng: random.Random, i: int):
+    request, command = rng.choice(REQUESTS)
+    agent_response = {
+        'action_type': 'command',
+        'commands': [{'command': command, 'requires_confirmation': False}],
+        'user_message': f"Running {command.split()[0]} for you.",
+        'learned_info': ''
+    }
+    # Outputs of the same command are usually identical or nearly so
+    output = '\n'.join(f"line {n} of {command}" for n in range(rng.choice([20, 200, 2000])))
+    execution_results = [{'command': command, 'success': True, 'output_message': output}]
+    system_state = {
+        'timestamp': f"2025-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}",
+        'cpu_usage': round(rng.uniform(0, 100), 1),
+        'memory': {'total': 16 * 1024 ** 3, 'available': rng.randint(1, 15) * 1024 ** 3,
+                   'used': rng.randint(1, 15) * 1024 ** 3, 'percentage': round(rng.uniform(0, 100), 1)},
+        'disk': {'total': 512 * 1024 ** 3, 'used': 200 * 1024 ** 3, 'free': 312 * 1024 ** 3, 'percentage': 39.0},
+        'processes': rng.randint(200, 400),
+        'network_interfaces': [{'interface': f"eth{n}", 'ip': f"10.0.0.{n}"} for n in range(4)],
+        'uptime': 1000.0 + i
+    }
+    return request, agent_response, execution_results, system_state
+
+
+def run(rows: int, encoded: bool):
+    rng = random.Random(42)
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    store = PayloadStore()
+
+    try:
+        conn = sqlite3.connect(path)
+        conn.execute(SCHEMA)
+        PayloadStore.init_schema(conn)
+
+        start = time.perf_counter()
+        for i in range(rows):
+            request, response, results, state = make_row(rng, i)
+            if encoded:
+                values = (store.encode(conn, response), store.encode_list(conn, results),
+                          store.encode_system_state(conn, state))
+            else:
+                values = (json.dumps(response), json.dumps(results), json.dumps(state))
+            conn.execute('''
+                INSERT INTO conversations
+                (session_id, timestamp, user_request, agent_response, execution_results, system_state)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', ('bench', str(i), request) + values)
+            if i % 100 == 99:
+                conn.commit()
+        conn.commit()
+        write_s = time.perf_counter() - start
+
+        # Read path: full decode of every payload column
+        store = PayloadStore()
+        start = time.perf_counter()
+        for response, results, state in conn.execute(
+                'SELECT agent_response, execution_results, system_state FROM conversations'):
+            store.decode(conn, response)
+            store.decode(conn, results)
+            store.decode(conn, state)
+        read_s = time.perf_counter() - start
+
+        conn.execute('VACUUM')
+        conn.close()
+        size = os.path.getsize(path)
+    finally:
+        os.unlink(path)
+
+    return size, rows / write_s, rows / read_s
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"codec: {PayloadStore().codec}, rows: {args.rows}")
+    print(f"{'format':<10}{'db size':>14}{'writes/s':>12}{'reads/s':>12}")
+    results = {}
+    for name, encoded in (('legacy', False), ('blob', True)):
+        size, writes, reads = run(args.rows, encoded)
+        results[name] = size
+        print(f"{name:<10}{size / 1024 ** 2:>11.2f} MB{writes:>12.0f}{reads:>12.0f}")
+    print(f"size ratio: {results['legacy'] / results['blob']:.1f}x smaller")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Latency of short commands through the persistent shell pool compared with a
+fresh `subprocess.run(shell=True)` per command.
+
+Usage: python benchmarks/bench_shell_pool.py [--runs 200]
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from output_capture import OutputStore  # noqa: E402
+from shell_pool import ShellPool  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    store = OutputStore(Path(tempfile.mkdtemp()))
+    pool = ShellPool()
+    print(f"{'command':<12}{'fresh shell':>14}{'shell pool':>14}")
+    for command in ('pwd', 'ls', 'uname -a'):
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            subprocess.run(command, shell=True, capture_output=True, text=True, timeout=60)
+        fresh_ms = (time.perf_counter() - start) / args.runs * 1000
+
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            out, err = store.new_capture(), store.new_capture()
+            pool.run('bench', command, out, err, timeout=60)
+            out.finish()
+            err.finish()
+        pooled_ms = (time.perf_counter() - start) / args.runs * 1000
+        print(f"{command:<12}{fresh_ms:>11.2f} ms{pooled_ms:>11.2f} ms")
+    pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,451 @@
+"""
+Bulk copy/move engine for manage_file_operations.
+Files are copied in parallel on a thread pool using the cheapest mechanism
+the platform offers: a reflink (FICLONE) on copy-on-write filesystems, then
+os.copy_file_range, then os.sendfile, then a plain buffered copy. Progress is
+checkpointed under agent_memory/transfers so an interrupted transfer resumes
+where it stopped, including part-way through large files, and progress
+events are reported to a callback while it runs.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FICLONE = 0x40049409
+COPY_CHUNK_BYTES = 64 * 1024 * 1024
+BUFFER_BYTES = 1024 * 1024
+# Small files are handed to the pool in batches so per-task overhead stays low
+BATCH_BYTES = 8 * 1024 * 1024
+BATCH_FILES = 256
+DEFAULT_WORKERS = min(16, (os.cpu_count() or 4) * 2)
+CHECKPOINT_INTERVAL_SECONDS = 1.0
+PROGRESS_INTERVAL_SECONDS = 0.5
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+
+def _reflink(src_fd: int, dst_fd: int) -> bool:
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return True
+    except OSError:
+        return False
+
+
+class CopyMethods:
+    """Which mechanisms still look usable for a transfer; one that fails once is not retried"""
+
+    def __init__(self):
+        self.reflink = fcntl is not None
+        self.copy_file_range = hasattr(os, 'copy_file_range')
+        self.sendfile = hasattr(os, 'sendfile')
+
+
+def copy_file(src: str, dst: str, size: Optional[int] = None, offset: int = 0,
+              on_bytes: Optional[Callable[[int], None]] = None,
+              methods: Optional[CopyMethods] = None) -> str:
+    """Copy one file's data (and metadata) starting at offset; returns the method used"""
+    methods = methods or CopyMethods()
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        # Opening dst with O_TRUNC would empty the source
+        raise shutil.SameFileError(f"{src!r} and {dst!r} are the same file")
+    _check_regular(src, os.stat(src))
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        if size is None:
+            size = os.fstat(src_fd).st_size
+        flags = os.O_WRONLY | os.O_CREAT | (0 if offset else os.O_TRUNC)
+        dst_fd = os.open(dst, flags, 0o666)
+        try:
+            method = _copy_data(src_fd, dst_fd, size, offset, on_bytes, methods)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    shutil.copystat(src, dst)
+    return method
+
+
+def _check_regular(path: str, st: os.stat_result):
+    """Refuse what is not a regular file, as shutil.copytree does: opening a FIFO blocks until
+    a writer appears, and copying a device node would copy the device's contents"""
+    if not stat.S_ISREG(st.st_mode):
+        kind = 'named pipe' if stat.S_ISFIFO(st.st_mode) else 'socket' if stat.S_ISSOCK(st.st_mode) \
+            else 'device' if stat.S_ISCHR(st.st_mode) or stat.S_ISBLK(st.st_mode) else 'special file'
+        raise shutil.SpecialFileError(f"{path!r} is a {kind}")
+
+
+def _copy_data(src_fd: int, dst_fd: int, size: int, offset: int,
+               on_bytes: Optional[Callable[[int], None]], methods: CopyMethods) -> str:
+    if offset:
+        os.ftruncate(dst_fd, offset)
+    elif size and methods.reflink:
+        if _reflink(src_fd, dst_fd):
+            if on_bytes:
+                on_bytes(size)
+            return 'reflink'
+        methods.reflink = False
+
+    position = offset
+    for name in ('copy_file_range', 'sendfile'):
+        if not getattr(methods, name):
+            continue
+        try:
+            while position < size:
+                count = min(COPY_CHUNK_BYTES, size - position)
+                if name == 'copy_file_range':
+                    copied = os.copy_file_range(src_fd, dst_fd, count, position, position)
+                else:
+                    os.lseek(dst_fd, position, os.SEEK_SET)
+                    copied = os.sendfile(dst_fd, src_fd, position, count)
+                if copied == 0:
+                    break
+                position += copied
+                if on_bytes:
+                    on_bytes(copied)
+            return name
+        except OSError:
+            # Not supported between these filesystems; stop trying it for this transfer
+            setattr(methods, name, False)
+
+    os.lseek(src_fd, position, os.SEEK_SET)
+    os.lseek(dst_fd, position, os.SEEK_SET)
+    while True:
+        chunk = os.read(src_fd, BUFFER_BYTES)
+        if not chunk:
+            break
+        while chunk:
+            written = os.write(dst_fd, chunk)
+            if on_bytes:
+                on_bytes(written)
+            chunk = chunk[written:]
+    return 'buffered'
+
+
+class Transfer:
+    """One bulk copy or move of a file or tree, resumable through a checkpoint file"""
+
+    def __init__(self, source: str, destination: str, checkpoint_dir: Path, move: bool = False,
+                 workers: int = DEFAULT_WORKERS, progress: Optional[ProgressCallback] = None):
+        self.source = os.path.abspath(source)
+        self.destination = os.path.abspath(destination)
+        self.move = move
+        self.workers = workers
+        self.progress = progress
+
+        key = f"{'move' if move else 'copy'}:{self.source}->{self.destination}"
+        self.transfer_id = hashlib.sha256(key.encode()).hexdigest()[:16]
+        self.checkpoint_path = Path(checkpoint_dir) / f"{self.transfer_id}.json"
+
+        self.total_files = 0
+        self.total_bytes = 0
+        self.files_done = 0
+        self.bytes_done = 0
+        self.methods: Dict[str, int] = {}
+        self.errors: List[Dict[str, str]] = []
+        self.started = 0.0
+        self.state = 'pending'
+
+        # relative path -> [size, mtime] of files fully copied, and relative path ->
+        # source mtime of files whose copy was started but not finished
+        self._completed: Dict[str, List[float]] = {}
+        self._partial: Dict[str, float] = {}
+        self._methods = CopyMethods()
+        self._lock = threading.Lock()
+        self._last_checkpoint = 0.0
+        self._last_progress = 0.0
+
+    # --- Checkpointing -----------------------------------------------------
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                data = json.load(f)
+            if data.get('source') == self.source and data.get('destination') == self.destination:
+                self._completed = data.get('completed', {})
+                self._partial = data.get('partial', {})
+        except (OSError, json.JSONDecodeError):
+            pass
+
+    def _write_checkpoint(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_checkpoint < CHECKPOINT_INTERVAL_SECONDS:
+            return
+        self._last_checkpoint = now
+        with self._lock:
+            data = {'source': self.source, 'destination': self.destination, 'move': self.move,
+                    'completed': dict(self._completed), 'partial': dict(self._partial)}
+        temp = self.checkpoint_path.with_suffix('.tmp')
+        with open(temp, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp, self.checkpoint_path)
+
+    # --- Progress ----------------------------------------------------------
+
+    def status(self) -> Dict[str, Any]:
+        elapsed = max(1e-6, time.monotonic() - self.started) if self.started else 0.0
+        return {
+            'transfer_id': self.transfer_id,
+            'operation': 'move' if self.move else 'copy',
+            'source': self.source,
+            'destination': self.destination,
+            'state': self.state,
+            'files_done': self.files_done,
+            'total_files': self.total_files,
+            'bytes_done': self.bytes_done,
+            'total_bytes': self.total_bytes,
+            'bytes_per_second': round(self.bytes_done / elapsed) if elapsed else 0,
+            'methods': dict(self.methods),
+            'errors': self.errors[:50]
+        }
+
+    def _emit(self, event: str, force: bool = False, **extra):
+        if self.progress is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_progress < PROGRESS_INTERVAL_SECONDS:
+            return
+        self._last_progress = now
+        try:
+            self.progress({'event': event, **self.status(), **extra})
+        except Exception:
+            pass
+
+    def _add_bytes(self, count: int):
+        with self._lock:
+            self.bytes_done += count
+        self._emit('progress')
+
+    # --- Planning ----------------------------------------------------------
+
+    def _path_conflict(self) -> Optional[str]:
+        """Why source and destination cannot be used together, if they cannot"""
+        try:
+            same = os.path.lexists(self.destination) and os.path.samefile(self.source, self.destination)
+        except OSError:
+            same = False
+        source_real = os.path.realpath(self.source)
+        destination_real = os.path.realpath(self.destination)
+        if same or source_real == destination_real:
+            return f"{self.source} and {self.destination} are the same file"
+        if os.path.isdir(self.source) and destination_real.startswith(source_real.rstrip(os.sep) + os.sep):
+            return f"Cannot {'move' if self.move else 'copy'} {self.source} into itself ({self.destination})"
+        return None
+
+    def _plan(self) -> Tuple[List[str], List[Tuple[str, int, float]], List[str]]:
+        """(directories, files as (relative path, size, mtime), symlinks) below the source; special
+        files are reported as errors and left out"""
+        directories, files, links = [], [], []
+        if not os.path.isdir(self.source):
+            st = os.stat(self.source)
+            _check_regular(self.source, st)
+            return [], [('', st.st_size, st.st_mtime)], []
+        stack = ['']
+        while stack:
+            relative = stack.pop()
+            directories.append(relative)
+            with os.scandir(os.path.join(self.source, relative)) as it:
+                for entry in it:
+                    rel = os.path.join(relative, entry.name)
+                    if entry.is_symlink():
+                        links.append(rel)
+                    elif entry.is_dir():
+                        stack.append(rel)
+                    else:
+                        st = entry.stat()
+                        try:
+                            _check_regular(entry.path, st)
+                        except shutil.SpecialFileError as e:
+                            self.errors.append({'path': entry.path, 'error': str(e)})
+                            continue
+                        files.append((rel, st.st_size, st.st_mtime))
+        return directories, files, links
+
+    # --- Execution ---------------------------------------------------------
+
+    def _copy_one(self, item: Tuple[str, int, float]):
+        relative, size, mtime = item
+        src = os.path.join(self.source, relative) if relative else self.source
+        dst = os.path.join(self.destination, relative) if relative else self.destination
+
+        done = self._completed.get(relative)
+        if done and done[0] == size and done[1] == mtime and os.path.exists(dst) and os.path.getsize(dst) == size:
+            with self._lock:
+                self.files_done += 1
+                self.bytes_done += size
+            return
+
+        # A partial destination from an interrupted run of the same source file is continued
+        offset = 0
+        if self._partial.get(relative) == mtime and os.path.exists(dst):
+            offset = min(os.path.getsize(dst), size)
+            with self._lock:
+                self.bytes_done += offset
+
+        with self._lock:
+            self._partial[relative] = mtime
+        try:
+            method = copy_file(src, dst, size, offset, self._add_bytes, self._methods)
+        except OSError as e:
+            with self._lock:
+                self.errors.append({'path': src, 'error': str(e)})
+            return
+
+        with self._lock:
+            self._partial.pop(relative, None)
+            self._completed[relative] = [size, mtime]
+            self.files_done += 1
+            self.methods[method] = self.methods.get(method, 0) + 1
+        self._write_checkpoint()
+        self._emit('file_done', path=relative or os.path.basename(src))
+
+    def _copy_batch(self, batch: List[Tuple[str, int, float]]):
+        for item in batch:
+            self._copy_one(item)
+
+    @staticmethod
+    def _batches(files: List[Tuple[str, int, float]]) -> List[List[Tuple[str, int, float]]]:
+        """Large files on their own, largest first, then small files grouped together"""
+        files = sorted(files, key=lambda item: item[1], reverse=True)
+        batches: List[List[Tuple[str, int, float]]] = []
+        current: List[Tuple[str, int, float]] = []
+        current_bytes = 0
+        for item in files:
+            if item[1] >= BATCH_BYTES:
+                batches.append([item])
+                continue
+            current.append(item)
+            current_bytes += item[1]
+            if current_bytes >= BATCH_BYTES or len(current) >= BATCH_FILES:
+                batches.append(current)
+                current, current_bytes = [], 0
+        if current:
+            batches.append(current)
+        return batches
+
+    def run(self) -> Dict[str, Any]:
+        self.started = time.monotonic()
+        self.state = 'running'
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+
+        conflict = self._path_conflict()
+        if conflict:
+            # Copying onto itself would truncate the source, and a move would then delete it
+            self.state = 'failed'
+            return {'success': False, 'error': conflict, **self.status()}
+
+        # A move within one filesystem is a rename, no data copied
+        if self.move and not os.path.exists(self.destination):
+            try:
+                os.rename(self.source, self.destination)
+                self.state = 'completed'
+                self.methods['rename'] = 1
+                self._emit('complete', force=True)
+                return {'success': True, **self.status()}
+            except OSError:
+                pass  # cross-device: fall back to copy + delete
+
+        self._load_checkpoint()
+        try:
+            directories, files, links = self._plan()
+        except shutil.SpecialFileError as e:
+            self.state = 'failed'
+            return {'success': False, 'error': str(e), **self.status()}
+        self.total_files = len(files)
+        self.total_bytes = sum(size for _, size, _ in files)
+        self._emit('start', force=True)
+
+        for relative in directories:
+            os.makedirs(os.path.join(self.destination, relative), exist_ok=True)
+        for relative in links:
+            dst = os.path.join(self.destination, relative)
+            if os.path.lexists(dst):
+                os.unlink(dst)
+            os.symlink(os.readlink(os.path.join(self.source, relative)), dst)
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+                list(pool.map(self._copy_batch, self._batches(files)))
+        finally:
+            self._write_checkpoint(force=True)
+
+        for relative in directories:
+            try:
+                shutil.copystat(os.path.join(self.source, relative), os.path.join(self.destination, relative))
+            except OSError:
+                pass
+
+        if self.errors:
+            self.state = 'failed'
+            self._emit('complete', force=True)
+            return {'success': False, 'error': f"{len(self.errors)} files failed", **self.status()}
+
+        if self.move:
+            if os.path.isdir(self.source) and not os.path.islink(self.source):
+                shutil.rmtree(self.source)
+            else:
+                os.unlink(self.source)
+
+        self.state = 'completed'
+        self.checkpoint_path.unlink(missing_ok=True)
+        self._emit('complete', force=True)
+        return {'success': True, **self.status()}
+
+
+class TransferManager:
+    """Creates transfers and keeps the status of recent ones for progress queries"""
+
+    def __init__(self, checkpoint_dir: Path, workers: int = DEFAULT_WORKERS, keep: int = 50):
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self.keep = keep
+        self._transfers: Dict[str, Transfer] = {}
+        self._lock = threading.Lock()
+
+    def transfer(self, source: str, destination: str, move: bool = False,
+                 progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """Run a copy or move to completion (resuming any checkpoint) and return its final status"""
+        transfer = Transfer(source, destination, self.checkpoint_dir, move=move,
+                            workers=self.workers, progress=progress)
+        with self._lock:
+            self._transfers[transfer.transfer_id] = transfer
+            while len(self._transfers) > self.keep:
+                self._transfers.pop(next(iter(self._transfers)))
+        return transfer.run()
+
+    def status(self, transfer_id: Optional[str] = None) -> Any:
+        with self._lock:
+            if transfer_id is not None:
+                transfer = self._transfers.get(transfer_id)
+                return transfer.status() if transfer else None
+            return [t.status() for t in self._transfers.values()]
+
+    def pending_checkpoints(self) -> List[Dict[str, Any]]:
+        """Transfers interrupted before completion (e.g. by a restart) that can be resumed"""
+        pending = []
+        for path in self.checkpoint_dir.glob('*.json'):
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+                pending.append({'transfer_id': path.stem, 'source': data['source'],
+                                'destination': data['destination'], 'move': data.get('move', False),
+                                'files_completed': len(data.get('completed', {}))})
+            except (OSError, json.JSONDecodeError, KeyError):
+                continue
+        return pending
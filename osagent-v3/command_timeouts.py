@@ -0,0 +1,209 @@
+"""
+Adaptive per-command timeouts learned from command history.
+Each finished command's duration is recorded under a template (the program
+and its subcommand, e.g. "git clone" or "apt-get install"), keeping the most
+recent runs per template in the command_timings table. A command's budget is
+a high percentile of its template's past durations times a margin, and never
+less than its longest recent run with some slack, clamped to a floor and a
+ceiling; templates with too little history get the default. The longest run
+matters for commands that are usually quick but now and then slow: the
+percentile alone can drop those rare runs, and a command that prints nothing
+while it works gets no extension from the output rule below.
+
+While a command keeps producing output its deadline is pushed back (up to the
+ceiling), so a long install that is making progress completes while a silent,
+hung command fails as soon as its budget runs out. A run that times out is
+recorded with the time it was given, so a template that is consistently
+slower than its budget earns a longer one next time.
+"""
+
+import json
+import math
+import os
+import re
+import shlex
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Words that run another command rather than being the command
+_WRAPPERS = {'sudo', 'time', 'nice', 'nohup', 'env', 'exec', 'command', 'timeout', 'stdbuf'}
+_OPERATORS = {'|', '||', '&&', ';', '&'}
+_SUBCOMMAND_RE = re.compile(r'^[a-z][a-z0-9_-]*$')
+# Programs whose first argument names what they do; for anything else it is just an argument
+# ("echo hi", "ls downloads") and every command of the program shares one template
+_MULTI_COMMAND_TOOLS = {
+    'git', 'apt', 'apt-get', 'dnf', 'yum', 'zypper', 'brew', 'snap', 'flatpak', 'pip', 'pip3', 'conda',
+    'npm', 'yarn', 'pnpm', 'cargo', 'go', 'gem', 'composer', 'mvn', 'gradle', 'docker', 'podman',
+    'kubectl', 'helm', 'terraform', 'systemctl', 'aws', 'gcloud', 'az', 'ip', 'nmcli',
+}
+_ASSIGNMENT_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*=')
+
+
+@dataclass
+class TimeoutPolicy:
+    """How budgets are derived from past durations (all times in seconds)"""
+    default_seconds: float = 60.0
+    min_seconds: float = 5.0
+    max_seconds: float = 1800.0
+    percentile: float = 0.95
+    margin: float = 3.0
+    # The budget also covers the longest recent run times this, however rare such runs are
+    longest_margin: float = 1.5
+    min_samples: int = 5
+    max_samples: int = 100
+    max_templates: int = 2000
+    # Output within this long (never more than the budget itself) keeps a command alive
+    progress_window_seconds: float = 30.0
+
+
+def command_template(command: str) -> str:
+    """Program name plus subcommand, with arguments, paths and wrappers like sudo dropped"""
+    try:
+        tokens = shlex.split(command, posix=True)
+    except ValueError:
+        tokens = command.split()
+
+    words: List[str] = []
+    for token in tokens:
+        if token in _OPERATORS:
+            break
+        if not words:
+            if _ASSIGNMENT_RE.match(token) or token in _WRAPPERS or token.startswith('-'):
+                continue
+            words.append(os.path.basename(token) or token)
+            continue
+        if words[0] in _MULTI_COMMAND_TOOLS and not token.startswith('-') and _SUBCOMMAND_RE.match(token):
+            words.append(token)
+        break
+    return ' '.join(words) or command.strip()[:64]
+
+
+class Deadline:
+    """When a running command is given up on: its budget, pushed back while any of
+    its captures keeps receiving output, never beyond the hard limit"""
+
+    def __init__(self, budget: float, captures: Iterable[Any] = (), progress_window: float = 0.0,
+                 hard_limit: Optional[float] = None):
+        self.started = time.monotonic()
+        self.budget = budget
+        self.captures = [capture for capture in captures if capture is not None]
+        self.progress_window = min(progress_window, budget)
+        self.hard_limit = max(budget, hard_limit if hard_limit is not None else budget)
+
+    def restart(self):
+        """Start the clock now, e.g. once the command stops waiting for its turn and starts running"""
+        self.started = time.monotonic()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def expires_at(self) -> float:
+        expiry = self.started + self.budget
+        if self.progress_window:
+            active = [c.last_activity for c in self.captures if c.last_activity > self.started]
+            if active:
+                expiry = max(expiry, max(active) + self.progress_window)
+        return min(expiry, self.started + self.hard_limit)
+
+    def wait(self, waiter: Callable[[float], bool], poll: float = 1.0) -> bool:
+        """Call waiter(seconds) until it reports completion (True) or the deadline passes (False)"""
+        while True:
+            remaining = self.expires_at() - time.monotonic()
+            if remaining <= 0:
+                return False
+            if waiter(min(remaining, poll)):
+                return True
+
+
+class CommandTimings:
+    """Recent durations per command template, kept in memory and in the database"""
+
+    def __init__(self, db_path: Path, policy: Optional[TimeoutPolicy] = None):
+        self.db_path = db_path
+        self.policy = policy or TimeoutPolicy()
+        self._samples: Dict[str, List[float]] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def init_schema(conn: sqlite3.Connection):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS command_timings (
+                template TEXT PRIMARY KEY,
+                durations TEXT,
+                updated TEXT
+            )
+        ''')
+
+    def _load(self):
+        """Read every template's samples once, dropping the least recently used beyond the cap"""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                rows = conn.execute(
+                    'SELECT template, durations FROM command_timings ORDER BY updated DESC'
+                ).fetchall()
+                stale = [template for template, _ in rows[self.policy.max_templates:]]
+                if stale:
+                    conn.executemany('DELETE FROM command_timings WHERE template = ?', [(t,) for t in stale])
+                    conn.commit()
+        except sqlite3.Error:
+            return
+        for template, durations in rows[:self.policy.max_templates]:
+            try:
+                self._samples[template] = [float(d) for d in json.loads(durations)]
+            except (TypeError, ValueError):
+                continue
+
+    def budget(self, command: str) -> Tuple[float, int]:
+        """(timeout in seconds, number of past runs it was derived from)"""
+        policy = self.policy
+        with self._lock:
+            self._load()
+            samples = sorted(self._samples.get(command_template(command), ()))
+        if len(samples) < policy.min_samples:
+            return policy.default_seconds, len(samples)
+        rank = max(0, math.ceil(policy.percentile * len(samples)) - 1)
+        seconds = max(samples[rank] * policy.margin, samples[-1] * policy.longest_margin)
+        return min(policy.max_seconds, max(policy.min_seconds, seconds)), len(samples)
+
+    def typical(self, command: str) -> Optional[float]:
+        """Median past duration of the command's template, or None without enough history"""
+        with self._lock:
+            self._load()
+            samples = sorted(self._samples.get(command_template(command), ()))
+        if len(samples) < self.policy.min_samples:
+            return None
+        return samples[len(samples) // 2]
+
+    def deadline(self, command: str, captures: Iterable[Any] = ()) -> Deadline:
+        seconds, _ = self.budget(command)
+        return Deadline(seconds, captures, self.policy.progress_window_seconds, self.policy.max_seconds)
+
+    def record(self, conn: sqlite3.Connection, command: str, duration: float):
+        """Add a run's duration; written through the caller's connection and transaction"""
+        template = command_template(command)
+        with self._lock:
+            self._load()
+            samples = self._samples.setdefault(template, [])
+            samples.append(round(duration, 3))
+            del samples[:-self.policy.max_samples]
+            durations = json.dumps(samples)
+        conn.execute('''
+            INSERT INTO command_timings (template, durations, updated) VALUES (?, ?, ?)
+            ON CONFLICT(template) DO UPDATE SET durations = excluded.durations, updated = excluded.updated
+        ''', (template, durations, datetime.now().isoformat()))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._load()
+            templates = len(self._samples)
+            learned = sum(1 for s in self._samples.values() if len(s) >= self.policy.min_samples)
+        return {'templates': templates, 'learned': learned, 'default_seconds': self.policy.default_seconds}
@@ -0,0 +1,240 @@
+"""
+Token-budgeted memory context for the OS Agent prompt.
+The assembler fills a fixed token budget by priority: recent turns, rolling
+summaries of older sessions, facts relevant to the current request, command
+statistics and user preferences. Session summaries are computed offline by
+SessionSummarizer on the memory maintenance thread, never on the request path.
+"""
+
+import json
+import sqlite3
+from collections import Counter
+from datetime import datetime
+from typing import Any, List, Optional
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding('cl100k_base')
+except Exception:  # tiktoken is optional; fall back to a character heuristic
+    _ENCODING = None
+
+DEFAULT_TOKEN_BUDGET = 1500
+
+# Share of the budget offered to each section, in priority order. Whatever a
+# section leaves unused rolls over to the sections after it.
+SECTION_SHARES = (
+    ('recent_turns', 0.40),
+    ('session_summaries', 0.20),
+    ('facts', 0.20),
+    ('command_stats', 0.10),
+    ('preferences', 0.10),
+)
+
+
+def count_tokens(text: str) -> int:
+    """Count prompt tokens (exact with tiktoken, otherwise ~4 characters per token)"""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text so it fits in max_tokens, marking the cut"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ''
+    if _ENCODING is not None:
+        return _ENCODING.decode(_ENCODING.encode(text, disallowed_special=())[:max(0, max_tokens - 1)]) + '...'
+    return text[:max(0, max_tokens * 4 - 3)] + '...'
+
+
+class _Section:
+    """Accumulates lines for one section until its budget is spent"""
+
+    def __init__(self, title: str, budget: int):
+        self.title = title
+        self.budget = budget
+        self.lines: List[str] = []
+        self.used = count_tokens(title) + 1
+
+    def add(self, line: str) -> bool:
+        cost = count_tokens(line) + 1
+        if self.used + cost > self.budget:
+            return False
+        self.lines.append(line)
+        self.used += cost
+        return True
+
+    def render(self) -> str:
+        if not self.lines:
+            return ''
+        return self.title + '\n' + '\n'.join(self.lines) + '\n'
+
+    @property
+    def spent(self) -> int:
+        return self.used if self.lines else 0
+
+
+class ContextAssembler:
+    """Builds the memory context block for a request within a token budget"""
+
+    def __init__(self, memory, token_budget: int = DEFAULT_TOKEN_BUDGET):
+        self.memory = memory
+        self.token_budget = token_budget
+
+    def assemble(self, user_request: str = "", token_budget: Optional[int] = None) -> str:
+        budget = token_budget or self.token_budget
+        header = "\n=== MEMORY CONTEXT ===\n"
+        footer = "=== END MEMORY CONTEXT ===\n"
+        remaining = budget - count_tokens(header) - count_tokens(footer)
+
+        builders = {
+            'recent_turns': self._recent_turns,
+            'session_summaries': self._session_summaries,
+            'facts': lambda b: self._facts(user_request, b),
+            'command_stats': self._command_stats,
+            'preferences': self._preferences,
+        }
+
+        parts = []
+        carry = 0
+        for name, share in SECTION_SHARES:
+            section_budget = int(remaining * share) + carry
+            section = builders[name](section_budget)
+            carry = section_budget - section.spent
+            parts.append(section.render())
+
+        return header + ''.join(p for p in parts if p) + footer
+
+    # --- Sections ----------------------------------------------------------
+
+    def _recent_turns(self, budget: int) -> _Section:
+        section = _Section("Recent Conversations:", budget)
+        for conv in self.memory.get_recent_conversations(10):
+            try:
+                response = conv['agent_response'].value
+            except (json.JSONDecodeError, KeyError, ValueError):
+                continue
+            response = response if isinstance(response, dict) else {}
+            agent_message = response.get('user_message', response.get('explanation', 'N/A'))
+            commands = [c.get('command', '') for c in response.get('commands', []) if isinstance(c, dict)]
+            line = f"- User: {truncate_to_tokens(conv['user_request'], 50)}\n" \
+                   f"  Agent: {truncate_to_tokens(str(agent_message), 40)}\n"
+            if commands:
+                line += f"  Commands: {truncate_to_tokens('; '.join(commands), 30)}\n"
+            line += f"  Time: {conv['timestamp']}"
+            if not section.add(line):
+                break
+        return section
+
+    def _session_summaries(self, budget: int) -> _Section:
+        section = _Section("Earlier Sessions:", budget)
+        for summary in self.memory.get_session_summaries(limit=10):
+            if not section.add(f"- {summary}"):
+                break
+        return section
+
+    def _facts(self, user_request: str, budget: int) -> _Section:
+        section = _Section("Learned System Facts:", budget)
+        for key, value in self.memory.search_facts(user_request, limit=10, token_budget=budget):
+            if not section.add(f"- {key}: {value}"):
+                break
+        return section
+
+    def _command_stats(self, budget: int) -> _Section:
+        section = _Section("Frequent Commands:", budget)
+        for cmd, stats in self.memory.get_command_patterns().items():
+            if not section.add(f"- {cmd}: used {stats['frequency']} times (success: {stats['success_rate']:.1%})"):
+                break
+        return section
+
+    def _preferences(self, budget: int) -> _Section:
+        section = _Section("User Preferences:", budget)
+        for pref, value in self.memory.quick_memory['learned_preferences'].items():
+            if not section.add(f"- {pref}: {value}"):
+                break
+        return section
+
+
+class SessionSummarizer:
+    """Maintains rolling extractive summaries of past sessions in session_summaries"""
+
+    def __init__(self, memory, max_requests_listed: int = 6):
+        self.memory = memory
+        self.max_requests_listed = max_requests_listed
+
+    @staticmethod
+    def init_schema(conn: sqlite3.Connection):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS session_summaries (
+                session_id TEXT PRIMARY KEY,
+                started TEXT,
+                ended TEXT,
+                turns INTEGER,
+                summary TEXT,
+                updated TEXT
+            )
+        ''')
+
+    def run(self):
+        """Summarize past sessions that gained conversations since their last summary
+
+        Sessions whose rows were removed by retention keep their existing summary.
+        """
+        with sqlite3.connect(self.memory.db_path, timeout=30) as conn:
+            self.init_schema(conn)
+            stale = conn.execute('''
+                SELECT c.session_id, MIN(c.timestamp), MAX(c.timestamp), COUNT(*)
+                FROM conversations c
+                LEFT JOIN session_summaries s ON s.session_id = c.session_id
+                WHERE c.session_id != ?
+                GROUP BY c.session_id
+                HAVING COUNT(*) > COALESCE(MAX(s.turns), 0)
+            ''', (self.memory.session_id,)).fetchall()
+
+            for session_id, started, ended, turns in stale:
+                rows = conn.execute('''
+                    SELECT user_request, agent_response, execution_results
+                    FROM conversations WHERE session_id = ? ORDER BY timestamp
+                ''', (session_id,)).fetchall()
+                summary = self._summarize(conn, session_id, started, ended, rows)
+                conn.execute('''
+                    INSERT INTO session_summaries (session_id, started, ended, turns, summary, updated)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(session_id) DO UPDATE SET
+                        started = excluded.started, ended = excluded.ended, turns = excluded.turns,
+                        summary = excluded.summary, updated = excluded.updated
+                ''', (session_id, started, ended, turns, summary, datetime.now().isoformat()))
+                conn.commit()
+
+    def _summarize(self, conn: sqlite3.Connection, session_id: str, started: str, ended: str,
+                   rows: List[Any]) -> str:
+        requests: List[str] = []
+        commands: Counter = Counter()
+        failures = 0
+        for user_request, agent_response, execution_results in rows:
+            if user_request and user_request not in requests:
+                requests.append(user_request)
+            try:
+                results = self.memory.payload_store.decode(conn, execution_results) or []
+            except Exception:
+                results = []
+            for result in results if isinstance(results, list) else []:
+                command = str(result.get('command', '')).split()
+                if command:
+                    commands[command[0]] += 1
+                if not result.get('success', True):
+                    failures += 1
+
+        listed = '; '.join(truncate_to_tokens(r, 20) for r in requests[:self.max_requests_listed])
+        if len(requests) > self.max_requests_listed:
+            listed += f"; +{len(requests) - self.max_requests_listed} more"
+        summary = f"{(started or '')[:16]} to {(ended or '')[:16]}, {len(rows)} requests: {listed}."
+        if commands:
+            summary += " Ran " + ', '.join(f"{c} x{n}" for c, n in commands.most_common(5)) + "."
+        if failures:
+            summary += f" {failures} command(s) failed."
+        return summary
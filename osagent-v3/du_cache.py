@@ -0,0 +1,306 @@
+"""
+Directory-size aggregation cache for disk-usage queries.
+Each directory's own file total and its list of subdirectories are cached
+together with the directory's mtime. A later query walks only directories:
+one whose mtime is unchanged is not listed again and its files are not
+re-stat'ed, so only subtrees that actually changed are recomputed. Totals are
+rolled up bottom-up and persisted to agent_memory/du_cache.db so the first
+query after a restart is also cheap.
+
+A file that grows in place does not change its directory's mtime, so cached
+directories are also re-listed once they are older than max_age_seconds.
+"""
+
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from file_engine import paginate, DEFAULT_PAGE_SIZE
+
+DEFAULT_MAX_AGE_SECONDS = 15 * 60
+DEFAULT_WORKERS = min(16, (os.cpu_count() or 4) * 2)
+
+
+_NO_LINKS: Dict[int, int] = {}
+
+
+class _DirRecord:
+    __slots__ = ('mtime_ns', 'dev', 'own_bytes', 'own_files', 'links', 'subdirs', 'checked',
+                 'plain_bytes', 'plain_files', 'subtree_links', 'total_bytes', 'total_files')
+
+    def __init__(self, mtime_ns: int, dev: int, own_bytes: int, own_files: int, links: Dict[int, int],
+                 subdirs: List[str], checked: float):
+        self.mtime_ns = mtime_ns
+        self.dev = dev
+        # Files with a single link are summed directly; hard-linked ones are kept by inode so
+        # each is counted once per subtree, like du
+        self.own_bytes = own_bytes
+        self.own_files = own_files
+        self.links = links
+        self.subdirs = subdirs
+        self.checked = checked
+        self.plain_bytes = own_bytes
+        self.plain_files = own_files
+        self.subtree_links = links
+        self.total_bytes = own_bytes + sum(links.values())
+        self.total_files = own_files + len(links)
+
+
+class DirSizeCache:
+    """Per-directory size totals, revalidated by directory mtime"""
+
+    def __init__(self, db_path: Path, max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS,
+                 workers: int = DEFAULT_WORKERS):
+        self.db_path = Path(db_path)
+        self.max_age_seconds = max_age_seconds
+        self.workers = workers
+        self._records: Dict[str, _DirRecord] = {}
+        self._dirty: Set[str] = set()
+        self._removed: Set[str] = set()
+        self._loaded = False
+        # Roots whose totals have been rolled up in this process; anything loaded from disk
+        # but not yet under one of these only has its own files counted
+        self._rolled_up: Set[str] = set()
+        self._lock = threading.Lock()
+        self._init_schema()
+
+    def _init_schema(self):
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS dir_sizes (
+                    path TEXT PRIMARY KEY,
+                    mtime_ns INTEGER,
+                    dev INTEGER,
+                    own_bytes INTEGER,
+                    own_files INTEGER,
+                    links TEXT,
+                    subdirs TEXT,
+                    checked REAL
+                )
+            ''')
+
+    def _load(self):
+        if self._loaded:
+            return
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            for path, mtime_ns, dev, own_bytes, own_files, links, subdirs, checked in conn.execute(
+                    'SELECT path, mtime_ns, dev, own_bytes, own_files, links, subdirs, checked FROM dir_sizes'):
+                links = {int(ino): size for ino, size in json.loads(links).items()} if links else _NO_LINKS
+                self._records[path] = _DirRecord(mtime_ns, dev, own_bytes, own_files, links,
+                                                 json.loads(subdirs), checked)
+        self._loaded = True
+
+    def _save(self):
+        with self._lock:
+            dirty = [(p, self._records[p]) for p in self._dirty if p in self._records]
+            removed = list(self._removed)
+            self._dirty.clear()
+            self._removed.clear()
+        if not dirty and not removed:
+            return
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            conn.executemany('DELETE FROM dir_sizes WHERE path = ?', [(p,) for p in removed])
+            conn.executemany('''
+                INSERT OR REPLACE INTO dir_sizes (path, mtime_ns, dev, own_bytes, own_files, links, subdirs, checked)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(p, r.mtime_ns, r.dev, r.own_bytes, r.own_files, json.dumps(r.links) if r.links else None,
+                   json.dumps(r.subdirs), r.checked) for p, r in dirty])
+            conn.commit()
+
+    # --- Scanning ----------------------------------------------------------
+
+    def _list_directory(self, path: str, st: os.stat_result) -> _DirRecord:
+        """Re-list one directory: sum its own files and note its subdirectories on the same device"""
+        own_bytes = 0
+        own_files = 0
+        links: Dict[int, int] = {}
+        subdirs = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        entry_st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        # Like du -x: mount points below the directory are not descended into
+                        if entry_st.st_dev == st.st_dev:
+                            subdirs.append(entry.name)
+                        continue
+                    # Allocated size like du when available, apparent size otherwise
+                    size = entry_st.st_blocks * 512 if hasattr(entry_st, 'st_blocks') else entry_st.st_size
+                    if entry_st.st_nlink > 1:
+                        links[entry_st.st_ino] = size
+                    else:
+                        own_bytes += size
+                        own_files += 1
+        except OSError:
+            pass
+        return _DirRecord(st.st_mtime_ns, st.st_dev, own_bytes, own_files, links or _NO_LINKS, subdirs, time.time())
+
+    def _drop_subtree(self, path: str):
+        stack = [path]
+        with self._lock:
+            while stack:
+                current = stack.pop()
+                record = self._records.pop(current, None)
+                if record is None:
+                    continue
+                self._dirty.discard(current)
+                self._removed.add(current)
+                stack.extend(os.path.join(current, name) for name in record.subdirs)
+
+    def _revalidate(self, path: str, now: float) -> Optional[Tuple[_DirRecord, bool]]:
+        """Cached record for one directory, re-listing it if its mtime changed; None if it is gone"""
+        try:
+            st = os.lstat(path)
+        except OSError:
+            self._drop_subtree(path)
+            return None
+        record = self._records.get(path)
+        if record is not None and record.mtime_ns == st.st_mtime_ns and record.dev == st.st_dev and \
+                now - record.checked <= self.max_age_seconds:
+            return record, False
+
+        new_record = self._list_directory(path, st)
+        if record is not None:
+            for gone in set(record.subdirs) - set(new_record.subdirs):
+                self._drop_subtree(os.path.join(path, gone))
+        with self._lock:
+            self._records[path] = new_record
+            self._dirty.add(path)
+        return new_record, True
+
+    def _roll_up(self, path: str, record: _DirRecord):
+        plain_bytes, plain_files = record.own_bytes, record.own_files
+        links = record.links
+        shared = True  # links is still someone else's dict and must be copied before merging
+        for name in record.subdirs:
+            child = self._records.get(os.path.join(path, name))
+            if child is None:
+                continue
+            plain_bytes += child.plain_bytes
+            plain_files += child.plain_files
+            if child.subtree_links:
+                if not links:
+                    links = child.subtree_links
+                else:
+                    if shared:
+                        links = dict(links)
+                        shared = False
+                    links.update(child.subtree_links)
+        record.plain_bytes = plain_bytes
+        record.plain_files = plain_files
+        record.subtree_links = links
+        record.total_bytes = plain_bytes + sum(links.values())
+        record.total_files = plain_files + len(links)
+
+    def _refresh_tree(self, root: str) -> Tuple[int, int]:
+        """Revalidate the tree under root and roll up totals; returns (directories checked, re-listed)"""
+        visited = relisted = 0
+        now = time.time()
+        order: List[Tuple[str, _DirRecord]] = []
+        stack = [root]
+        while stack:
+            path = stack.pop()
+            checked = self._revalidate(path, now)
+            if checked is None:
+                continue
+            record, changed = checked
+            visited += 1
+            relisted += changed
+            order.append((path, record))
+            stack.extend(os.path.join(path, name) for name in record.subdirs)
+
+        # Children were visited after their parents, so reversed order rolls totals up bottom-up
+        for path, record in reversed(order):
+            self._roll_up(path, record)
+        return visited, relisted
+
+    def refresh(self, path: str) -> Dict[str, Any]:
+        """Bring the cached totals for path up to date, checking its children in parallel"""
+        path = os.path.abspath(os.path.expanduser(path))
+        started = time.monotonic()
+        with self._lock:
+            self._load()
+
+        checked = self._revalidate(path, time.time())
+        if checked is None:
+            raise FileNotFoundError(f"No such directory: {path}")
+        record, changed = checked
+        children = [os.path.join(path, name) for name in record.subdirs]
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            results = list(pool.map(self._refresh_tree, children))
+        self._roll_up(path, record)
+        self._rolled_up.add(path)
+        self._save()
+        return {'directories_checked': 1 + sum(r[0] for r in results),
+                'directories_rescanned': int(changed) + sum(r[1] for r in results),
+                'elapsed_ms': round((time.monotonic() - started) * 1000, 1)}
+
+    # --- Queries -----------------------------------------------------------
+
+    def directory_size(self, path: str, offset: int = 0, limit: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+        """Total size of a tree and per-child totals, largest first (same shape as file_engine.directory_size)"""
+        stats = self.refresh(path)
+        path = os.path.abspath(os.path.expanduser(path))
+        record = self._records[path]
+        children = [(os.path.join(path, name), self._records.get(os.path.join(path, name))) for name in record.subdirs]
+        breakdown = sorted(
+            ({'path': child, 'bytes': r.total_bytes, 'files': r.total_files} for child, r in children if r),
+            key=lambda item: item['bytes'], reverse=True
+        )
+        return {
+            'success': True,
+            'path': path,
+            'total_bytes': record.total_bytes,
+            'files': record.total_files,
+            'directories': self._count_directories(path) - 1,
+            'cache': stats,
+            **paginate(breakdown, offset, limit)
+        }
+
+    def _count_directories(self, path: str) -> int:
+        count = 0
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            record = self._records.get(current)
+            if record is None:
+                continue
+            count += 1
+            stack.extend(os.path.join(current, name) for name in record.subdirs)
+        return count
+
+    def largest_directories(self, path: str, limit: int = 20, max_depth: Optional[int] = None,
+                            refresh: bool = True) -> List[Dict[str, Any]]:
+        """Top-N directories below path by total size (from the cache only if refresh is False)"""
+        path = os.path.abspath(os.path.expanduser(path))
+        if refresh:
+            self.refresh(path)
+        elif not any(path == r or path.startswith(r.rstrip(os.sep) + os.sep) for r in self._rolled_up):
+            return []
+        root = self._records.get(path)
+        if root is None:
+            return []
+
+        candidates: List[Tuple[int, str, _DirRecord]] = []
+        stack = [(path, 0)]
+        while stack:
+            current, depth = stack.pop()
+            record = self._records.get(current)
+            if record is None:
+                continue
+            if depth > 0:
+                candidates.append((record.total_bytes, current, record))
+            if max_depth is None or depth < max_depth:
+                stack.extend((os.path.join(current, name), depth + 1) for name in record.subdirs)
+
+        best = heapq.nlargest(max(1, limit), candidates, key=lambda item: item[0])
+        return [{'path': p, 'bytes': r.total_bytes, 'files': r.total_files} for _, p, r in best]
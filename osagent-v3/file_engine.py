@@ -0,0 +1,302 @@
+"""
+Native file-operation engine behind OSAgent.manage_file_operations.
+Listing, directory sizes, glob search, hashing and recursive delete are done
+in-process with os.scandir and a thread pool instead of spawning ls, du, find
+or rm (copy and move live in bulk_transfer). Every action returns a
+structured, JSON-serializable result; listings and searches are paginated
+with offset/limit.
+"""
+
+import fnmatch
+import hashlib
+import heapq
+import os
+import stat as stat_module
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Tuple
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 5000
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 4) * 4)
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def paginate(items: List[Any], offset: int, limit: int) -> Dict[str, Any]:
+    offset = max(0, offset)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    page = items[offset:offset + limit]
+    next_offset = offset + len(page)
+    return {
+        'items': page,
+        'offset': offset,
+        'limit': limit,
+        'total': len(items),
+        'next_offset': next_offset if next_offset < len(items) else None
+    }
+
+
+def _entry_info(entry: os.DirEntry) -> Dict[str, Any]:
+    try:
+        st = entry.stat(follow_symlinks=False)
+    except OSError:
+        return {'name': entry.name, 'path': entry.path, 'type': 'unknown', 'size': 0, 'modified': None}
+    if stat_module.S_ISLNK(st.st_mode):
+        kind = 'symlink'
+    elif stat_module.S_ISDIR(st.st_mode):
+        kind = 'directory'
+    elif stat_module.S_ISREG(st.st_mode):
+        kind = 'file'
+    else:
+        kind = 'other'
+    return {
+        'name': entry.name,
+        'path': entry.path,
+        'type': kind,
+        'size': st.st_size,
+        'modified': datetime.fromtimestamp(st.st_mtime).isoformat()
+    }
+
+
+def _walk(root: str, follow_symlinks: bool = False) -> Iterator[Tuple[str, List[os.DirEntry], List[os.DirEntry]]]:
+    """Iterative scandir walk yielding (dir, subdirectory entries, other entries)"""
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        dirs, others = [], []
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=follow_symlinks):
+                            dirs.append(entry)
+                        else:
+                            others.append(entry)
+                    except OSError:
+                        others.append(entry)
+        except OSError:
+            continue
+        yield current, dirs, others
+        stack.extend(d.path for d in dirs)
+
+
+def list_directory(path: str, offset: int = 0, limit: int = DEFAULT_PAGE_SIZE, show_hidden: bool = False,
+                   sort_by: str = 'name') -> Dict[str, Any]:
+    """List one directory with type, size and mtime per entry"""
+    with os.scandir(path) as it:
+        entries = [_entry_info(e) for e in it if show_hidden or not e.name.startswith('.')]
+    if sort_by == 'size':
+        entries.sort(key=lambda e: e['size'], reverse=True)
+    elif sort_by == 'modified':
+        entries.sort(key=lambda e: e['modified'] or '', reverse=True)
+    else:
+        entries.sort(key=lambda e: (e['type'] != 'directory', e['name'].lower()))
+    return {'success': True, 'path': path, **paginate(entries, offset, limit)}
+
+
+def _tree_size(root: str) -> Tuple[int, int, int]:
+    """(bytes, files, directories) below root, counting each inode once"""
+    total = files = dirs = 0
+    seen = set()
+    for _, subdirs, others in _walk(root):
+        dirs += len(subdirs)
+        for entry in others:
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if st.st_nlink > 1:
+                if (st.st_dev, st.st_ino) in seen:
+                    continue
+                seen.add((st.st_dev, st.st_ino))
+            # Allocated size like du when available, apparent size otherwise
+            total += st.st_blocks * 512 if hasattr(st, 'st_blocks') else st.st_size
+            files += 1
+    return total, files, dirs
+
+
+def directory_size(path: str, workers: int = DEFAULT_WORKERS, offset: int = 0,
+                   limit: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+    """Total size of a tree plus per-child totals, children scanned in parallel"""
+    if not os.path.isdir(path):
+        st = os.stat(path)
+        return {'success': True, 'path': path, 'total_bytes': st.st_size, 'files': 1, 'directories': 0,
+                **paginate([], 0, 1)}
+
+    with os.scandir(path) as it:
+        children = list(it)
+
+    subdirs = [c for c in children if c.is_dir(follow_symlinks=False)]
+    own_bytes = 0
+    own_files = 0
+    for entry in children:
+        if entry in subdirs:
+            continue
+        try:
+            st = entry.stat(follow_symlinks=False)
+            own_bytes += st.st_blocks * 512 if hasattr(st, 'st_blocks') else st.st_size
+            own_files += 1
+        except OSError:
+            pass
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        sizes = list(pool.map(lambda d: _tree_size(d.path), subdirs))
+
+    breakdown = sorted(
+        ({'path': d.path, 'bytes': size, 'files': files} for d, (size, files, _) in zip(subdirs, sizes)),
+        key=lambda item: item['bytes'], reverse=True
+    )
+    return {
+        'success': True,
+        'path': path,
+        'total_bytes': own_bytes + sum(s[0] for s in sizes),
+        'files': own_files + sum(s[1] for s in sizes),
+        'directories': len(subdirs) + sum(s[2] for s in sizes),
+        **paginate(breakdown, offset, limit)
+    }
+
+
+def glob_search(root: str, pattern: str, offset: int = 0, limit: int = DEFAULT_PAGE_SIZE,
+                max_results: int = 100000, include_dirs: bool = True) -> Dict[str, Any]:
+    """Find entries below root whose name (or relative path, if the pattern has a '/') matches"""
+    match_path = '/' in pattern
+    matches = []
+    truncated = False
+    for current, subdirs, others in _walk(root):
+        for entry in (subdirs if include_dirs else []) + others:
+            target = os.path.relpath(entry.path, root) if match_path else entry.name
+            if fnmatch.fnmatch(target, pattern):
+                matches.append(_entry_info(entry))
+                if len(matches) >= max_results:
+                    truncated = True
+                    break
+        if truncated:
+            break
+    matches.sort(key=lambda m: m['path'])
+    return {'success': True, 'root': root, 'pattern': pattern, 'scan_truncated': truncated,
+            **paginate(matches, offset, limit)}
+
+
+def top_entries(root: str, sort_by: str = 'size', limit: int = 20, include_dirs: bool = False) -> Dict[str, Any]:
+    """Largest or most recently modified entries below root, by walking the tree"""
+    field = 'st_mtime' if sort_by == 'modified' else 'st_size'
+    candidates = []
+    for _, subdirs, others in _walk(root):
+        for entry in (subdirs if include_dirs else []) + others:
+            try:
+                candidates.append((getattr(entry.stat(follow_symlinks=False), field), entry))
+            except OSError:
+                continue
+    best = heapq.nlargest(max(1, limit), candidates, key=lambda item: item[0])
+    items = [_entry_info(entry) for _, entry in best]
+    return {'success': True, 'root': root, 'sort_by': sort_by, **paginate(items, 0, len(items) or 1)}
+
+
+def hash_file(path: str, algorithm: str = 'sha256') -> str:
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_path(path: str, algorithm: str = 'sha256', workers: int = DEFAULT_WORKERS, offset: int = 0,
+              limit: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+    """Hash a file, or every file in a tree (in parallel)"""
+    if algorithm not in hashlib.algorithms_available:
+        return {'success': False, 'error': f"Unsupported hash algorithm: {algorithm}"}
+    if not os.path.isdir(path):
+        return {'success': True, 'path': path, 'algorithm': algorithm, 'digest': hash_file(path, algorithm)}
+
+    files = sorted(e.path for _, _, others in _walk(path) for e in others if e.is_file(follow_symlinks=False))
+
+    def digest_or_error(file_path: str) -> Dict[str, Any]:
+        try:
+            return {'path': file_path, 'digest': hash_file(file_path, algorithm)}
+        except OSError as e:
+            return {'path': file_path, 'error': str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        digests = list(pool.map(digest_or_error, files))
+    return {'success': True, 'path': path, 'algorithm': algorithm, **paginate(digests, offset, limit)}
+
+
+def delete_tree(path: str, workers: int = DEFAULT_WORKERS) -> Dict[str, Any]:
+    """Recursively delete a tree, unlinking files in parallel and then removing directories"""
+    directories = []
+    files = []
+    # Not following links puts symlinks to directories among the others, so they are unlinked
+    # as links and their targets are left alone
+    for current, _, others in _walk(path, follow_symlinks=False):
+        directories.append(current)
+        files.extend(e.path for e in others)
+
+    file_errors = []
+    directory_errors = []
+
+    def unlink(file_path: str):
+        try:
+            os.unlink(file_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            file_errors.append({'path': file_path, 'error': str(e)})
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(unlink, files))
+
+    # Deepest directories first
+    for directory in sorted(directories, key=lambda d: d.count(os.sep), reverse=True):
+        try:
+            os.rmdir(directory)
+        except OSError as e:
+            directory_errors.append({'path': directory, 'error': str(e)})
+
+    errors = file_errors + directory_errors
+    return {'success': not errors, 'path': path, 'files_deleted': len(files) - len(file_errors),
+            'directories_deleted': len(directories) - len(directory_errors), 'errors': errors[:50]}
+
+
+def render_result(operation: str, result: Dict[str, Any]) -> str:
+    """Short human-readable summary of a structured result for the terminal"""
+    if not result.get('success'):
+        return result.get('error') or '; '.join(e['error'] for e in result.get('errors', [])[:3]) or 'Failed.'
+
+    def human(size: int) -> str:
+        for unit in ('B', 'K', 'M', 'G', 'T'):
+            if size < 1024 or unit == 'T':
+                return f"{size:.0f}{unit}" if unit == 'B' else f"{size:.1f}{unit}"
+            size /= 1024
+
+    lines: List[str] = []
+    if operation == 'list':
+        lines = [f"{'d' if i['type'] == 'directory' else '-'} {human(i['size']):>7}  {i['name']}" for i in result['items']]
+    elif operation == 'du':
+        lines = [f"{human(result['total_bytes'])} total in {result['path']} ({result['files']} files)"]
+        lines += [f"{human(i['bytes']):>7}  {i['path']}" for i in result['items']]
+    elif operation in ('glob', 'search', 'locate'):
+        lines = [i['path'] for i in result['items']]
+    elif operation == 'largest_dirs':
+        lines = [f"{human(i['bytes']):>7}  {i['path']}" for i in result['items']]
+    elif operation == 'largest':
+        lines = [f"{human(i['size']):>7}  {i['path']}" for i in result['items']]
+    elif operation == 'recent':
+        lines = [f"{(i['modified'] or '')[:19]}  {i['path']}" for i in result['items']]
+    elif operation == 'info':
+        info = result['info']
+        kind = 'directory' if info['is_directory'] else 'file' if info['is_file'] else 'other'
+        lines = [f"{info['path']}: {kind}, {human(info['size'])} ({info['size']} bytes), "
+                 f"modified {(info['modified'] or '')[:19]}"]
+    elif operation == 'hash':
+        if 'digest' in result:
+            lines = [f"{result['digest']}  {result['path']}"]
+        else:
+            lines = [f"{i.get('digest', i.get('error'))}  {i['path']}" for i in result['items']]
+    elif 'message' in result:
+        lines = [result['message']]
+    if result.get('next_offset') is not None:
+        lines.append(f"... {result['total'] - result['next_offset']} more (offset={result['next_offset']})")
+    return '\n'.join(lines) if lines else 'Done.'
@@ -0,0 +1,129 @@
+// Live system dashboard.
+// Subscribes to the server's /ws feed, keeps one state object per channel by applying
+// the pushed snapshots and deltas, and re-renders at most once per animation frame.
+// While the tab is hidden it unsubscribes, so idle viewers cost the server nothing.
+
+class Dashboard {
+    constructor(root) {
+        this.root = root;
+        this.channels = ['cpu', 'memory', 'disk', 'network', 'processes'];
+        this.state = {};
+        this.dirty = new Set();
+        this.framePending = false;
+        this.socket = null;
+        this.retryDelay = 1000;
+        this.elements = {};
+        root.querySelectorAll('[data-metric]').forEach(el => { this.elements[el.dataset.metric] = el; });
+
+        document.addEventListener('visibilitychange', () => {
+            this.send(document.hidden ? 'unsubscribe' : 'subscribe');
+        });
+    }
+
+    connect() {
+        const scheme = location.protocol === 'https:' ? 'wss' : 'ws';
+        const socket = new WebSocket(`${scheme}://${location.host}/ws`);
+        this.socket = socket;
+        this.setConnection('connecting');
+
+        socket.addEventListener('open', () => {
+            this.retryDelay = 1000;
+            this.setConnection('live');
+            if (!document.hidden) this.send('subscribe');
+        });
+        socket.addEventListener('message', event => this.receive(JSON.parse(event.data)));
+        socket.addEventListener('close', () => {
+            if (this.socket !== socket) return;
+            this.setConnection('offline');
+            // Snapshots are resent on resubscribe, so state is simply rebuilt
+            this.state = {};
+            setTimeout(() => this.connect(), this.retryDelay);
+            this.retryDelay = Math.min(this.retryDelay * 2, 30000);
+        });
+    }
+
+    send(op) {
+        if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+            this.socket.send(JSON.stringify({ op: op, channels: this.channels }));
+        }
+    }
+
+    receive(message) {
+        if (message.type === 'snapshot') {
+            this.state[message.channel] = message.data;
+        } else {
+            const state = this.state[message.channel];
+            if (!state) return;
+            Object.assign(state, message.data.set);
+            message.data.del.forEach(key => delete state[key]);
+        }
+        this.dirty.add(message.channel);
+        if (!this.framePending) {
+            this.framePending = true;
+            requestAnimationFrame(() => {
+                this.framePending = false;
+                this.render();
+            });
+        }
+    }
+
+    setConnection(text) {
+        if (this.elements.connection) {
+            this.elements.connection.textContent = text;
+            this.elements.connection.className = `dashboard-state ${text}`;
+        }
+    }
+
+    setMetric(name, text, percentage) {
+        if (this.elements[name]) this.elements[name].textContent = text;
+        const meter = this.elements[`${name}-meter`];
+        if (meter && percentage !== undefined) meter.style.width = `${Math.min(100, percentage)}%`;
+    }
+
+    render() {
+        for (const channel of this.dirty) {
+            const data = this.state[channel];
+            if (!data) continue;
+            if (channel === 'cpu') {
+                const load = data.load ? `  load ${data.load.join(' ')}` : '';
+                this.setMetric('cpu', `${data.percent.toFixed(1)}% of ${data.count} cores${load}`, data.percent);
+            } else if (channel === 'memory' || channel === 'disk') {
+                this.setMetric(channel, `${formatBytes(data.used)} / ${formatBytes(data.total)} (${data.percentage}%)`,
+                    data.percentage);
+            } else if (channel === 'network') {
+                const rates = data.recv_rate === undefined ? 'measuring…'
+                    : `↓ ${formatBytes(data.recv_rate)}/s  ↑ ${formatBytes(data.send_rate)}/s`;
+                this.setMetric('network', rates);
+            } else if (channel === 'processes') {
+                this.renderProcesses(data);
+            }
+        }
+        this.dirty.clear();
+    }
+
+    renderProcesses(data) {
+        const body = this.elements.processes;
+        if (!body) return;
+        const rows = data.order.map(pid => data[String(pid)]).filter(Boolean);
+        while (body.rows.length > rows.length) body.deleteRow(-1);
+        rows.forEach((process, i) => {
+            const row = body.rows[i] || body.insertRow();
+            const cells = [String(process.pid), process.cpu_percent.toFixed(1), process.memory_percent.toFixed(1), process.name];
+            cells.forEach((text, j) => {
+                const cell = row.cells[j] || row.insertCell();
+                if (cell.textContent !== text) cell.textContent = text;
+            });
+        });
+    }
+}
+
+function formatBytes(bytes) {
+    const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+    let value = bytes;
+    let unit = 0;
+    while (value >= 1024 && unit < units.length - 1) {
+        value /= 1024;
+        unit++;
+    }
+    return `${value.toFixed(unit ? 1 : 0)} ${units[unit]}`;
+}
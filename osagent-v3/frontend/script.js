@@ -1,27 +1,130 @@
 document.addEventListener('DOMContentLoaded', () => {
     const terminalInput = document.getElementById('terminal-input');
     const terminalOutput = document.getElementById('terminal-output');
-    const terminalBody = document.getElementById('terminal-body');
+    // Scrollback cap: data-scrollback-lines on the output element, overridable per browser
+    const scrollbackLines = parseInt(localStorage.getItem('osagent.scrollbackLines') || terminalOutput.dataset.scrollbackLines, 10);
+    const scrollback = new Scrollback(terminalOutput, { maxLines: scrollbackLines || 100000 });
 
     let awaitingConfirmation = false;
     let pendingCommandsToConfirm = [];
     let currentCommand = ''; // Store the original command for re-sending
+    let pendingPlanId = null; // Server-side plan to resume once the user confirms
 
-    // Function to append output to the terminal
+    // Function to append output to the terminal (rendered as text, never as HTML)
     function appendOutput(text, className = '') {
-        const p = document.createElement('p');
-        p.className = className;
-        // Handle newlines within the text content
-        p.innerHTML = text.replace(/\n/g, '<br>');
-        terminalOutput.appendChild(p);
-        terminalBody.scrollTop = terminalBody.scrollHeight; // Auto-scroll to bottom
+        scrollback.append(text, className);
     }
 
+    // Live metrics panel, fed over the /ws WebSocket
+    const dashboardPanel = document.getElementById('dashboard');
+    const dashboard = new Dashboard(dashboardPanel);
+    dashboard.connect();
+
     // Initial welcome message
     appendOutput('Welcome to OS Agent Terminal. Type "help" for commands.', 'info');
     appendOutput('os-agent $ ');
 
-    async function sendCommand(command, confirmedCommands = []) {
+    // Built-ins are answered by dedicated endpoints, without going through the planner.
+    // The browser revalidates them with the ETag, so unchanged data costs a 304.
+    const builtinRenderers = {
+        status: data => {
+            if (data.error) return { text: `Error: ${data.error}`, className: 'error' };
+            const lines = [
+                `CPU: ${data.cpu_usage.toFixed(1)}%`,
+                `Memory: ${formatBytes(data.memory.used)} / ${formatBytes(data.memory.total)} (${data.memory.percentage.toFixed(1)}%)`,
+                `Disk: ${formatBytes(data.disk.used)} / ${formatBytes(data.disk.total)} (${data.disk.percentage.toFixed(1)}%)`,
+                `Processes: ${data.processes}`,
+                `Uptime: ${(data.uptime / 3600).toFixed(1)} h`
+            ];
+            (data.network_interfaces || []).forEach(n => lines.push(`${n.interface}: ${n.ip}`));
+            return { text: lines.join('\n'), className: 'success' };
+        },
+        processes: data => ({
+            text: ['PID      CPU%   MEM%   NAME'].concat(data.processes.map(p =>
+                `${String(p.pid).padEnd(8)} ${p.cpu_percent.toFixed(1).padStart(5)}  ${p.memory_percent.toFixed(1).padStart(5)}   ${p.name}`
+            )).join('\n'),
+            className: 'success'
+        }),
+        info: data => ({
+            text: Object.entries(data)
+                .filter(([, value]) => typeof value !== 'object')
+                .map(([key, value]) => `${key}: ${value}`).join('\n'),
+            className: 'success'
+        }),
+        memory_stats: data => ({
+            text: [
+                `Conversations: ${data.total_conversations}`,
+                `System facts: ${data.total_system_facts}`,
+                `Top commands: ${(data.top_commands || []).join(', ') || 'none'}`,
+                `Location: ${data.memory_location}`
+            ].join('\n'),
+            className: data.error ? 'error' : 'success'
+        }),
+        jobs: data => ({
+            text: data.jobs.length === 0 ? 'No background jobs.' : ['ID            STATUS      EXIT  COMMAND'].concat(data.jobs.map(j =>
+                `${j.job_id.padEnd(13)} ${j.status.padEnd(11)} ${String(j.returncode ?? '-').padStart(4)}  ${j.command}`
+            )).join('\n'),
+            className: 'success'
+        }),
+        cancel: data => ({ text: `Job ${data.job_id}: ${data.status}`, className: 'success' })
+    };
+    const builtinEndpoints = { status: '/status', processes: '/processes', info: '/info', memory_stats: '/memory/stats', jobs: '/jobs' };
+    const jobBuiltins = ['attach', 'cancel'];
+
+    async function attachJob(jobId) {
+        // Streams the job's output until it finishes
+        const response = await fetch(`/jobs/${encodeURIComponent(jobId)}/attach`);
+        if (!response.ok) {
+            const data = await response.json();
+            appendOutput(`Error from server: ${data.detail || 'Unknown error'}`, 'error');
+            return;
+        }
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        for (;;) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            const text = decoder.decode(value, { stream: true });
+            if (text) appendOutput(text.replace(/\n$/, ''));
+        }
+        const job = await (await fetch(`/jobs/${encodeURIComponent(jobId)}`, { cache: 'no-cache' })).json();
+        appendOutput(`Job ${jobId}: ${job.status}${job.returncode != null ? ` (exit ${job.returncode})` : ''}`,
+                     job.status === 'succeeded' ? 'success' : 'warning');
+    }
+
+    async function runBuiltin(name, args) {
+        try {
+            let response;
+            if (name === 'attach') {
+                await attachJob(args[0] || '');
+                return;
+            } else if (name === 'cancel') {
+                response = await fetch(`/jobs/${encodeURIComponent(args[0] || '')}/cancel`, { method: 'POST' });
+            } else if (name === 'cleanup_memory') {
+                const days = parseInt(args[0] || '30', 10);
+                response = await fetch(`/memory/cleanup?days=${isNaN(days) ? 30 : days}`, { method: 'POST' });
+            } else {
+                response = await fetch(builtinEndpoints[name], { cache: 'no-cache' });
+            }
+            const data = await response.json();
+            if (!response.ok) {
+                appendOutput(`Error from server: ${data.detail || 'Unknown error'}`, 'error');
+            } else if (name === 'cleanup_memory') {
+                const deleted = Object.values(data.rows_deleted || {}).reduce((a, b) => a + b, 0);
+                appendOutput(`Memory cleaned: ${deleted} rows older than ${data.days_kept} days removed.`, 'success');
+            } else {
+                const rendered = builtinRenderers[name](data);
+                appendOutput(rendered.text, rendered.className);
+            }
+        } catch (error) {
+            appendOutput(`An unexpected error occurred: ${error.message}`, 'error');
+        } finally {
+            appendOutput('os-agent $ ');
+            terminalInput.focus();
+        }
+    }
+
+    async function sendCommand(command, confirmedCommands = [], planId = null, iterative = false) {
         try {
             appendOutput('Processing...', 'info'); // Show processing message immediately
             const response = await fetch('/execute', {
@@ -29,7 +132,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ command: command, confirmed_commands: confirmedCommands }),
+                body: JSON.stringify({ command: command, confirmed_commands: confirmedCommands, plan_id: planId, iterative: iterative }),
             });
 
             const data = await response.json();
@@ -43,6 +146,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 if (data.pending_confirmation_commands && data.pending_confirmation_commands.length > 0) {
                     awaitingConfirmation = true;
                     pendingCommandsToConfirm = data.pending_confirmation_commands;
+                    pendingPlanId = data.plan_id || null;
                     appendOutput(`
 ⚠️ This action involves sensitive operations.
 To proceed with these commands:
@@ -57,6 +161,7 @@ Type 'yes' to confirm and execute, or 'no' to cancel.
                 // If no confirmation needed or already confirmed, display execution results concisely
                 awaitingConfirmation = false;
                 pendingCommandsToConfirm = []; // Clear pending commands
+                pendingPlanId = null;
 
                 if (data.execution_results && data.execution_results.length > 0) {
                     data.execution_results.forEach(result => {
@@ -64,7 +169,7 @@ Type 'yes' to confirm and execute, or 'no' to cancel.
                         let message = '';
 
                         // This block now handles all OS command results
-                        appendOutput(`Executing: ${result.command}`, 'info');
+                        appendOutput(`Executing${result.step ? ` (step ${result.step})` : ''}: ${result.command}`, 'info');
                         const commandName = result.command.split(' ')[0]; // Just show the first part of command
                         message = `[${commandName}] ${result.output_message || (result.success ? 'Completed.' : 'Failed.')}`;
 
@@ -86,9 +191,12 @@ Type 'yes' to confirm and execute, or 'no' to cancel.
                                     recommendation = `The command might be misspelled or not installed on your system.`;
                                 }
                             }
-                            message = `${errorSummary}<br>Details: ${result.output_message}<br>Suggestion: ${recommendation}`;
+                            message = `${errorSummary}\nDetails: ${result.output_message}\nSuggestion: ${recommendation}`;
                         }
                         appendOutput(message, statusClass);
+                        if (result.truncated && result.output_id) {
+                            appendOutput(`Output truncated. Full output: /outputs/${result.output_id}`, 'info');
+                        }
                     });
                 } else {
                     // Only show this if no commands were executed at all (e.g., just info response)
@@ -126,12 +234,16 @@ Type 'yes' to confirm and execute, or 'no' to cancel.
                 if (command.toLowerCase() === 'yes') {
                     awaitingConfirmation = false; // Reset flag
                     appendOutput('Confirmation received. Resuming...', 'info');
-                    await sendCommand(currentCommand, pendingCommandsToConfirm); // Resend original command with confirmations
+                    await sendCommand(currentCommand, pendingCommandsToConfirm, pendingPlanId); // Resume the stored plan with confirmations
                     currentCommand = ''; // Clear stored command
                 } else if (command.toLowerCase() === 'no') {
                     appendOutput('Command execution cancelled by user.', 'info');
+                    if (pendingPlanId) {
+                        fetch(`/plans/${pendingPlanId}/cancel`, { method: 'POST' }).catch(() => {});
+                    }
                     awaitingConfirmation = false;
                     pendingCommandsToConfirm = [];
+                    pendingPlanId = null;
                     currentCommand = '';
                     appendOutput('os-agent $ ');
                 } else {
@@ -146,19 +258,29 @@ Type 'yes' to confirm and execute, or 'no' to cancel.
                 appendOutput(`
 Available commands:
 - Any natural language OS request (e.g., "list files")
+- 'task <request>' - Work on a request in steps, feeding results back to the agent
 - 'status' - Get system status
 - 'processes' - List running processes
 - 'info' - Get system information
 - 'memory_stats' - Show agent memory statistics
-- 'cleanup_memory' - Clean up old memory data
+- 'cleanup_memory [days]' - Clean up memory data older than [days] (default 30)
+- 'jobs' - List background jobs (long-running commands)
+- 'attach <id>' - Follow a background job's output until it finishes
+- 'cancel <id>' - Stop a background job
 - 'help' - Show this help
+- 'dashboard' - Show or hide the live system panel
 - 'clear' - Clear the terminal screen
 - 'quit' - Exit the agent (frontend only)
                 `, 'info');
                 appendOutput('os-agent $ ');
                 return;
+            } else if (command.toLowerCase() === 'dashboard') {
+                dashboardPanel.hidden = !dashboardPanel.hidden;
+                dashboard.send(dashboardPanel.hidden ? 'unsubscribe' : 'subscribe');
+                appendOutput('os-agent $ ');
+                return;
             } else if (command.toLowerCase() === 'clear') {
-                terminalOutput.innerHTML = ''; // Clear content
+                scrollback.clear(); // Clear content
                 appendOutput('os-agent $ ');
                 return;
             } else if (command.toLowerCase() === 'quit') {
@@ -167,10 +289,25 @@ Available commands:
                 return;
             }
 
+            // Only the exact built-in forms; "processes using port 8080" is a request for the planner
+            const [builtin, ...builtinArgs] = command.trim().split(/\s+/);
+            const name = builtin.toLowerCase();
+            if ((Object.hasOwn(builtinEndpoints, name) && builtinArgs.length === 0)
+                || (name === 'cleanup_memory' && builtinArgs.length <= 1 && builtinArgs.every(arg => /^\d+$/.test(arg)))
+                || (jobBuiltins.includes(name) && builtinArgs.length === 1 && /^[0-9a-f]{12}$/.test(builtinArgs[0]))) {
+                await runBuiltin(name, builtinArgs);
+                return;
+            }
+
             // Store the command before sending, in case confirmation is needed
             currentCommand = command;
-            // Send command to backend
-            await sendCommand(command);
+            // Send command to backend; "task <request>" runs it in iterative mode
+            if (command.toLowerCase().startsWith('task ')) {
+                currentCommand = command.slice(5).trim();
+                await sendCommand(currentCommand, [], null, true);
+            } else {
+                await sendCommand(command);
+            }
         }
     });
 });
\ No newline at end of file
@@ -0,0 +1,123 @@
+// Virtualized terminal scrollback.
+// Lines are kept in a fixed-size ring buffer (oldest dropped past the cap) and only
+// the rows in view, plus a small overscan, exist in the DOM. Appends are queued and
+// rendered once per animation frame as text nodes, so a flood of output costs one
+// layout per frame no matter how many lines arrive.
+
+const MAX_SCROLLBACK_LINES = 500000; // keeps the spacer below browser element-height limits
+
+class Scrollback {
+    constructor(viewport, { maxLines = 100000, overscan = 30 } = {}) {
+        this.viewport = viewport;
+        this.capacity = Math.max(100, Math.min(maxLines, MAX_SCROLLBACK_LINES));
+        this.overscan = overscan;
+
+        this.texts = new Array(this.capacity);
+        this.classes = new Array(this.capacity);
+        this.start = 0;     // ring index of the oldest line
+        this.length = 0;
+        this.firstId = 0;   // sequence number of the oldest line, used to skip unchanged rows
+
+        this.stickToBottom = true;
+        this.framePending = false;
+
+        this.spacer = document.createElement('div');
+        this.spacer.className = 'scrollback-spacer';
+        this.rows = document.createElement('div');
+        this.rows.className = 'scrollback-rows';
+        this.viewport.replaceChildren(this.spacer, this.rows);
+        this.pool = [];
+        this.lineHeight = this.measureLineHeight();
+
+        this.viewport.addEventListener('scroll', () => {
+            const { scrollTop, clientHeight, scrollHeight } = this.viewport;
+            this.stickToBottom = scrollTop + clientHeight >= scrollHeight - this.lineHeight;
+            this.scheduleRender();
+        }, { passive: true });
+        window.addEventListener('resize', () => this.scheduleRender());
+    }
+
+    measureLineHeight() {
+        const probe = document.createElement('div');
+        probe.className = 'scrollback-line';
+        probe.textContent = 'M';
+        this.rows.appendChild(probe);
+        const height = probe.getBoundingClientRect().height || 18;
+        probe.remove();
+        return height;
+    }
+
+    append(text, className = '') {
+        const lines = String(text).split('\n');
+        for (const line of lines) {
+            const index = (this.start + this.length) % this.capacity;
+            this.texts[index] = line;
+            this.classes[index] = className;
+            if (this.length < this.capacity) {
+                this.length++;
+            } else {
+                this.start = (this.start + 1) % this.capacity;
+                this.firstId++;
+            }
+        }
+        this.scheduleRender();
+    }
+
+    clear() {
+        this.texts = new Array(this.capacity);
+        this.classes = new Array(this.capacity);
+        this.firstId += this.length;
+        this.start = 0;
+        this.length = 0;
+        this.stickToBottom = true;
+        this.scheduleRender();
+    }
+
+    scheduleRender() {
+        if (this.framePending) return;
+        this.framePending = true;
+        requestAnimationFrame(() => {
+            this.framePending = false;
+            this.render();
+        });
+    }
+
+    render() {
+        const lineHeight = this.lineHeight;
+        this.spacer.style.height = `${this.length * lineHeight}px`;
+        if (this.stickToBottom) {
+            this.viewport.scrollTop = this.viewport.scrollHeight;
+        }
+
+        const first = Math.max(0, Math.floor(this.viewport.scrollTop / lineHeight) - this.overscan);
+        const visible = Math.ceil(this.viewport.clientHeight / lineHeight) + 2 * this.overscan;
+        const count = Math.max(0, Math.min(this.length - first, visible));
+
+        while (this.pool.length < count) {
+            const row = document.createElement('div');
+            row.lineId = -1;
+            this.rows.appendChild(row);
+            this.pool.push(row);
+        }
+        for (let i = 0; i < this.pool.length; i++) {
+            const row = this.pool[i];
+            if (i >= count) {
+                if (row.lineId !== -1) {
+                    row.lineId = -1;
+                    row.textContent = '';
+                    row.className = 'scrollback-line';
+                    row.hidden = true;
+                }
+                continue;
+            }
+            const lineId = this.firstId + first + i;
+            if (row.lineId === lineId) continue;
+            const index = (this.start + first + i) % this.capacity;
+            row.lineId = lineId;
+            row.hidden = false;
+            row.className = this.classes[index] ? `scrollback-line ${this.classes[index]}` : 'scrollback-line';
+            row.textContent = this.texts[index];
+        }
+        this.rows.style.transform = `translateY(${first * lineHeight}px)`;
+    }
+}
@@ -0,0 +1,473 @@
+"""
+Background filesystem index for the OS Agent.
+Path, size, mtime and type of everything below the configured roots are kept
+in a compact SQLite file (agent_memory/fs_index.db) so name, size and recency
+queries are answered from the index instead of walking the tree with find or
+du. On Linux the index is kept current with inotify; elsewhere, or when the
+watch budget is used up, a periodic rescan that only writes differences keeps
+it fresh. The budget is a small share of fs.inotify.max_user_watches, which
+is per user and shared with editors, IDEs and dev servers, so the index never
+takes the watches they need.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import sqlite3
+import stat as stat_module
+import struct
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+KIND_FILE, KIND_DIR, KIND_SYMLINK, KIND_OTHER = 0, 1, 2, 3
+KIND_NAMES = {KIND_FILE: 'file', KIND_DIR: 'directory', KIND_SYMLINK: 'symlink', KIND_OTHER: 'other'}
+
+DEFAULT_EXCLUDE = ('.git', '__pycache__', '.cache', 'node_modules', '.venv', 'venv')
+RESCAN_INTERVAL_SECONDS = 6 * 3600      # safety net while inotify is keeping up
+POLL_RESCAN_INTERVAL_SECONDS = 15 * 60  # without inotify (or past the watch limit)
+COALESCE_SECONDS = 0.5
+COMMIT_EVERY_DIRS = 200
+# Share of the user's inotify watches the index may use, and an absolute cap
+WATCH_SHARE = 0.1
+MAX_WATCHES = 8192
+
+# inotify(7)
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class _Inotify:
+    """Minimal ctypes binding to the Linux inotify API"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+    @classmethod
+    def create(cls) -> Optional['_Inotify']:
+        if not os.path.isdir('/proc/sys/fs/inotify'):
+            return None
+        try:
+            return cls()
+        except (OSError, AttributeError, TypeError):
+            return None
+
+    def add_watch(self, path: str) -> int:
+        """Watch descriptor, or -errno on failure"""
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        return wd if wd >= 0 else -ctypes.get_errno()
+
+    def rm_watch(self, wd: int):
+        self._rm_watch(self.fd, wd)
+
+    def read(self, timeout: float) -> List[Tuple[int, int, str]]:
+        """(wd, mask, name) events available within timeout"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 256 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def default_max_watches() -> int:
+    """Watch budget: WATCH_SHARE of fs.inotify.max_user_watches, at most MAX_WATCHES"""
+    try:
+        with open('/proc/sys/fs/inotify/max_user_watches') as f:
+            system_limit = int(f.read())
+    except (OSError, ValueError):
+        return MAX_WATCHES
+    return min(MAX_WATCHES, int(system_limit * WATCH_SHARE))
+
+
+def _kind(mode: int) -> int:
+    if stat_module.S_ISREG(mode):
+        return KIND_FILE
+    if stat_module.S_ISDIR(mode):
+        return KIND_DIR
+    if stat_module.S_ISLNK(mode):
+        return KIND_SYMLINK
+    return KIND_OTHER
+
+
+def _subtree_bounds(path: str) -> Tuple[str, str]:
+    """Range over the sorted dirs.path column covering everything below path"""
+    prefix = path.rstrip('/') + '/'
+    return prefix, prefix[:-1] + '0'  # '0' sorts right after '/'
+
+
+def _like_pattern(pattern: str) -> str:
+    """Translate a glob (or a plain substring) into a LIKE pattern with '\\' escapes"""
+    escaped = pattern.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    if '*' in pattern or '?' in pattern:
+        return escaped.replace('*', '%').replace('?', '_')
+    return f"%{escaped}%"
+
+
+class FileIndex:
+    """Keeps an on-disk index of the files below a set of roots up to date on a background thread"""
+
+    def __init__(self, db_path: Path, roots: Iterable[str], exclude: Iterable[str] = DEFAULT_EXCLUDE,
+                 exclude_paths: Iterable[str] = (), use_inotify: bool = True,
+                 rescan_interval: float = RESCAN_INTERVAL_SECONDS,
+                 poll_rescan_interval: float = POLL_RESCAN_INTERVAL_SECONDS,
+                 max_watches: Optional[int] = None):
+        self.db_path = Path(db_path)
+        self.roots = [os.path.abspath(os.path.expanduser(r)) for r in roots]
+        self.exclude = set(exclude)
+        self.exclude_paths = {os.path.abspath(p) for p in exclude_paths}
+        self.use_inotify = use_inotify
+        self.rescan_interval = rescan_interval
+        self.poll_rescan_interval = poll_rescan_interval
+        self.max_watches = default_max_watches() if max_watches is None else max_watches
+
+        self.ready = threading.Event()
+        self.last_scan: Optional[str] = None
+        self.last_scan_seconds: Optional[float] = None
+        self.watch_limit_reached = False
+
+        self._inotify: Optional[_Inotify] = None
+        self._watches: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._rescan_requested = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._init_schema()
+
+        # An index left by a previous run is served while the startup scan reconciles it
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            if conn.execute('SELECT 1 FROM entries LIMIT 1').fetchone():
+                self.ready.set()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _init_schema(self):
+        with self._connect() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS dirs (
+                    id INTEGER PRIMARY KEY,
+                    path TEXT UNIQUE NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS entries (
+                    dir_id INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    kind INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime INTEGER NOT NULL,
+                    PRIMARY KEY (dir_id, name)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_entries_name ON entries(name COLLATE NOCASE);
+                CREATE INDEX IF NOT EXISTS idx_entries_size ON entries(size);
+                CREATE INDEX IF NOT EXISTS idx_entries_mtime ON entries(mtime);
+            ''')
+
+    # --- Lifecycle ---------------------------------------------------------
+
+    def start(self):
+        """Start the indexing thread; queries fall back to walking until the first scan is done"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='fs-index', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def request_rescan(self):
+        self._rescan_requested.set()
+
+    def _run(self):
+        if self.use_inotify:
+            self._inotify = _Inotify.create()
+        conn = self._connect()
+        try:
+            self._scan_all(conn)
+            self.ready.set()
+            next_rescan = time.monotonic() + self._rescan_interval()
+            while not self._stop.is_set():
+                if self._inotify is not None:
+                    events = self._inotify.read(timeout=1.0)
+                    if events:
+                        # Let a burst of changes (an unpack, a build) arrive before applying it
+                        time.sleep(COALESCE_SECONDS)
+                        events += self._inotify.read(timeout=0)
+                        self._apply_events(conn, events)
+                else:
+                    self._rescan_requested.wait(min(5.0, max(0.0, next_rescan - time.monotonic())))
+                if self._rescan_requested.is_set() or time.monotonic() >= next_rescan:
+                    self._rescan_requested.clear()
+                    self._scan_all(conn)
+                    next_rescan = time.monotonic() + self._rescan_interval()
+        except Exception as e:
+            logger.warning("Filesystem index stopped: %s", e)
+        finally:
+            conn.close()
+            if self._inotify is not None:
+                self._inotify.close()
+                self._inotify = None
+            self._watches.clear()
+
+    def _rescan_interval(self) -> float:
+        if self._inotify is not None and not self.watch_limit_reached:
+            return self.rescan_interval
+        return self.poll_rescan_interval
+
+    # --- Scanning ----------------------------------------------------------
+
+    def _excluded(self, name: str, path: str) -> bool:
+        return name in self.exclude or path in self.exclude_paths
+
+    def _dir_id(self, conn: sqlite3.Connection, path: str) -> int:
+        row = conn.execute('SELECT id FROM dirs WHERE path = ?', (path,)).fetchone()
+        if row:
+            return row[0]
+        return conn.execute('INSERT INTO dirs (path) VALUES (?)', (path,)).lastrowid
+
+    def _watch(self, path: str):
+        if self._inotify is None or self.watch_limit_reached:
+            return
+        if len(self._watches) >= self.max_watches:
+            self.watch_limit_reached = True
+            logger.info("Filesystem index: watch budget of %s used, falling back to periodic rescans "
+                        "(OSAGENT_FS_INDEX_WATCHES raises it)", self.max_watches)
+            return
+        wd = self._inotify.add_watch(path)
+        if wd >= 0:
+            self._watches[wd] = path
+        elif wd == -errno.ENOSPC:
+            self.watch_limit_reached = True
+            logger.warning("Filesystem index: inotify watch limit reached, falling back to periodic rescans "
+                           "(raise fs.inotify.max_user_watches to watch everything)")
+
+    def _scan_all(self, conn: sqlite3.Connection):
+        started = time.monotonic()
+        for root in self.roots:
+            if os.path.isdir(root):
+                self._scan_tree(conn, root)
+        # Roots that were removed from the configuration are dropped from the index
+        for (path,) in conn.execute('SELECT path FROM dirs').fetchall():
+            if not any(path == r or path.startswith(r.rstrip('/') + '/') for r in self.roots):
+                conn.execute('DELETE FROM entries WHERE dir_id = (SELECT id FROM dirs WHERE path = ?)', (path,))
+                conn.execute('DELETE FROM dirs WHERE path = ?', (path,))
+        conn.commit()
+        self.last_scan = datetime.now().isoformat()
+        self.last_scan_seconds = round(time.monotonic() - started, 3)
+
+    def _scan_tree(self, conn: sqlite3.Connection, root: str):
+        """Bring the index for root and everything below it in line with the disk, writing only changes"""
+        try:
+            root_dev = os.stat(root).st_dev
+        except OSError:
+            return
+        stack = [root]
+        scanned = 0
+        while stack and not self._stop.is_set():
+            path = stack.pop()
+            try:
+                with os.scandir(path) as it:
+                    children = list(it)
+            except OSError:
+                continue
+            self._watch(path)
+            dir_id = self._dir_id(conn, path)
+            existing = {name: (kind, size, mtime) for name, kind, size, mtime in conn.execute(
+                'SELECT name, kind, size, mtime FROM entries WHERE dir_id = ?', (dir_id,))}
+
+            seen: Set[str] = set()
+            for entry in children:
+                if self._excluded(entry.name, entry.path):
+                    continue
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                kind = _kind(st.st_mode)
+                row = (kind, st.st_size if kind != KIND_DIR else 0, int(st.st_mtime))
+                seen.add(entry.name)
+                if existing.get(entry.name) != row:
+                    conn.execute('INSERT OR REPLACE INTO entries (dir_id, name, kind, size, mtime) VALUES (?, ?, ?, ?, ?)',
+                                 (dir_id, entry.name, *row))
+                # Stay on one filesystem, like find -xdev
+                if kind == KIND_DIR and st.st_dev == root_dev:
+                    stack.append(entry.path)
+
+            for name in existing.keys() - seen:
+                self._remove(conn, path, name)
+
+            scanned += 1
+            if scanned % COMMIT_EVERY_DIRS == 0:
+                conn.commit()
+        conn.commit()
+
+    def _remove(self, conn: sqlite3.Connection, parent: str, name: str):
+        """Drop an entry and, for a directory, everything indexed below it"""
+        conn.execute('DELETE FROM entries WHERE dir_id = (SELECT id FROM dirs WHERE path = ?) AND name = ?',
+                     (parent, name))
+        path = os.path.join(parent, name)
+        low, high = _subtree_bounds(path)
+        conn.execute('DELETE FROM entries WHERE dir_id IN (SELECT id FROM dirs WHERE path = ? OR (path >= ? AND path < ?))',
+                     (path, low, high))
+        conn.execute('DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)', (path, low, high))
+        for wd, watched in list(self._watches.items()):
+            if watched == path or watched.startswith(low):
+                self._watches.pop(wd)
+                if self._inotify is not None:
+                    self._inotify.rm_watch(wd)
+
+    def _apply_events(self, conn: sqlite3.Connection, events: List[Tuple[int, int, str]]):
+        changed: Dict[str, int] = {}
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped; only a rescan can tell what changed
+                self._rescan_requested.set()
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            base = self._watches.get(wd)
+            if base is None or not name:
+                continue
+            path = os.path.join(base, name)
+            changed[path] = changed.get(path, 0) | mask
+
+        for path, mask in changed.items():
+            parent, name = os.path.split(path)
+            if self._excluded(name, path):
+                continue
+            try:
+                st = os.lstat(path)
+            except OSError:
+                self._remove(conn, parent, name)
+                continue
+            kind = _kind(st.st_mode)
+            appeared = kind == KIND_DIR and mask & (IN_CREATE | IN_MOVED_TO)
+            if appeared:
+                # Whatever was indexed under this path before belongs to a different directory
+                self._remove(conn, parent, name)
+            conn.execute('INSERT OR REPLACE INTO entries (dir_id, name, kind, size, mtime) VALUES (?, ?, ?, ?, ?)',
+                         (self._dir_id(conn, parent), name, kind, st.st_size if kind != KIND_DIR else 0,
+                          int(st.st_mtime)))
+            if appeared:
+                self._scan_tree(conn, path)
+        conn.commit()
+
+    # --- Queries -----------------------------------------------------------
+
+    def covers(self, path: str) -> bool:
+        """Whether queries below path can be answered from the index"""
+        path = os.path.abspath(os.path.expanduser(path))
+        return self.ready.is_set() and any(path == r or path.startswith(r.rstrip('/') + '/') for r in self.roots)
+
+    def _query(self, where: str, params: List[Any], order: str, limit: int, under: Optional[str],
+               kind: Optional[str], order_params: Iterable[Any] = (), source: str = 'entries e') -> List[Dict[str, Any]]:
+        clauses = [where] if where else []
+        if under:
+            under = os.path.abspath(os.path.expanduser(under))
+            low, high = _subtree_bounds(under)
+            clauses.append('(d.path = ? OR (d.path >= ? AND d.path < ?))')
+            params += [under, low, high]
+        if kind:
+            codes = [code for code, label in KIND_NAMES.items() if label == kind or (kind == 'dir' and code == KIND_DIR)]
+            clauses.append(f"e.kind = {codes[0] if codes else -1}")
+        sql = f'''
+            SELECT d.path, e.name, e.kind, e.size, e.mtime
+            FROM {source} JOIN dirs d ON d.id = e.dir_id
+            {'WHERE ' + ' AND '.join(clauses) if clauses else ''}
+            ORDER BY {order} LIMIT ?
+        '''
+        params += [*order_params, max(1, limit)]
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [{
+            'name': name,
+            'path': os.path.join(directory, name),
+            'type': KIND_NAMES[code],
+            'size': size,
+            'modified': datetime.fromtimestamp(mtime).isoformat()
+        } for directory, name, code, size, mtime in rows]
+
+    def find(self, pattern: str, limit: int = 50, under: Optional[str] = None,
+             kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Entries whose name matches a glob, or contains a substring (case-insensitive)"""
+        # Names are matched on the covering NOCASE index alone (a range seek for prefix patterns)
+        # and only the matches are joined back to their rows. Exact names come first, then
+        # shallower paths, then the most recently modified
+        source = '''(SELECT dir_id, name FROM entries INDEXED BY idx_entries_name WHERE name LIKE ? ESCAPE '\\') m
+                    JOIN entries e ON e.dir_id = m.dir_id AND e.name = m.name'''
+        return self._query('', [_like_pattern(pattern)], 'lower(e.name) = ? DESC, length(d.path), e.mtime DESC',
+                           limit, under, kind, order_params=[pattern.lower()], source=source)
+
+    def largest(self, limit: int = 20, under: Optional[str] = None, kind: Optional[str] = 'file') -> List[Dict[str, Any]]:
+        return self._query('', [], 'e.size DESC', limit, under, kind)
+
+    def recent(self, limit: int = 20, under: Optional[str] = None, kind: Optional[str] = 'file',
+               since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Most recently modified entries, optionally only those modified after `since` (epoch seconds)"""
+        where, params = ('e.mtime >= ?', [int(since)]) if since else ('', [])
+        return self._query(where, params, 'e.mtime DESC', limit, under, kind)
+
+    def stats(self) -> Dict[str, Any]:
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            entries = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+            dirs = conn.execute('SELECT COUNT(*) FROM dirs').fetchone()[0]
+        return {
+            'roots': self.roots,
+            'ready': self.ready.is_set(),
+            'entries': entries,
+            'directories': dirs,
+            'mode': 'inotify' if self._inotify is not None and not self.watch_limit_reached else 'rescan',
+            'watches': len(self._watches),
+            'max_watches': self.max_watches,
+            'last_scan': self.last_scan,
+            'last_scan_seconds': self.last_scan_seconds,
+            'db_bytes': self.db_path.stat().st_size if self.db_path.exists() else 0
+        }
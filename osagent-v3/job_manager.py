@@ -0,0 +1,487 @@
+"""
+Background jobs for long-running commands.
+Commands expected to run long are queued as jobs instead of running on the
+request path, and the request returns straight away with the job ID. A
+command counts as long-running when:
+- the planner flags it "background";
+- it matches a known long-running command (package installs, builds, rsync);
+- its template has typically taken longer than LONG_RUNNING_SECONDS.
+
+A fixed number of worker threads run queued jobs at background priority,
+each writing stdout and stderr to its own log under agent_memory/jobs. A
+log can be read in pages or followed live while the job runs.
+
+Later commands of a plan that started a job may depend on it ("pip install x"
+then "python -c 'import x'"), so they are queued as jobs that wait for it
+("waiting") and start only once it has succeeded. If it fails or is
+cancelled, they are cancelled too.
+
+Job state lives in the jobs table of agent_memory.db, so the job list
+survives restarts. On startup, jobs that were running when the agent exited
+are marked "lost". Queued ones are marked "cancelled" rather than re-run
+unattended.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import shlex
+import signal
+import sqlite3
+import subprocess
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from command_timeouts import command_template
+from sandbox import ChildWaiter, usage_from_counters, usage_from_rusage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT = 2
+DEFAULT_RETENTION_DAYS = 7
+LONG_RUNNING_SECONDS = 30.0
+CANCEL_GRACE_SECONDS = 5.0
+LOG_PAGE_BYTES = 64 * 1024
+FINAL_STATUSES = ('succeeded', 'failed', 'cancelled', 'lost')
+
+# Templates (see command_timeouts.command_template) that are long-running on first sight
+LONG_RUNNING_TEMPLATES = {
+    'apt install', 'apt upgrade', 'apt full-upgrade', 'apt-get install', 'apt-get upgrade',
+    'apt-get dist-upgrade', 'dnf install', 'dnf upgrade', 'yum install', 'yum update',
+    'zypper install', 'zypper update', 'brew install', 'brew upgrade', 'snap install',
+    'pip install', 'pip3 install', 'npm install', 'npm ci', 'yarn install', 'pnpm install',
+    'cargo build', 'cargo install', 'go build', 'mvn install', 'mvn package', 'gradle build',
+    'docker build', 'docker pull', 'podman build', 'podman pull', 'conda install', 'conda update',
+}
+LONG_RUNNING_PROGRAMS = {'make', 'ninja', 'rsync', 'dd', 'borg', 'restic', 'duplicity', 'wget'}
+# pacman -S/-U letters that only query (search, info, list, groups, print)
+_PACMAN_QUERY_LETTERS = set('silgp')
+_PACMAN_QUERY_OPTIONS = {'--search', '--info', '--list', '--groups', '--print'}
+
+
+def _pacman_installs(command: str) -> bool:
+    """pacman -S (sync/install/upgrade) or -U; not queries such as -Q, -Ss or -Si"""
+    if command_template(command) != 'pacman':
+        return False
+    try:
+        tokens = shlex.split(command)
+    except ValueError:
+        return False
+    if _PACMAN_QUERY_OPTIONS.intersection(tokens):
+        return False
+    for token in tokens:
+        if token in ('--sync', '--upgrade'):
+            return True
+        if token.startswith('-') and not token.startswith('--') and token[1:2] in ('S', 'U'):
+            return not _PACMAN_QUERY_LETTERS.intersection(token[2:])
+    return False
+
+
+@dataclass
+class Job:
+    job_id: str
+    command: str
+    session_id: str
+    cwd: str
+    log_path: str
+    status: str = 'queued'
+    created: str = field(default_factory=lambda: datetime.now().isoformat())
+    started: Optional[str] = None
+    finished: Optional[str] = None
+    returncode: Optional[int] = None
+    pid: Optional[int] = None
+    resources: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    # Job that has to succeed before this one starts
+    after_job: Optional[str] = None
+    # Runtime only, never persisted
+    process: Optional[subprocess.Popen] = field(default=None, repr=False)
+    cancel_requested: bool = False
+
+    COLUMNS = ('job_id', 'command', 'session_id', 'cwd', 'log_path', 'status', 'created', 'started',
+               'finished', 'returncode', 'pid', 'resources', 'error', 'after_job')
+
+    def row(self) -> tuple:
+        return tuple(json.dumps(self.resources) if name == 'resources' and self.resources is not None
+                     else getattr(self, name) for name in self.COLUMNS)
+
+    @classmethod
+    def from_row(cls, row: tuple) -> 'Job':
+        values = dict(zip(cls.COLUMNS, row))
+        if values['resources']:
+            values['resources'] = json.loads(values['resources'])
+        return cls(**values)
+
+    def as_dict(self) -> Dict[str, Any]:
+        result = {name: getattr(self, name) for name in self.COLUMNS if name != 'log_path'}
+        result['log_bytes'] = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        return result
+
+
+class JobManager:
+    """Queue, workers and persisted state for background jobs"""
+
+    def __init__(self, agent, db_path: Path, log_dir: Path, max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+                 retention_days: float = DEFAULT_RETENTION_DAYS, recover: bool = True):
+        self.agent = agent
+        self.db_path = db_path
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.max_concurrent = max_concurrent
+        self.retention_days = retention_days
+        # Queued and running jobs; finished ones are only in the database
+        self._active: Dict[str, Job] = {}
+        # job ID -> IDs of waiting jobs to release when it finishes
+        self._dependents: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+        self._queue: 'queue.Queue[str]' = queue.Queue()
+        self._workers: List[threading.Thread] = []
+
+        if recover:
+            with sqlite3.connect(self.db_path) as conn:
+                self._recover(conn)
+
+    @staticmethod
+    def init_schema(conn: sqlite3.Connection):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                command TEXT,
+                session_id TEXT,
+                cwd TEXT,
+                log_path TEXT,
+                status TEXT,
+                created TEXT,
+                started TEXT,
+                finished TEXT,
+                returncode INTEGER,
+                pid INTEGER,
+                resources TEXT,
+                error TEXT,
+                after_job TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created)')
+        if 'after_job' not in {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}:
+            conn.execute('ALTER TABLE jobs ADD COLUMN after_job TEXT')
+
+    def _recover(self, conn: sqlite3.Connection):
+        """Settle jobs left unfinished by a previous process"""
+        now = datetime.now().isoformat()
+        lost = conn.execute('''
+            UPDATE jobs SET status = 'lost', finished = ?,
+                   error = 'The agent exited while the job was running; its process may still be running'
+            WHERE status = 'running'
+        ''', (now,)).rowcount
+        dropped = conn.execute('''
+            UPDATE jobs SET status = 'cancelled', finished = ?, error = 'The agent exited before the job started'
+            WHERE status IN ('queued', 'waiting')
+        ''', (now,)).rowcount
+        conn.commit()
+        if lost or dropped:
+            logger.warning("Jobs from a previous run: %s lost while running, %s cancelled while queued", lost, dropped)
+
+    # --- Classification ----------------------------------------------------
+
+    def is_long_running(self, command: str, spec: Optional[Dict[str, Any]] = None) -> bool:
+        if spec and spec.get('background'):
+            return True
+        template = command_template(command)
+        if template in LONG_RUNNING_TEMPLATES or template.split(' ', 1)[0] in LONG_RUNNING_PROGRAMS:
+            return True
+        if _pacman_installs(command):
+            return True
+        typical = self.agent.memory.timings.typical(command)
+        return typical is not None and typical > LONG_RUNNING_SECONDS
+
+    # --- Submission and control --------------------------------------------
+
+    def submit(self, command: str, cwd: Optional[str] = None, after_job: Optional[str] = None) -> Job:
+        """Queue a command, or with after_job hold it until that job has succeeded"""
+        job_id = uuid.uuid4().hex[:12]
+        job = Job(job_id, command, self.agent.memory.session_id, cwd or os.getcwd(),
+                  str(self.log_dir / f"{job_id}.log"), after_job=after_job)
+        with self._lock:
+            waiting = after_job is not None and after_job in self._active
+            if waiting:
+                job.status = 'waiting'
+                self._dependents.setdefault(after_job, []).append(job_id)
+            self._active[job_id] = job
+            self._ensure_workers()
+        self._save(job)
+        if waiting:
+            logger.info("Job %s waits for job %s: %s", job_id, after_job, command)
+            return job
+        dependency = self.get(after_job) if after_job is not None else None
+        if dependency is not None and dependency.status != 'succeeded':
+            self._cancel_dependent(job, dependency)
+            return job
+        self._queue.put(job_id)
+        logger.info("Queued job %s: %s", job_id, command)
+        return job
+
+    def _release(self, job: Job):
+        """Queue the jobs waiting for a finished job, or cancel them if it did not succeed"""
+        with self._lock:
+            dependents = [self._active.get(job_id) for job_id in self._dependents.pop(job.job_id, [])]
+        for dependent in dependents:
+            if dependent is None or dependent.cancel_requested:
+                continue
+            if job.status == 'succeeded':
+                dependent.status = 'queued'
+                self._save(dependent)
+                self._queue.put(dependent.job_id)
+            else:
+                self._cancel_dependent(dependent, job)
+
+    def _cancel_dependent(self, job: Job, dependency: Job):
+        with self._lock:
+            self._active.pop(job.job_id, None)
+        job.status = 'cancelled'
+        job.error = f"Not run: job {dependency.job_id}, which it waited for, ended as {dependency.status}"
+        job.finished = datetime.now().isoformat()
+        self._save(job)
+        # Whatever waited for this one cannot run either
+        self._release(job)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued job, or terminate a running one (SIGKILL after a grace period)"""
+        with self._lock:
+            job = self._active.get(job_id)
+            if job is None:
+                return self.get(job_id)
+            job.cancel_requested = True
+            process = job.process
+            if process is None:
+                # Still queued: the worker skips it when it comes up
+                self._active.pop(job_id)
+                job.status = 'cancelled'
+                job.finished = datetime.now().isoformat()
+        if process is None:
+            self._save(job)
+            self._release(job)
+            return job
+        self._signal(process, signal.SIGTERM)
+        timer = threading.Timer(CANCEL_GRACE_SECONDS, self._signal, args=(process, signal.SIGKILL))
+        timer.daemon = True
+        timer.start()
+        return job
+
+    def _signal(self, process: subprocess.Popen, signum: int):
+        if process.returncode is not None:
+            return
+        try:
+            if self.agent.is_windows:
+                process.kill()
+            else:
+                # Jobs run in their own session, so this reaches everything they started
+                os.killpg(process.pid, signum)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def shutdown(self):
+        """Stop taking jobs and terminate running ones"""
+        with self._lock:
+            running = [job.process for job in self._active.values() if job.process is not None]
+        for process in running:
+            self._signal(process, signal.SIGTERM)
+        for _ in self._workers:
+            self._queue.put(None)
+
+    # --- Workers -----------------------------------------------------------
+
+    def _ensure_workers(self):
+        while len(self._workers) < self.max_concurrent:
+            worker = threading.Thread(target=self._work, name=f'job-worker-{len(self._workers)}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            with self._lock:
+                job = self._active.get(job_id)
+            if job is None or job.cancel_requested:
+                continue
+            try:
+                self._run(job)
+            except Exception as e:
+                logger.error("Job %s failed to run: %s", job_id, e, exc_info=True)
+                job.status, job.error = 'failed', str(e)
+                job.finished = datetime.now().isoformat()
+                self._save(job)
+            finally:
+                with self._lock:
+                    self._active.pop(job_id, None)
+                if self.agent.result_cache is not None:
+                    # Whatever the job changed, cached disk and memory figures predate it
+                    self.agent.result_cache.invalidate()
+                self._release(job)
+
+    def _run(self, job: Job):
+        slot = self.agent.sandbox.slot(job.session_id, background=True)
+        before = slot.counters() if slot is not None else {}
+        started = time.monotonic()
+        with open(job.log_path, 'ab') as log:
+            start = lambda: subprocess.Popen(
+                slot.wrap(job.command) if slot is not None else job.command,
+                shell=True,
+                cwd=job.cwd if os.path.isdir(job.cwd) else None,
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=not self.agent.is_windows
+            )
+            process = slot.spawn(start) if slot is not None else start()
+
+        with self._lock:
+            job.process = process
+            job.pid = process.pid
+            job.status = 'running'
+            job.started = datetime.now().isoformat()
+            cancelled_early = job.cancel_requested
+        self._save(job)
+        if cancelled_early:
+            self._signal(process, signal.SIGKILL)
+
+        waiter = ChildWaiter(process)
+        try:
+            while not waiter(3600):
+                pass
+        finally:
+            waiter.close()
+            counters = slot.counters() if slot is not None else {}
+            if slot is not None:
+                slot.close()
+
+        duration = time.monotonic() - started
+        usage = usage_from_rusage(waiter.rusage) if waiter.rusage is not None else {}
+        usage.update(usage_from_counters(before, counters))
+        usage['elapsed_s'] = round(duration, 3)
+
+        job.returncode = process.returncode
+        job.resources = usage
+        job.finished = datetime.now().isoformat()
+        if job.cancel_requested:
+            job.status = 'cancelled'
+        else:
+            job.status = 'succeeded' if process.returncode == 0 else 'failed'
+            # Feeds the learned runtimes, which also decide what runs as a job next time
+            self.agent.memory.store_command_history(job.command, process.returncode == 0, "job", duration=duration)
+        self._save(job)
+        logger.info("Job %s %s (exit %s) after %.1fs", job.job_id, job.status, job.returncode, duration)
+
+    # --- State -------------------------------------------------------------
+
+    def _save(self, job: Job):
+        placeholders = ', '.join('?' for _ in Job.COLUMNS)
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            conn.execute(f"INSERT OR REPLACE INTO jobs ({', '.join(Job.COLUMNS)}) VALUES ({placeholders})",
+                         job.row())
+            conn.commit()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._active.get(job_id)
+        if job is not None:
+            return job
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(f"SELECT {', '.join(Job.COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        query = f"SELECT {', '.join(Job.COLUMNS)} FROM jobs"
+        params: tuple = ()
+        if status:
+            query += " WHERE status = ?"
+            params = (status,)
+        query += " ORDER BY created DESC LIMIT ?"
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute(query, params + (limit,)).fetchall()
+        with self._lock:
+            active = dict(self._active)
+        # Rows of active jobs can lag a transition by a moment; the in-memory job is current
+        return [(active.get(row[0]) or Job.from_row(row)).as_dict() for row in rows]
+
+    def read_log(self, job_id: str, offset: int = 0, limit: int = LOG_PAGE_BYTES) -> Optional[Dict[str, Any]]:
+        job = self.get(job_id)
+        if job is None:
+            return None
+        data = b''
+        size = 0
+        if os.path.exists(job.log_path):
+            with open(job.log_path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                f.seek(max(0, offset))
+                data = f.read(max(0, min(limit, LOG_PAGE_BYTES * 16)))
+        next_offset = max(0, offset) + len(data)
+        return {
+            'job_id': job_id,
+            'status': job.status,
+            'offset': offset,
+            'next_offset': next_offset,
+            'total_bytes': size,
+            'eof': next_offset >= size and job.status in FINAL_STATUSES,
+            'text': data.decode('utf-8', errors='replace')
+        }
+
+    async def follow(self, job_id: str, offset: int = 0, poll_seconds: float = 0.25) -> AsyncIterator[bytes]:
+        """Log bytes from offset onwards, as they are written, until the job has finished"""
+        job = self.get(job_id)
+        if job is None:
+            return
+        while True:
+            page = await asyncio.to_thread(self._read_bytes, job.log_path, offset)
+            if page:
+                offset += len(page)
+                yield page
+                continue
+            with self._lock:
+                running = job_id in self._active
+            if not running:
+                # One last read: the job may have written its final output before finishing
+                page = await asyncio.to_thread(self._read_bytes, job.log_path, offset)
+                if page:
+                    yield page
+                return
+            await asyncio.sleep(poll_seconds)
+
+    @staticmethod
+    def _read_bytes(path: str, offset: int) -> bytes:
+        try:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                return f.read(LOG_PAGE_BYTES)
+        except FileNotFoundError:
+            return b''
+
+    def prune(self):
+        """Retention task: forget finished jobs older than the retention period, with their logs"""
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            rows = conn.execute(
+                f"SELECT job_id, log_path FROM jobs WHERE finished < ? AND status IN ({', '.join('?' * len(FINAL_STATUSES))})",
+                (cutoff,) + FINAL_STATUSES
+            ).fetchall()
+            conn.executemany('DELETE FROM jobs WHERE job_id = ?', [(job_id,) for job_id, _ in rows])
+            conn.commit()
+        for _, log_path in rows:
+            try:
+                os.unlink(log_path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = [job.status for job in self._active.values()]
+        return {'running': statuses.count('running'), 'queued': statuses.count('queued'),
+                'waiting': statuses.count('waiting'), 'max_concurrent': self.max_concurrent}
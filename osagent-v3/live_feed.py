@@ -0,0 +1,192 @@
+"""
+Live system metrics pushed to dashboard viewers.
+One sampler task per server reads the system once per interval, diffs each
+channel (cpu, memory, disk, network, processes) against the previous version
+and serializes the delta once. Every viewer is sent the same bytes, so the
+cost of a tick does not grow with the number of viewers. A viewer that falls
+behind is not sent a backlog of deltas: it skips to a full snapshot of the
+latest version, serialized at most once per version however many viewers need
+it. The sampler only runs while some viewer is subscribed to a channel;
+viewers that are connected but subscribed to nothing cost nothing.
+
+Messages: {"channel", "type": "snapshot" | "delta", "version", "data"}; a delta's
+data is {"set": {key: value}, "del": [key, ...]} against the previous version.
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import psutil
+
+CHANNELS = ('cpu', 'memory', 'disk', 'network', 'processes')
+DEFAULT_INTERVAL = 2.0
+DEFAULT_TOP_PROCESSES = 10
+
+
+_MISSING = object()
+
+
+def _diff(old: Dict[str, Any], new: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    changed = {k: v for k, v in new.items() if old.get(k, _MISSING) != v}
+    removed = [k for k in old if k not in new]
+    if not changed and not removed:
+        return None
+    return {'set': changed, 'del': removed}
+
+
+class _Channel:
+    __slots__ = ('name', 'state', 'version', 'delta', 'snapshot')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state: Dict[str, Any] = {}
+        self.version = 0
+        self.delta: Optional[str] = None      # serialized delta from version - 1
+        self.snapshot: Optional[str] = None   # serialized full state, built on first demand
+
+    def update(self, state: Dict[str, Any]) -> bool:
+        delta = _diff(self.state, state)
+        if delta is None:
+            return False
+        self.version += 1
+        self.state = state
+        self.delta = json.dumps({'channel': self.name, 'type': 'delta', 'version': self.version, 'data': delta},
+                                separators=(',', ':'))
+        self.snapshot = None
+        return True
+
+    def full(self) -> str:
+        if self.snapshot is None:
+            self.snapshot = json.dumps({'channel': self.name, 'type': 'snapshot', 'version': self.version,
+                                        'data': self.state}, separators=(',', ':'))
+        return self.snapshot
+
+
+class Viewer:
+    """One connection's subscriptions and the version of each channel it has been sent"""
+
+    def __init__(self):
+        self.channels: Set[str] = set()
+        self.sent: Dict[str, int] = {}
+        self.wakeup = asyncio.Event()
+
+    def subscribe(self, channels: List[str]):
+        for name in channels:
+            if name in CHANNELS and name not in self.channels:
+                self.channels.add(name)
+                self.sent[name] = -1  # forces a snapshot first
+        self.wakeup.set()
+
+    def unsubscribe(self, channels: List[str]):
+        for name in channels:
+            self.channels.discard(name)
+            self.sent.pop(name, None)
+
+
+class LiveFeed:
+    """Shared sampler and fan-out for dashboard connections"""
+
+    def __init__(self, agent, interval: float = DEFAULT_INTERVAL, top_processes: int = DEFAULT_TOP_PROCESSES):
+        self.agent = agent
+        self.interval = interval
+        self.top_processes = top_processes
+        self.channels = {name: _Channel(name) for name in CHANNELS}
+        self.viewers: Set[Viewer] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._net_previous: Optional[Tuple[float, Any]] = None
+
+    # --- Viewers -----------------------------------------------------------
+
+    def join(self) -> Viewer:
+        viewer = Viewer()
+        self.viewers.add(viewer)
+        return viewer
+
+    def subscribe(self, viewer: Viewer, channels: List[str]):
+        viewer.subscribe(channels)
+        if viewer.channels and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    def unsubscribe(self, viewer: Viewer, channels: List[str]):
+        viewer.unsubscribe(channels)
+        if not self._subscribed():
+            self._stop()
+
+    def leave(self, viewer: Viewer):
+        self.viewers.discard(viewer)
+        if not self._subscribed():
+            self._stop()
+
+    def _subscribed(self) -> bool:
+        return any(viewer.channels for viewer in self.viewers)
+
+    def _stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._net_previous = None
+
+    def pending_messages(self, viewer: Viewer) -> List[str]:
+        """What this viewer has not been sent yet: the shared delta if it is one version
+        behind, otherwise the shared snapshot"""
+        messages = []
+        for name in viewer.channels:
+            channel = self.channels[name]
+            sent = viewer.sent.get(name, -1)
+            if channel.version == 0 or sent == channel.version:
+                continue
+            messages.append(channel.delta if sent == channel.version - 1 else channel.full())
+            viewer.sent[name] = channel.version
+        return messages
+
+    # --- Sampling ----------------------------------------------------------
+
+    async def _run(self):
+        while self._subscribed():
+            try:
+                states = await asyncio.to_thread(self._sample)
+            except Exception as e:
+                self.agent.logger.error("Live feed sample failed: %s", e)
+                states = {}
+            changed = [name for name, state in states.items() if self.channels[name].update(state)]
+            if changed:
+                for viewer in self.viewers:
+                    if viewer.channels.intersection(changed):
+                        viewer.wakeup.set()
+            await asyncio.sleep(self.interval)
+
+    def _sample(self) -> Dict[str, Dict[str, Any]]:
+        status = self.agent.status_snapshot()
+        if 'error' in status:
+            raise RuntimeError(status['error'])
+
+        cpu = {'percent': round(status['cpu_usage'], 1), 'count': psutil.cpu_count()}
+        if hasattr(os, 'getloadavg'):
+            cpu['load'] = [round(x, 2) for x in os.getloadavg()]
+
+        memory = dict(status['memory'])
+        memory['percentage'] = round(memory['percentage'], 1)
+        disk = dict(status['disk'])
+        disk['percentage'] = round(disk['percentage'], 1)
+
+        now = time.monotonic()
+        counters = psutil.net_io_counters()
+        network = {'interfaces': status['network_interfaces'],
+                   'bytes_sent': counters.bytes_sent, 'bytes_recv': counters.bytes_recv}
+        if self._net_previous is not None:
+            elapsed = now - self._net_previous[0]
+            before = self._net_previous[1]
+            if elapsed > 0:
+                network['send_rate'] = round((counters.bytes_sent - before.bytes_sent) / elapsed)
+                network['recv_rate'] = round((counters.bytes_recv - before.bytes_recv) / elapsed)
+        self._net_previous = (now, counters)
+
+        rows = self.agent.list_processes(limit=self.top_processes)
+        processes: Dict[str, Any] = {'order': [row['pid'] for row in rows]}
+        for row in rows:
+            processes[str(row['pid'])] = row
+
+        return {'cpu': cpu, 'memory': memory, 'disk': disk, 'network': network, 'processes': processes}
@@ -0,0 +1,198 @@
+"""
+Non-blocking logging for the OS Agent.
+Loggers on the request path only put the unformatted record on a bounded
+queue; a background listener formats and writes it. Message arguments are
+merged and records serialized (as JSON lines or the classic text format) on
+the listener thread, messages are capped in size there, and when the queue is
+full records are dropped and counted instead of blocking the caller.
+
+Structured events are logged with log_event(logger, 'name', key=value, ...)
+and become one JSON object each. Events below WARNING can be sampled per
+event name (OSAGENT_LOG_SAMPLE="execute=0.1,command=0.5").
+
+Configuration (environment):
+    OSAGENT_LOG_LEVEL      INFO
+    OSAGENT_LOG_FORMAT     json | text (default text)
+    OSAGENT_LOG_MAX_CHARS  4000
+    OSAGENT_LOG_SAMPLE     per-event sampling rates
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_MAX_CHARS = 4000
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_configured: Optional['_Pipeline'] = None
+_configure_lock = threading.Lock()
+
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields):
+    """Log a structured event; nothing is built unless the level is enabled"""
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={'event': event, 'fields': fields})
+
+
+def _parse_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, rate = item.partition('=')
+        try:
+            rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+class _SamplingFilter(logging.Filter):
+    """Keeps a fraction of each sampled event; warnings and errors are always kept"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rates.get(getattr(record, 'event', None) or record.name)
+        return rate is None or random.random() < rate
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener and never blocks"""
+
+    def __init__(self, log_queue: queue.SimpleQueue, maxsize: int):
+        super().__init__(log_queue)
+        self.maxsize = maxsize
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock handler formats here, on the caller's thread; the listener does it instead
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        # SimpleQueue's put is a single C call with no Condition to notify, unlike
+        # queue.Queue; the bound is enforced here instead
+        if self.queue.qsize() >= self.maxsize:
+            self.dropped += 1
+        else:
+            self.queue.put_nowait(record)
+
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return text[:limit] + f"... [{len(text) - limit} more chars]"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; structured events keep their fields as keys"""
+
+    def __init__(self, max_chars: int = DEFAULT_MAX_CHARS):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+        }
+        event = getattr(record, 'event', None)
+        if event is not None:
+            entry['event'] = event
+            for key, value in getattr(record, 'fields', {}).items():
+                entry[key] = _truncate(value, self.max_chars) if isinstance(value, str) else value
+        else:
+            entry['message'] = _truncate(record.getMessage(), self.max_chars)
+        if record.exc_info:
+            entry['exception'] = _truncate(self.formatException(record.exc_info), self.max_chars)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic '<time> - <level> - <message>' lines, size-capped"""
+
+    def __init__(self, max_chars: int = DEFAULT_MAX_CHARS):
+        super().__init__(TEXT_FORMAT)
+        self.max_chars = max_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = getattr(record, 'event', None)
+        if event is not None and not getattr(record, '_event_rendered', False):
+            fields = ' '.join(f"{k}={v}" for k, v in getattr(record, 'fields', {}).items())
+            record.msg = f"{event} {fields}".rstrip()
+            record.args = None
+            record._event_rendered = True
+        record.message = _truncate(record.getMessage(), self.max_chars)
+        return _truncate(super().format(record), self.max_chars * 2)
+
+
+class _Pipeline:
+    def __init__(self, handler: _DeferredQueueHandler, listener: logging.handlers.QueueListener):
+        self.handler = handler
+        self.listener = listener
+        self._stopped = False
+
+    def stop(self):
+        """Write out what is still queued and stop the listener thread"""
+        if not self._stopped:
+            self._stopped = True
+            self.listener.stop()
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None, stream=None,
+                      max_chars: Optional[int] = None, sample: Optional[str] = None,
+                      queue_size: int = DEFAULT_QUEUE_SIZE) -> _Pipeline:
+    """Route the root logger through the background pipeline (idempotent)"""
+    global _configured
+    with _configure_lock:
+        if _configured is not None:
+            return _configured
+
+        level = level or os.getenv('OSAGENT_LOG_LEVEL', 'INFO')
+        fmt = fmt or os.getenv('OSAGENT_LOG_FORMAT', 'text')
+        max_chars = max_chars or int(os.getenv('OSAGENT_LOG_MAX_CHARS', DEFAULT_MAX_CHARS))
+        rates = _parse_rates(sample if sample is not None else os.getenv('OSAGENT_LOG_SAMPLE', ''))
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(JsonFormatter(max_chars) if fmt == 'json' else TextFormatter(max_chars))
+
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        handler = _DeferredQueueHandler(log_queue, queue_size)
+        handler.addFilter(_SamplingFilter(rates))
+        listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+
+        # Neither format prints caller, thread or process fields, so skip collecting them
+        # for every record (the stack walk in findCaller is the costliest part)
+        logging._srcfile = None
+        logging.logThreads = False
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level.upper())
+        listener.start()
+
+        _configured = _Pipeline(handler, listener)
+        # Flush what is still queued when the process exits
+        atexit.register(_configured.stop)
+        return _configured
+
+
+def dropped_records() -> int:
+    """Records discarded because the queue was full"""
+    return _configured.handler.dropped if _configured is not None else 0
@@ -6,11 +6,11 @@ with memory that persists across sessions. Browser automation components removed
 """
 
 import os
+import re
 import sys
 import subprocess
 import platform
 import json
-import shutil
 import psutil
 import time
 import sqlite3
@@ -23,6 +23,28 @@ from dotenv import load_dotenv
 import hashlib
 import pickle
 import asyncio
+import threading
+import signal
+
+from output_capture import OutputStore, pump_stream, DEFAULT_PAGE_BYTES
+from payload_store import PayloadStore, LazyPayload, migrate_conversation_payloads
+from retention import RetentionScheduler, RetentionPolicy
+from context_assembler import ContextAssembler, SessionSummarizer, count_tokens, DEFAULT_TOKEN_BUDGET
+from process_table import ProcessSampler
+from shell_pool import ShellPool
+import file_engine
+from bulk_transfer import TransferManager
+from fs_index import FileIndex
+from du_cache import DirSizeCache
+from plan_store import PlanStore, PendingPlan, PlanStep
+from agent_loop import AgentLoop, READ_ONLY_FILE_OPERATIONS
+from batch_runner import BatchRunner
+from remote_hosts import HostPool
+from log_pipeline import configure_logging, log_event, dropped_records
+from command_timeouts import CommandTimings, Deadline
+from sandbox import Sandbox, ChildWaiter, usage_from_rusage, usage_from_counters
+from job_manager import JobManager, DEFAULT_MAX_CONCURRENT, FINAL_STATUSES
+from result_cache import ResultCache
 
 # Browser automation imports removed
 
@@ -32,12 +54,19 @@ import asyncio
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Memory of a worker daemon, apart from that of a coordinator started from the same directory
+WORKER_MEMORY_DIR = "agent_memory/worker"
+
 class MemoryManager:
     """Manages persistent memory for the OS Agent"""
 
-    def __init__(self, memory_dir: str = "agent_memory"):
+    def __init__(self, memory_dir: str = "agent_memory",
+                 retention_policies: Optional[Dict[str, RetentionPolicy]] = None,
+                 context_token_budget: int = DEFAULT_TOKEN_BUDGET):
         self.memory_dir = Path(memory_dir)
-        self.memory_dir.mkdir(exist_ok=True)
+        self.memory_dir.mkdir(parents=True, exist_ok=True)
 
         # Database file for structured memory
         self.db_path = self.memory_dir / "agent_memory.db"
@@ -45,15 +74,32 @@ class MemoryManager:
         # JSON file for quick access memory
         self.quick_memory_path = self.memory_dir / "quick_memory.json"
 
+        # Compressed, deduplicated storage for conversation payloads
+        self.payload_store = PayloadStore()
+
+        # Recent run times per command template, from which timeouts are derived
+        self.timings = CommandTimings(self.db_path)
+
         # Initialize database
         self._init_database()
 
         # Load quick memory
         self.quick_memory = self._load_quick_memory()
+        # Requests can finish on several threads at once (plan workers, batches)
+        self._quick_memory_lock = threading.Lock()
 
         # Session ID for current session
         self.session_id = self._generate_session_id()
 
+        # Prompt memory is assembled within a token budget; older sessions are
+        # summarized on the maintenance thread rather than on the request path
+        self.context_assembler = ContextAssembler(self, context_token_budget)
+        self.summarizer = SessionSummarizer(self)
+
+        # Background retention/compaction; started by the owner once it is ready
+        self.retention = RetentionScheduler(self.db_path, retention_policies)
+        self.retention.add_task(self.summarizer.run)
+
     def _generate_session_id(self) -> str:
         """Generate unique session ID"""
         timestamp = datetime.now().isoformat()
@@ -63,6 +109,9 @@ class MemoryManager:
         """Initialize SQLite database for memory storage"""
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
+            # Only takes effect on a new database file, before its first table; see retention.py
+            # for converting an existing one
+            cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
 
             # Conversations table
             cursor.execute('''
@@ -109,8 +158,81 @@ class MemoryManager:
                     context TEXT
                 )
             ''')
+
+            # Daily aggregates of command history rolled up by retention
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS command_stats (
+                    command TEXT,
+                    day TEXT,
+                    runs INTEGER,
+                    successes INTEGER,
+                    PRIMARY KEY (command, day)
+                )
+            ''')
+
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_system_facts_timestamp ON system_facts (timestamp)')
+
+            # Full-text index over facts so the prompt gets the relevant ones, not the first few
+            self.fts_enabled = self._init_fact_index(cursor)
+
+            # Rolling summaries of past sessions
+            SessionSummarizer.init_schema(conn)
+
+            # Blob table backing the conversation payload columns
+            PayloadStore.init_schema(conn)
+
+            CommandTimings.init_schema(conn)
+            JobManager.init_schema(conn)
             conn.commit()
 
+            # Convert rows written before payloads were compressed
+            stats = migrate_conversation_payloads(conn, self.payload_store)
+            if stats and stats['rows_migrated']:
+                logger.info("Migrated %s conversations to compressed payload storage", stats['rows_migrated'])
+
+    def _init_fact_index(self, cursor: sqlite3.Cursor) -> bool:
+        """Create the FTS5 index over system_facts, kept in sync by triggers"""
+        try:
+            exists = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'system_facts_fts'"
+            ).fetchone()
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS system_facts_fts USING fts5(
+                    fact_key, fact_value,
+                    content='system_facts', content_rowid='id',
+                    tokenize='porter unicode61'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            # SQLite built without FTS5: fall back to LIKE matching
+            logger.warning("Full-text fact search unavailable: %s", e)
+            return False
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_system_facts_ai AFTER INSERT ON system_facts BEGIN
+                INSERT INTO system_facts_fts (rowid, fact_key, fact_value)
+                VALUES (new.id, new.fact_key, new.fact_value);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_system_facts_ad AFTER DELETE ON system_facts BEGIN
+                INSERT INTO system_facts_fts (system_facts_fts, rowid, fact_key, fact_value)
+                VALUES ('delete', old.id, old.fact_key, old.fact_value);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_system_facts_au AFTER UPDATE ON system_facts BEGIN
+                INSERT INTO system_facts_fts (system_facts_fts, rowid, fact_key, fact_value)
+                VALUES ('delete', old.id, old.fact_key, old.fact_value);
+                INSERT INTO system_facts_fts (rowid, fact_key, fact_value)
+                VALUES (new.id, new.fact_key, new.fact_value);
+            END
+        ''')
+        if not exists:
+            # Index facts stored before the index existed
+            cursor.execute("INSERT INTO system_facts_fts (system_facts_fts) VALUES ('rebuild')")
+        return True
+
     def _load_quick_memory(self) -> Dict[str, Any]:
         """Load quick access memory from JSON"""
         if self.quick_memory_path.exists():
@@ -130,16 +252,24 @@ class MemoryManager:
     def _save_quick_memory(self):
         """Save quick access memory to JSON"""
         try:
-            with open(self.quick_memory_path, 'w') as f:
+            with self._quick_memory_lock, open(self.quick_memory_path, 'w') as f:
                 json.dump(self.quick_memory, f, indent=2)
         except Exception as e:
-            print(f"Warning: Could not save quick memory: {e}")
+            logger.warning("Could not save quick memory: %s", e)
 
     def store_conversation(self, user_request: str, agent_response: Dict[str, Any],
                           execution_results: List[Dict[str, Any]], system_state: Dict[str, Any]):
         """Store conversation in database"""
         try:
             with sqlite3.connect(self.db_path) as conn:
+                # Take the write lock up front so blob collection cannot run between
+                # the dedup check and the row that references the blob
+                conn.execute('BEGIN IMMEDIATE')
+                encoded = (
+                    self.payload_store.encode(conn, agent_response),
+                    self.payload_store.encode_list(conn, execution_results),
+                    self.payload_store.encode_system_state(conn, system_state)
+                )
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO conversations
@@ -148,17 +278,16 @@ class MemoryManager:
                 ''', (
                     self.session_id,
                     datetime.now().isoformat(),
-                    user_request,
-                    json.dumps(agent_response),
-                    json.dumps(execution_results),
-                    json.dumps(system_state)
-                ))
+                    user_request
+                ) + encoded)
+                self.payload_store.add_refs(conn, cursor.lastrowid, *encoded)
                 conn.commit()
         except Exception as e:
-            print(f"Warning: Could not store conversation: {e}")
+            logger.warning("Could not store conversation: %s", e)
 
-    def store_command_history(self, command: str, success: bool, context: str = ""):
-        """Store command execution history"""
+    def store_command_history(self, command: str, success: bool, context: str = "",
+                              duration: Optional[float] = None):
+        """Store command execution history (and, when given, how long the command ran)"""
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
@@ -166,6 +295,8 @@ class MemoryManager:
                     INSERT INTO command_history (command, success, timestamp, session_id, context)
                     VALUES (?, ?, ?, ?, ?)
                 ''', (command, success, datetime.now().isoformat(), self.session_id, context))
+                if duration is not None:
+                    self.timings.record(conn, command, duration)
                 conn.commit()
 
             # Update quick memory for frequent commands
@@ -176,23 +307,30 @@ class MemoryManager:
                 self.quick_memory['frequent_commands'][cmd_key] = 1
 
         except Exception as e:
-            print(f"Warning: Could not store command history: {e}")
+            logger.warning("Could not store command history: %s", e)
 
     def store_system_fact(self, fact_key: str, fact_value: str):
         """Store learned system fact"""
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
+                # Upsert rather than INSERT OR REPLACE: REPLACE deletes without firing the
+                # delete trigger, which would leave stale entries in the full-text index
                 cursor.execute('''
-                    INSERT OR REPLACE INTO system_facts (fact_key, fact_value, timestamp, session_id)
+                    INSERT INTO system_facts (fact_key, fact_value, timestamp, session_id)
                     VALUES (?, ?, ?, ?)
+                    ON CONFLICT(fact_key) DO UPDATE SET
+                        fact_value = excluded.fact_value,
+                        timestamp = excluded.timestamp,
+                        session_id = excluded.session_id
                 ''', (fact_key, fact_value, datetime.now().isoformat(), self.session_id))
                 conn.commit()
         except Exception as e:
-            print(f"Warning: Could not store system fact: {e}")
+            logger.warning("Could not store system fact: %s", e)
 
     def get_recent_conversations(self, limit: int = 5) -> List[Dict[str, Any]]:
-        """Get recent conversations for context"""
+        """Get recent conversations for context; agent_response is decoded on first access, so
+        turns the context budget leaves out are never decompressed"""
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
@@ -205,18 +343,15 @@ class MemoryManager:
 
                 conversations = []
                 for row in cursor.fetchall():
-                    try:
-                        conversations.append({
-                            'user_request': row[0],
-                            'agent_response': json.loads(row[1]),
-                            'timestamp': row[2]
-                        })
-                    except json.JSONDecodeError:
-                        continue
+                    conversations.append({
+                        'user_request': row[0],
+                        'agent_response': LazyPayload(self.db_path, self.payload_store, row[1]),
+                        'timestamp': row[2]
+                    })
 
                 return conversations
         except Exception as e:
-            print(f"Warning: Could not retrieve conversations: {e}")
+            logger.warning("Could not retrieve conversations: %s", e)
             return []
 
     def get_command_patterns(self) -> Dict[str, Any]:
@@ -224,10 +359,18 @@ class MemoryManager:
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
+                # Live history plus the aggregates of history that retention has rolled up
                 cursor.execute('''
-                    SELECT command, COUNT(*) as frequency,
-                           AVG(CASE WHEN success THEN 1 ELSE 0 END) as success_rate
-                    FROM command_history
+                    SELECT command, SUM(runs) as frequency,
+                           CAST(SUM(successes) AS REAL) / SUM(runs) as success_rate
+                    FROM (
+                        SELECT command, COUNT(*) as runs,
+                               SUM(CASE WHEN success THEN 1 ELSE 0 END) as successes
+                        FROM command_history
+                        GROUP BY command
+                        UNION ALL
+                        SELECT command, runs, successes FROM command_stats
+                    )
                     GROUP BY command
                     ORDER BY frequency DESC
                     LIMIT 10
@@ -241,7 +384,7 @@ class MemoryManager:
                     }
                 return patterns
         except Exception as e:
-            print(f"Warning: Could not retrieve command patterns: {e}")
+            logger.warning("Could not retrieve command patterns: %s", e)
             return {}
 
     def get_system_facts(self) -> Dict[str, str]:
@@ -252,85 +395,197 @@ class MemoryManager:
                 cursor.execute('SELECT fact_key, fact_value FROM system_facts')
                 return {row[0]: row[1] for row in cursor.fetchall()}
         except Exception as e:
-            print(f"Warning: Could not retrieve system facts: {e}")
+            logger.warning("Could not retrieve system facts: %s", e)
             return {}
 
-    def get_memory_context(self) -> str:
+    def count_conversations(self) -> int:
+        """Number of stored conversations"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                return conn.execute('SELECT COUNT(*) FROM conversations').fetchone()[0]
+        except Exception as e:
+            logger.warning("Could not count conversations: %s", e)
+            return 0
+
+    def count_system_facts(self) -> int:
+        """Number of stored system facts"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                return conn.execute('SELECT COUNT(*) FROM system_facts').fetchone()[0]
+        except Exception as e:
+            logger.warning("Could not count system facts: %s", e)
+            return 0
+
+    def search_facts(self, query: str, limit: int = 5, token_budget: int = 300) -> List[Tuple[str, str]]:
+        """Top facts most relevant to a request, trimmed to a token budget"""
+        terms = [t for t in re.findall(r'\w+', (query or '').lower()) if len(t) > 1][:32]
+        rows: List[Tuple[str, str]] = []
+
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                if terms and self.fts_enabled:
+                    match = ' OR '.join(f'"{t}"' for t in terms)
+                    rows = conn.execute('''
+                        SELECT f.fact_key, f.fact_value
+                        FROM system_facts_fts
+                        JOIN system_facts f ON f.id = system_facts_fts.rowid
+                        WHERE system_facts_fts MATCH ?
+                        ORDER BY bm25(system_facts_fts)
+                        LIMIT ?
+                    ''', (match, limit * 4)).fetchall()
+                elif terms:
+                    like = ' OR '.join(['fact_key LIKE ? OR fact_value LIKE ?'] * len(terms))
+                    params = [p for t in terms for p in (f'%{t}%', f'%{t}%')]
+                    rows = conn.execute(f'''
+                        SELECT fact_key, fact_value FROM system_facts
+                        WHERE {like}
+                        ORDER BY timestamp DESC
+                        LIMIT ?
+                    ''', params + [limit * 4]).fetchall()
+
+                if not rows:
+                    # Nothing matched: the most recently learned facts are the best guess
+                    rows = conn.execute('''
+                        SELECT fact_key, fact_value FROM system_facts
+                        ORDER BY timestamp DESC
+                        LIMIT ?
+                    ''', (limit,)).fetchall()
+        except Exception as e:
+            logger.warning("Could not search system facts: %s", e)
+            return []
+
+        selected = []
+        seen_values = set()
+        used_tokens = 0
+        for key, value in rows:
+            if value in seen_values:
+                continue
+            cost = count_tokens(f"- {key}: {value}") + 1
+            if used_tokens + cost > token_budget:
+                continue
+            selected.append((key, value))
+            seen_values.add(value)
+            used_tokens += cost
+            if len(selected) >= limit:
+                break
+        return selected
+
+    def get_session_summaries(self, limit: int = 10) -> List[str]:
+        """Get summaries of the most recent past sessions"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                rows = conn.execute('''
+                    SELECT summary FROM session_summaries
+                    WHERE session_id != ?
+                    ORDER BY ended DESC
+                    LIMIT ?
+                ''', (self.session_id, limit)).fetchall()
+                return [row[0] for row in rows]
+        except Exception as e:
+            logger.warning("Could not retrieve session summaries: %s", e)
+            return []
+
+    def get_memory_context(self, user_request: str = "", token_budget: Optional[int] = None) -> str:
         """Generate memory context for Gemini"""
-        recent_conversations = self.get_recent_conversations(3)
-        command_patterns = self.get_command_patterns()
-        system_facts = self.get_system_facts()
-
-        context = "\n=== MEMORY CONTEXT ===\n"
-
-        # Recent conversations
-        if recent_conversations:
-            context += "Recent Conversations:\n"
-            for conv in recent_conversations:
-                # Limit the length of the agent response in memory context to avoid prompt stuffing
-                agent_response_snippet = conv['agent_response'].get('user_message', conv['agent_response'].get('explanation', 'N/A'))
-                context += f"- User: {conv['user_request'][:100]}...\n"
-                context += f"  Agent: {agent_response_snippet[:100]}...\n"
-                context += f"  Time: {conv['timestamp']}\n"
-
-        # Command patterns
-        if command_patterns:
-            context += "\nFrequent Commands:\n"
-            for cmd, stats in list(command_patterns.items())[:5]:
-                context += f"- {cmd}: used {stats['frequency']} times (success: {stats['success_rate']:.1%})\n"
-
-        # System facts
-        if system_facts:
-            context += "\nLearned System Facts:\n"
-            for key, value in list(system_facts.items())[:5]:
-                context += f"- {key}: {value}\n"
-
-        # Quick memory insights
-        if self.quick_memory['learned_preferences']:
-            context += "\nUser Preferences:\n"
-            for pref, value in self.quick_memory['learned_preferences'].items():
-                context += f"- {pref}: {value}\n"
-
-        context += "=== END MEMORY CONTEXT ===\n"
-        return context
+        return self.context_assembler.assemble(user_request, token_budget)
 
     def cleanup_old_data(self, days_to_keep: int = 30):
         """Clean up old memory data"""
         try:
-            cutoff_date = datetime.now().timestamp() - (days_to_keep * 24 * 3600)
-            cutoff_iso = datetime.fromtimestamp(cutoff_date).isoformat()
-
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('DELETE FROM conversations WHERE timestamp < ?', (cutoff_iso,))
-                cursor.execute('DELETE FROM command_history WHERE timestamp < ?', (cutoff_iso,))
-                conn.commit()
+            # Same batched, rolled-up path as the background scheduler, with the age overridden
+            policies = {
+                table: RetentionPolicy(max_age_days=days_to_keep, where=policy.where)
+                for table, policy in self.retention.policies.items()
+            }
+            stats = self.retention.run_once(policies)
 
-            print(f"Cleaned up memory data older than {days_to_keep} days")
+            logger.info("Cleaned up memory data older than %s days", days_to_keep)
+            return stats
         except Exception as e:
-            print(f"Warning: Could not cleanup old data: {e}")
+            logger.warning("Could not cleanup old data: %s", e)
+            return {'error': str(e)}
 
 class OSAgent:
-    def __init__(self, gemini_api_key: str):
-        """Initialize the OS Agent with Gemini API key and memory"""
+    def __init__(self, gemini_api_key: Optional[str], worker: bool = False):
+        """Initialize the OS Agent with Gemini API key and memory (no key: no planning). A worker
+        serving a coordinator keeps its own memory and runs no index, job recovery or retention,
+        which could otherwise act on the coordinator's state when both share a host"""
+        # Records are formatted and written on a background thread, off the request path
+        configure_logging()
+
         self.system = platform.system().lower()
         self.is_windows = self.system == 'windows'
         self.is_linux = self.system == 'linux'
 
         # Configure Gemini for OS Agent
-        genai.configure(api_key=gemini_api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash') # Keep 1.5 Flash for OS interactions
+        self.model = None
+        if gemini_api_key:
+            genai.configure(api_key=gemini_api_key)
+            self.model = genai.GenerativeModel('gemini-1.5-flash') # Keep 1.5 Flash for OS interactions
 
         # Initialize memory manager
-        self.memory = MemoryManager()
+        self.memory = MemoryManager(WORKER_MEMORY_DIR if worker else "agent_memory")
+        if not worker:
+            self.memory.retention.start()
+
+        # Full outputs of large commands are spilled here instead of being held in memory
+        self.output_store = OutputStore(self.memory.memory_dir / "outputs")
+        self.memory.retention.add_task(self.output_store.prune)
+
+        # Parallel zero-copy copy/move with resumable checkpoints
+        self.transfers = TransferManager(self.memory.memory_dir / "transfers")
+
+        # Background filesystem index for name, size and recency lookups (OSAGENT_FS_INDEX=0 disables it)
+        self.fs_index = None
+        if not worker and os.getenv('OSAGENT_FS_INDEX', '1') != '0':
+            roots = os.getenv('OSAGENT_FS_INDEX_ROOTS', str(Path.home())).split(os.pathsep)
+            max_watches = os.getenv('OSAGENT_FS_INDEX_WATCHES')
+            self.fs_index = FileIndex(self.memory.memory_dir / "fs_index.db", roots,
+                                      exclude_paths=[str(self.memory.memory_dir)],
+                                      max_watches=int(max_watches) if max_watches else None)
+            self.fs_index.start()
+
+        # Per-directory size totals revalidated by mtime; filled by du/largest_dirs queries rather
+        # than a startup walk of $HOME alongside the filesystem index's own scan
+        self.du_cache = DirSizeCache(self.memory.memory_dir / "du_cache.db")
+
+        # Plans waiting on user confirmation, resumed by plan ID without another LLM call
+        self.plans = PlanStore()
+
+        # Iterative mode: plan, run, feed results back to the planner until the goal is met
+        self.agent_loop = AgentLoop(self)
+
+        # Many requests at once: shared planner calls, bounded concurrent execution
+        self.batch_runner = BatchRunner(self)
+
+        # Worker daemons on other machines (OSAGENT_HOSTS), one reused connection each
+        self.hosts = HostPool.from_env()
+
+        # Long-lived shell workers, one per session (POSIX only)
+        # rlimits, lower priority and (cgroup v2) quotas for every command the agent runs
+        self.sandbox = Sandbox.from_env()
+        self.shell_pool = None if self.is_windows else ShellPool(sandbox=self.sandbox)
+
+        # Short-lived results of read-only commands (df, uname, ls, ...); OSAGENT_RESULT_CACHE=0 disables it
+        self.result_cache = None if self.is_windows or os.getenv('OSAGENT_RESULT_CACHE', '1') == '0' else ResultCache()
+
+        # Long-running commands run as background jobs and the request returns immediately
+        self.jobs = JobManager(self, self.memory.db_path, self.memory.memory_dir / "jobs",
+                               max_concurrent=int(os.getenv('OSAGENT_MAX_JOBS', DEFAULT_MAX_CONCURRENT)),
+                               recover=not worker)
+        self.memory.retention.add_task(self.jobs.prune)
+
+        # Background process sampler: accurate CPU% from deltas, top-K without full sorts
+        self.process_sampler = ProcessSampler()
+        self.process_sampler.start()
+        self._status_cache: Optional[Tuple[float, Dict[str, Any]]] = None
 
         # Setup logging
-        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-        self.logger = logging.getLogger(__name__)
+        self.logger = logger
 
         # System information
         self.system_info = self._get_system_info()
-        self.logger.info(f"OS Agent initialized on {self.system_info['system']} {self.system_info['version']}")
+        self.logger.info("OS Agent initialized on %s %s", self.system_info['system'], self.system_info['version'])
 
         # Store system info as facts
         self.memory.store_system_fact("os_system", self.system_info['system'])
@@ -362,18 +617,22 @@ class OSAgent:
                 }
             }
         except Exception as e:
-            self.logger.error(f"Error getting system info: {e}")
+            self.logger.error("Error getting system info: %s", e)
             return {'error': str(e)}
 
-    def _execute_command(self, command: str, shell: bool = True, capture_output: bool = True, confirm: bool = False) -> Dict[str, Any]:
+    def _execute_command(self, command: str, shell: bool = True, capture_output: bool = True, confirm: bool = False,
+                         isolated: bool = False, background: bool = False) -> Dict[str, Any]:
         """
         Execute a system command.
         This method no longer blocks dangerous commands by itself.
         The `confirm` parameter is now used to indicate if the command was
         pre-approved by the user on the frontend.
+        `isolated` runs it in a fresh process in the session's directory instead of the
+        session shell, so that several can run at once.
+        `background` also runs it in a fresh process, at idle IO and lower CPU priority.
         """
         if not confirm:
-            self.logger.warning(f"Attempted to execute command '{command}' without explicit confirmation. Blocking as a safeguard.")
+            self.logger.warning("Attempted to execute command '%s' without explicit confirmation. Blocking as a safeguard.", command)
             result = {
                 'success': False,
                 'error': 'Command requires explicit confirmation from user.',
@@ -383,38 +642,82 @@ class OSAgent:
             self.memory.store_command_history(command, False, "no_confirmation_received")
             return result
 
+        if self.result_cache is not None and shell and capture_output and not background:
+            # Read-only commands: reuse a fresh result or share one already running
+            result = self.result_cache.run(command, self._current_directory(),
+                                           lambda: self._run_command(command, shell, capture_output, isolated, background))
+            if result.get('cached'):
+                log_event(self.logger, 'command', command=command, returncode=result.get('returncode'),
+                          output_bytes=result.get('output_bytes', 0), cached=True, cache_age_s=result['cache_age_s'])
+                self.memory.store_command_history(command, result['success'], "cached")
+            return result
+        if self.result_cache is not None:
+            # Not classified, so possibly state-changing: figures cached before it are stale
+            self.result_cache.invalidate()
+        return self._run_command(command, shell, capture_output, isolated, background)
+
+    def _run_command(self, command: str, shell: bool, capture_output: bool, isolated: bool,
+                     background: bool) -> Dict[str, Any]:
+        """Run a confirmed command in the session shell or a fresh process and record it"""
         try:
-            self.logger.info(f"Executing command: {command}")
-
-            result = subprocess.run(
-                command,
-                shell=shell,
-                capture_output=capture_output,
-                text=True,
-                timeout=60 # Increased timeout slightly for more complex commands
-            )
+            self.logger.info("Executing command: %s", command)
+
+            stdout_capture = self.output_store.new_capture() if capture_output else None
+            stderr_capture = self.output_store.new_capture() if capture_output else None
+            # Budget learned from this kind of command's past runs, extended while it prints
+            deadline = self.memory.timings.deadline(command, (stdout_capture, stderr_capture))
+
+            pooled = self.shell_pool is not None and shell and capture_output and not (isolated or background)
+            try:
+                if pooled:
+                    # Persistent per-session shell: no fork/exec of a new shell, and cd persists
+                    returncode, _, usage = self.shell_pool.run(
+                        self.memory.session_id, command, stdout_capture, stderr_capture, timeout=deadline
+                    )
+                else:
+                    returncode, usage = self._run_subprocess(
+                        command, shell, stdout_capture, stderr_capture, deadline,
+                        cwd=self._current_directory() if (isolated or background) else None, background=background
+                    )
+            finally:
+                stdout = stdout_capture.finish() if capture_output else None
+                stderr = stderr_capture.finish() if capture_output else None
 
             exec_result = {
-                'success': result.returncode == 0,
-                'returncode': result.returncode,
-                'output': result.stdout.strip() if result.stdout else '',
-                'error': result.stderr.strip() if result.stderr else '',
-                'command': command
+                'success': returncode == 0,
+                'returncode': returncode,
+                'output': stdout['text'].strip() if stdout else '',
+                'error': stderr['text'].strip() if stderr else '',
+                'command': command,
+                'output_id': stdout['output_id'] if stdout else None,
+                'error_id': stderr['output_id'] if stderr else None,
+                'output_bytes': stdout['total_bytes'] if stdout else 0,
+                'truncated': bool((stdout and stdout['truncated']) or (stderr and stderr['truncated'])),
+                'resources': usage or None
             }
+            if returncode < 0 and not exec_result['error']:
+                # Killed by a signal before it could say anything; without this the failure is silent
+                exec_result['error'] = self._killed_message(-returncode, pooled)
+
+            duration = deadline.elapsed()
+            log_event(self.logger, 'command', command=command, returncode=returncode,
+                      output_bytes=exec_result['output_bytes'], elapsed_ms=round(duration * 1000, 1),
+                      budget_s=round(deadline.budget, 1), **(usage or {}))
 
             # Store in memory
-            self.memory.store_command_history(command, exec_result['success'])
+            self.memory.store_command_history(command, exec_result['success'], duration=duration)
 
             return exec_result
 
-        except subprocess.TimeoutExpired:
+        except subprocess.TimeoutExpired as e:
             result = {
                 'success': False,
-                'error': 'Command timed out (60s limit)',
+                'error': f'Command timed out after {e.timeout:.0f}s',
                 'output': '',
                 'command': command
             }
-            self.memory.store_command_history(command, False, "timeout")
+            # Recorded at the time it was given, so a command that is slower than its budget gets more next time
+            self.memory.store_command_history(command, False, "timeout", duration=e.timeout)
             return result
         except Exception as e:
             result = {
@@ -426,13 +729,103 @@ class OSAgent:
             self.memory.store_command_history(command, False, f"exception: {str(e)}")
             return result
 
-    def _get_context_prompt(self) -> str:
+    @staticmethod
+    def _killed_message(signum: int, pooled: bool) -> str:
+        try:
+            name = signal.Signals(signum).name
+        except ValueError:
+            name = f"signal {signum}"
+        cause = " (timeout, out of memory or a resource limit)" if signum == signal.SIGKILL else ""
+        if pooled:
+            return f"The session shell was killed by {name}{cause}; a new one is started for the next command"
+        return f"Killed by {name}{cause}"
+
+    def _run_subprocess(self, command: str, shell: bool, stdout_capture, stderr_capture, deadline: Deadline,
+                        cwd: Optional[str] = None, background: bool = False) -> Tuple[int, Dict[str, Any]]:
+        """Run a command in a fresh, resource-limited child process, streaming its output into
+        the captures; returns (exit status, resource usage)"""
+        slot = self.sandbox.slot(self.memory.session_id, background=background) if shell else None
+        before = slot.counters() if slot is not None else {}
+        start = lambda: subprocess.Popen(
+            slot.wrap(command) if slot is not None else command,
+            shell=shell,
+            cwd=cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE if stdout_capture else None,
+            stderr=subprocess.PIPE if stderr_capture else None,
+            start_new_session=not self.is_windows
+        )
+        process = slot.spawn(start) if slot is not None else start()
+
+        # Drain both pipes concurrently so neither can fill up and stall the child
+        readers = []
+        for stream, capture in ((process.stdout, stdout_capture), (process.stderr, stderr_capture)):
+            if capture is not None:
+                reader = threading.Thread(target=pump_stream, args=(stream, capture), daemon=True)
+                reader.start()
+                readers.append(reader)
+
+        waiter = ChildWaiter(process)
+        counters: Dict[str, int] = {}
+        try:
+            if not deadline.wait(waiter):
+                self._kill_process_tree(process)
+                waiter(5)
+                for reader in readers:
+                    reader.join(timeout=5)
+                raise subprocess.TimeoutExpired(command, deadline.elapsed())
+
+            for reader in readers:
+                reader.join()
+        finally:
+            waiter.close()
+            if slot is not None:
+                counters = slot.counters()
+                slot.close()
+
+        usage = usage_from_rusage(waiter.rusage) if waiter.rusage is not None else {}
+        # The command's own cgroup also covers descendants wait4 never saw (daemonized ones)
+        usage.update(usage_from_counters(before, counters))
+        if 'memory_peak' in counters:
+            usage['memory_peak_bytes'] = counters['memory_peak']
+        return process.returncode, usage
+
+    def _kill_process_tree(self, process: subprocess.Popen):
+        """Kill a command together with anything it spawned; the caller's ChildWaiter reaps it"""
+        try:
+            if self.is_windows:
+                process.kill()
+            else:
+                # The command runs in its own session, so its pid is also the process group id
+                os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def read_output(self, output_id: str, offset: int = 0, limit: int = DEFAULT_PAGE_BYTES) -> Dict[str, Any]:
+        """Page through the full output of a command whose capture was truncated"""
+        return self.output_store.read_page(output_id, offset, limit)
+
+    def _current_directory(self) -> str:
+        """Working directory of this session's shell (persists across commands)"""
+        if self.shell_pool is not None:
+            return self.shell_pool.cwd(self.memory.session_id) or self.system_info['current_dir']
+        return self.system_info['current_dir']
+
+    def _get_context_prompt(self, user_request: str = "") -> str:
         """Generate context prompt for Gemini based on system info and memory"""
         memory_gb = self.system_info['memory_total'] / (1024**3)
         disk_free_gb = self.system_info['disk_usage']['free'] / (1024**3)
 
         # Get memory context
-        memory_context = self.memory.get_memory_context()
+        memory_context = self.memory.get_memory_context(user_request)
+
+        remote_hosts = ""
+        if self.hosts:
+            remote_hosts = f"""
+Remote hosts: {', '.join(self.hosts.names)}
+To run a command or file operation on remote hosts instead of this machine, add "hosts": ["name", ...]
+(or "hosts": "all") to that entry in "commands". Entries without "hosts" run locally.
+"""
 
         return f"""
 You are an AI OS agent running on {self.system_info['system']} {self.system_info['release']}.
@@ -441,12 +834,12 @@ System Details:
 - CPU Cores: {self.system_info['cpu_count']}
 - Memory: {memory_gb:.1f} GB
 - Free Disk Space: {disk_free_gb:.1f} GB
-- Current Directory: {self.system_info['current_dir']}
+- Current Directory: {self._current_directory()}
 - User: {self.system_info['username']}
 - Current Date/Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 
 {memory_context}
-
+{remote_hosts}
 Your primary goal is to perform OS operations based on user requests.
 
 For commands that involve **deleting files/directories, formatting disks, changing critical system permissions (e.g., chmod 777), or shutting down/rebooting the system**, you **MUST** set `requires_confirmation: true` for that specific command in the JSON. For all other commands, set it to `false`.
@@ -459,12 +852,26 @@ Response format should be JSON with the following structure:
     "action_type": "command|info|file_operation|process_management|system_query",
     "commands": [
         {{"command": "command_string_1", "requires_confirmation": true}},
-        {{"command": "command_string_2", "requires_confirmation": false}}
+        {{"command": "command_string_2", "requires_confirmation": false}},
+        {{"file_operation": {{"operation": "list|du|largest_dirs|glob|locate|largest|recent|hash|info|copy|move|delete|create_dir", "source": "path", "destination": "optional path", "pattern": "optional glob"}}, "requires_confirmation": false}}
     ],
     "user_message": "A short, simple, user-friendly message explaining the action or information provided.",
     "learned_info": "Any new critical information or preference learned from the interaction that should be stored."
 }}
 
+Built-in file operations run natively without spawning a process and return structured results. Prefer a "file_operation" entry over a shell command for:
+- listing a directory ("list", instead of ls/dir)
+- disk usage of a directory and its largest children ("du", instead of du)
+- the largest directories anywhere under a path, e.g. "what's using my disk" ("largest_dirs", optional "max_depth")
+- finding files by name or glob pattern ("glob" with "pattern", instead of find)
+- finding a file by name anywhere under a directory such as the home directory ("locate" with "pattern", answered from an index in milliseconds)
+- the largest or most recently modified files under a directory ("largest", "recent")
+- file or directory checksums ("hash")
+- copying, moving, deleting or creating files and directories ("copy", "move", "delete", "create_dir")
+"delete", "move" and overwriting "copy" operations follow the same confirmation rules as commands.
+
+For a command expected to take more than a minute (installs, builds, large copies or downloads), add "background": true to its entry. It then runs as a background job and the user can follow its output. The commands listed after it wait for it and run only if it succeeds.
+
 Remember:
 - For Windows, use Windows-specific commands (dir, type, etc.)
 - For Linux, use Linux-specific commands (ls, cat, etc.)
@@ -474,17 +881,44 @@ Remember:
 - Use memory context to provide better responses.
 """
 
-    async def process_request(self, user_request: str, confirmed_commands: Optional[List[str]] = None) -> Dict[str, Any]:
+    async def process_request(self, user_request: str, confirmed_commands: Optional[List[str]] = None,
+                              plan_id: Optional[str] = None, iterative: bool = False,
+                              max_steps: Optional[int] = None) -> Dict[str, Any]:
+        """handle_request on a worker thread: the Gemini call and the commands block, and the
+        event loop keeps serving other connections (dashboards, status polls) meanwhile"""
+        return await asyncio.to_thread(self.handle_request, user_request, confirmed_commands,
+                                       plan_id, iterative, max_steps)
+
+    def handle_request(self, user_request: str, confirmed_commands: Optional[List[str]] = None,
+                       plan_id: Optional[str] = None, iterative: bool = False,
+                       max_steps: Optional[int] = None) -> Dict[str, Any]:
         """
         Process user request using Gemini and execute appropriate actions.
         `confirmed_commands` is a list of commands the user has explicitly confirmed.
+        `plan_id` resumes a stored plan that was waiting for those confirmations.
+        `iterative` feeds command results back to the planner for up to `max_steps` rounds.
         """
         if confirmed_commands is None:
             confirmed_commands = []
 
+        if plan_id:
+            plan, expired = self.plans.take(plan_id)
+            if plan is not None and not expired:
+                return self._resume_plan(plan, confirmed_commands)
+            if plan is not None:
+                # Record the steps it had already run before planning afresh
+                self._finish_plan(plan)
+            self.logger.info("Plan %s is unknown or expired; planning the request again.", plan_id)
+
         try:
+            if iterative:
+                result = self.agent_loop.run(user_request, confirmed_commands, max_steps=max_steps)
+                self.logger.info("Iterative request finished after %s step(s): %s, %s tokens",
+                                 result['iterations'], result['stop_reason'], result['tokens_used'])
+                return result
+
             # Prepare the prompt for Gemini
-            system_prompt = self._get_context_prompt()
+            system_prompt = self._get_context_prompt(user_request)
 
             full_prompt = f"""
 {system_prompt}
@@ -503,7 +937,8 @@ Response format should be JSON with the following structure:
     "action_type": "command|info|file_operation|process_management|system_query",
     "commands": [
         {{"command": "command_string_1", "requires_confirmation": true}},
-        {{"command": "command_string_2", "requires_confirmation": false}}
+        {{"command": "command_string_2", "requires_confirmation": false}},
+        {{"file_operation": {{"operation": "list|du|largest_dirs|glob|locate|largest|recent|hash|info|copy|move|delete|create_dir", "source": "path", "destination": "optional path", "pattern": "optional glob"}}, "requires_confirmation": false}}
     ],
     "user_message": "A short, simple, user-friendly message explaining the action or information provided.",
     "learned_info": "Any new critical information or preference learned from the interaction that should be stored."
@@ -512,19 +947,7 @@ Response format should be JSON with the following structure:
 
             # Get Gemini's analysis
             response = self.model.generate_content(full_prompt)
-
-            try:
-                # Try to parse as JSON
-                gemini_response = json.loads(response.text.strip().replace('```json', '').replace('```', ''))
-            except json.JSONDecodeError:
-                # If not JSON, treat as plain text and log the malformed response
-                self.logger.warning(f"Gemini returned non-JSON response: {response.text.strip()}")
-                gemini_response = {
-                    "action_type": "info",
-                    "commands": [],
-                    "user_message": f"I couldn't fully understand that. Gemini provided a non-standard response: {response.text.strip()}",
-                    "learned_info": ""
-                }
+            gemini_response = self._parse_gemini_response(response.text)
 
             result = {
                 'request': user_request,
@@ -535,33 +958,12 @@ Response format should be JSON with the following structure:
                 'pending_confirmation_commands': []
             }
 
-            # Execute commands if any, checking for confirmation
-            if gemini_response.get('commands'):
-                for cmd_obj in gemini_response['commands']:
-                    command = cmd_obj.get('command', '')
-                    requires_confirmation = cmd_obj.get('requires_confirmation', False)
-
-                    if not command.strip():
-                        continue
-
-                    if requires_confirmation and command not in confirmed_commands:
-                        # If confirmation is required and not yet confirmed, add to pending list
-                        result['pending_confirmation_commands'].append(command)
-                        self.logger.info(f"Command '{command}' requires confirmation.")
-                        continue # Skip execution for now
-
-                    # Execute confirmed or non-confirming commands
-                    exec_raw_result = self._execute_command(command, confirm=True)
-                    # Streamline execution result for frontend
-                    exec_result_for_frontend = {
-                        'command': command,
-                        'success': exec_raw_result['success'],
-                        'output_message': exec_raw_result['output'] if exec_raw_result['success'] else exec_raw_result['error']
-                    }
-                    result['execution_results'].append(exec_result_for_frontend)
-
-                    # Add a small delay between commands
-                    time.sleep(0.1)
+            plan = PendingPlan(
+                plan_id=self.plans.new_id(),
+                user_request=user_request,
+                gemini_response=gemini_response,
+                steps=self._plan_steps(gemini_response)
+            )
 
             # Browser automation handling removed
 
@@ -572,22 +974,30 @@ Response format should be JSON with the following structure:
                     gemini_response['learned_info']
                 )
 
-            # Store conversation in memory
-            current_system_state = self.get_system_status()
-            self.memory.store_conversation(
-                user_request,
-                gemini_response,
-                result['execution_results'],
-                current_system_state
-            )
-
-            # Save quick memory
-            self.memory._save_quick_memory()
-
+            pending = [s.command for s in plan.steps if s.requires_confirmation and s.command not in confirmed_commands]
+            if pending:
+                # Keep the plan server-side so confirming runs exactly these steps without
+                # planning again, and run the steps ahead of the first confirmation meanwhile
+                first_pending = next(i for i, s in enumerate(plan.steps)
+                                     if s.requires_confirmation and s.command not in confirmed_commands)
+                result['pending_confirmation_commands'] = pending
+                result['plan_id'] = plan.plan_id
+                result['speculative_commands'] = [s.command for s in plan.steps[:first_pending]]
+                for command in pending:
+                    self.logger.info("Command '%s' requires confirmation.", command)
+                plan.worker = threading.Thread(target=self._advance_plan, args=(plan, confirmed_commands),
+                                               name=f"plan-{plan.plan_id[:8]}", daemon=True)
+                plan.worker.start()
+                self._store_plan(plan)
+                return result
+
+            self._advance_plan(plan, confirmed_commands)
+            result['execution_results'] = plan.execution_results
+            self._finish_plan(plan)
             return result
 
         except Exception as e:
-            self.logger.error(f"Error processing request: {e}")
+            self.logger.error("Error processing request: %s", e)
             return {
                 'error': str(e),
                 'request': user_request,
@@ -596,15 +1006,222 @@ Response format should be JSON with the following structure:
                 'gemini_response': {}
             }
 
+    def _parse_gemini_response(self, text: str) -> Dict[str, Any]:
+        try:
+            # Try to parse as JSON
+            return json.loads(text.strip().replace('```json', '').replace('```', ''))
+        except json.JSONDecodeError:
+            # If not JSON, treat as plain text and log the malformed response
+            self.logger.warning("Gemini returned non-JSON response: %s", text.strip())
+            return {
+                "action_type": "info",
+                "commands": [],
+                "user_message": f"I couldn't fully understand that. Gemini provided a non-standard response: {text.strip()}",
+                "learned_info": ""
+            }
+
+    def _plan_steps(self, gemini_response: Dict[str, Any]) -> List[PlanStep]:
+        steps = []
+        for cmd_obj in gemini_response.get('commands') or []:
+            file_op = cmd_obj.get('file_operation')
+            command = self._describe_file_operation(file_op) if isinstance(file_op, dict) else cmd_obj.get('command', '')
+            if not command.strip():
+                continue
+            if cmd_obj.get('hosts'):
+                # Part of the confirmation key, so approving a command on one set of hosts
+                # does not approve it elsewhere
+                hosts = cmd_obj['hosts']
+                try:
+                    hosts = self.hosts.resolve(hosts)
+                except ValueError:
+                    pass
+                command = f"{command} @ {','.join(hosts) if isinstance(hosts, list) else hosts}"
+            steps.append(PlanStep(command, cmd_obj, bool(cmd_obj.get('requires_confirmation', False))))
+        return steps
+
+    def _run_step(self, step: PlanStep, isolated: bool = False, after_job: Optional[str] = None) -> Dict[str, Any]:
+        """Run one plan step; after_job is a background job started by an earlier step of the plan,
+        which the step may depend on and so must not overtake"""
+        dependency = self.jobs.get(after_job) if after_job is not None else None
+        if dependency is not None and dependency.status != 'succeeded':
+            if dependency.status in FINAL_STATUSES:
+                return {'command': step.command, 'success': False,
+                        'output_message': f"Not run: background job {dependency.job_id}, which it comes after, "
+                                          f"ended as {dependency.status}."}
+            if step.spec.get('hosts') or isinstance(step.spec.get('file_operation'), dict):
+                return {'command': step.command, 'success': False,
+                        'output_message': f"Not run: it comes after background job {dependency.job_id}, which is "
+                                          f"still running. Ask again once that job has finished."}
+            # A shell command waits for the job as a job of its own
+            return self._start_job(step.command, after_job=dependency.job_id)
+        if step.spec.get('hosts'):
+            return self._run_remote_step(step)
+        file_op = step.spec.get('file_operation')
+        if isinstance(file_op, dict):
+            # Native file operation: no process spawn, structured result
+            return self._run_file_operation(file_op)
+        if self.jobs.is_long_running(step.command, step.spec):
+            return self._start_job(step.command)
+
+        exec_raw_result = self._execute_command(step.command, confirm=True, isolated=isolated)
+        # Streamline execution result for frontend
+        exec_result_for_frontend = {
+            'command': step.command,
+            'success': exec_raw_result['success'],
+            'output_message': exec_raw_result['output'] if exec_raw_result['success'] else exec_raw_result['error'],
+            'output_id': exec_raw_result.get('output_id') if exec_raw_result['success'] else exec_raw_result.get('error_id'),
+            'truncated': exec_raw_result.get('truncated', False)
+        }
+        if exec_raw_result.get('resources'):
+            exec_result_for_frontend['resources'] = exec_raw_result['resources']
+        # Add a small delay between commands
+        time.sleep(0.1)
+        return exec_result_for_frontend
+
+    def _start_job(self, command: str, after_job: Optional[str] = None) -> Dict[str, Any]:
+        """Queue a long-running command as a background job instead of waiting for it"""
+        job = self.jobs.submit(command, cwd=self._current_directory(), after_job=after_job)
+        self.logger.info("Executing command as job %s: %s", job.job_id, command)
+        started = (f"Queued as background job {job.job_id}, to start once job {after_job} has succeeded."
+                   if job.status == 'waiting' else f"Started as background job {job.job_id}.")
+        return {
+            'command': command,
+            'success': True,
+            'output_message': f"{started} Follow it with 'attach {job.job_id}' or stop it with 'cancel {job.job_id}'.",
+            'job': job.as_dict()
+        }
+
+    @staticmethod
+    def _last_job(results: List[Dict[str, Any]]) -> Optional[str]:
+        """ID of the background job started by the latest of a plan's results, if any"""
+        return next((result['job']['job_id'] for result in reversed(results) if result.get('job')), None)
+
+    def _run_remote_step(self, step: PlanStep) -> Dict[str, Any]:
+        """Run one planner entry on its remote hosts concurrently and merge the per-host results"""
+        try:
+            hosts = self.hosts.resolve(step.spec['hosts'])
+        except ValueError as e:
+            return {'command': step.command, 'success': False, 'output_message': str(e)}
+
+        file_op = step.spec.get('file_operation')
+        self.logger.info("Executing on %s host(s): %s", len(hosts), step.command)
+        if isinstance(file_op, dict):
+            replies = self.hosts.fan_out('file_operation', hosts, file_op=file_op)
+        else:
+            replies = self.hosts.fan_out('execute_command', hosts, command=step.spec.get('command', ''))
+
+        per_host = {}
+        for host, reply in replies.items():
+            if not reply['success']:
+                per_host[host] = {'success': False, 'output_message': reply['error']}
+            elif isinstance(file_op, dict):
+                per_host[host] = {'success': reply['result']['success'], 'output_message': reply['result']['output_message']}
+            else:
+                result = reply['result']
+                per_host[host] = {'success': result['success'],
+                                  'output_message': result['output'] if result['success'] else result['error']}
+
+        success = all(r['success'] for r in per_host.values())
+        self.memory.store_command_history(step.command, success, "remote")
+        return {
+            'command': step.command,
+            'success': success,
+            'output_message': '\n'.join(
+                f"[{host}] {'ok' if r['success'] else 'failed'}\n{(r['output_message'] or '').rstrip()}"
+                for host, r in per_host.items()
+            ),
+            'hosts': per_host
+        }
+
+    def get_hosts(self) -> Dict[str, Any]:
+        """Reachability and system status of every configured remote host"""
+        return {'hosts': self.hosts.fan_out('get_system_status')}
+
+    def _advance_plan(self, plan: PendingPlan, confirmed_commands: List[str]):
+        """Run plan steps in order until one that still needs confirmation"""
+        while plan.next_index < len(plan.steps):
+            step = plan.steps[plan.next_index]
+            if step.requires_confirmation and step.command not in confirmed_commands:
+                return
+            try:
+                plan.execution_results.append(
+                    self._run_step(step, after_job=self._last_job(plan.execution_results)))
+            except Exception as e:
+                self.logger.error("Error running plan step '%s': %s", step.command, e)
+                plan.execution_results.append({'command': step.command, 'success': False, 'output_message': str(e)})
+            plan.next_index += 1
+
+    def _store_plan(self, plan: PendingPlan):
+        plan.created = time.monotonic()
+        for evicted in self.plans.add(plan):
+            self.logger.info("Plan %s expired without confirmation.", evicted.plan_id)
+            self._finish_plan(evicted)
+
+    def _finish_plan(self, plan: PendingPlan):
+        """Record a completed (or abandoned) plan in memory"""
+        plan.wait()
+        self._record_conversation(plan.user_request, plan.gemini_response, plan.all_results())
+
+    def _record_conversation(self, user_request: str, gemini_response: Dict[str, Any],
+                             execution_results: List[Dict[str, Any]],
+                             current_system_state: Optional[Dict[str, Any]] = None):
+        if current_system_state is None:
+            current_system_state = self.get_system_status()
+        self.memory.store_conversation(
+            user_request,
+            gemini_response,
+            execution_results,
+            current_system_state
+        )
+
+        # Save quick memory
+        self.memory._save_quick_memory()
+
+    def _resume_plan(self, plan: PendingPlan, confirmed_commands: List[str]) -> Dict[str, Any]:
+        """Continue a stored plan after confirmation; steps already run are not run again"""
+        plan.wait()
+        self._advance_plan(plan, confirmed_commands)
+        result = {
+            'request': plan.user_request,
+            'gemini_response': plan.gemini_response,
+            'timestamp': datetime.now().isoformat(),
+            'system': self.system_info['system'],
+            'plan_id': plan.plan_id,
+            'execution_results': plan.all_results(),
+            'pending_confirmation_commands': []
+        }
+        if plan.next_index < len(plan.steps):
+            # Some steps are still unconfirmed; keep the rest of the plan for the next round
+            result['pending_confirmation_commands'] = [c for c in plan.pending_commands() if c not in confirmed_commands]
+            self._store_plan(plan)
+            return result
+        if plan.loop_state is not None:
+            return self.agent_loop.resume(plan, confirmed_commands)
+        self._finish_plan(plan)
+        return result
+
+    def cancel_plan(self, plan_id: str) -> Dict[str, Any]:
+        """Drop a stored plan the user declined; steps already run are still recorded"""
+        plan, expired = self.plans.take(plan_id)
+        if plan is None or expired:
+            if plan is not None:
+                self._finish_plan(plan)
+            return {'success': False, 'error': f'Unknown or expired plan: {plan_id}'}
+        self._finish_plan(plan)
+        return {'success': True, 'plan_id': plan_id, 'execution_results': plan.all_results()}
+
     def get_system_status(self) -> Dict[str, Any]:
         """Get comprehensive system status"""
         try:
-            cpu_percent = psutil.cpu_percent(interval=1)
+            # CPU% and the process count come from the background sampler's latest table
+            # instead of blocking for a second to measure
+            table = self.process_sampler.snapshot()
+            cpu_percent = self.process_sampler.cpu_percent
             memory = psutil.virtual_memory()
             disk = psutil.disk_usage('/' if not self.is_windows else 'C:')
 
             # Get running processes count
-            process_count = len(psutil.pids())
+            process_count = len(table) if table is not None else len(psutil.pids())
 
             # Get network interfaces
             network_interfaces = []
@@ -632,54 +1249,71 @@ Response format should be JSON with the following structure:
                     'percentage': (disk.used / disk.total) * 100
                 },
                 'processes': process_count,
+                'largest_directories': self.du_cache.largest_directories(str(Path.home()), 5, refresh=False),
                 'network_interfaces': network_interfaces,
                 'uptime': time.time() - psutil.boot_time()
             }
 
         except Exception as e:
-            self.logger.error(f"Error getting system status: {e}")
+            self.logger.error("Error getting system status: %s", e)
             return {'error': str(e)}
 
-    def list_processes(self, filter_name: Optional[str] = None) -> List[Dict[str, Any]]:
+    def status_snapshot(self) -> Dict[str, Any]:
+        """get_system_status, computed at most once per process sample so repeated polls are free
+        and return identical bodies until the next sample"""
+        table = self.process_sampler.snapshot()
+        key = table.sampled_at if table is not None else None
+        cached = self._status_cache
+        if cached is not None and key is not None and cached[0] == key:
+            return cached[1]
+        status = self.get_system_status()
+        if 'error' not in status:
+            self._status_cache = (key, status)
+        return status
+
+    def list_processes(self, filter_name: Optional[str] = None, sort_by: str = 'cpu', limit: int = 20,
+                       user: Optional[str] = None, cgroup: Optional[str] = None) -> List[Dict[str, Any]]:
         """List running processes with optional filtering"""
         try:
-            processes = []
-            for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent']):
-                try:
-                    pinfo = proc.info
-                    if filter_name is None or filter_name.lower() in pinfo['name'].lower():
-                        processes.append(pinfo)
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    pass
-
-            return sorted(processes, key=lambda x: x['cpu_percent'], reverse=True)[:20]
-
+            return self.process_sampler.top(limit=limit, sort_by=sort_by, name=filter_name,
+                                            user=user, cgroup=cgroup)
         except Exception as e:
-            self.logger.error(f"Error listing processes: {e}")
+            self.logger.error("Error listing processes: %s", e)
             return []
 
-    def manage_file_operations(self, operation: str, source: str, destination: str = None) -> Dict[str, Any]:
+    def manage_file_operations(self, operation: str, source: str, destination: str = None, **options) -> Dict[str, Any]:
         """Perform file operations safely"""
         try:
-            source_path = Path(source)
+            source_path = Path(source).expanduser()
+            dest_path = Path(destination).expanduser() if destination else None
+            offset = int(options.get('offset', 0))
+            limit = int(options.get('limit', file_engine.DEFAULT_PAGE_SIZE))
 
-            if operation == 'copy' and destination:
-                dest_path = Path(destination)
-                shutil.copy2(source_path, dest_path)
-                return {'success': True, 'message': f'Copied {source} to {destination}'}
-
-            elif operation == 'move' and destination:
-                dest_path = Path(destination)
-                shutil.move(source_path, dest_path)
-                return {'success': True, 'message': f'Moved {source} to {destination}'}
+            if operation in ('copy', 'move') and dest_path:
+                if not source_path.exists() and not source_path.is_symlink():
+                    return {'success': False, 'error': 'Path does not exist'}
+                if dest_path.is_dir():
+                    dest_path = dest_path / source_path.name
+                result = self.transfers.transfer(str(source_path), str(dest_path), move=operation == 'move',
+                                                 progress=self._log_transfer_progress)
+                if result['success']:
+                    verb = 'Moved' if operation == 'move' else 'Copied'
+                    result['message'] = f'{verb} {source} to {dest_path}'
+                    if result['total_files']:
+                        result['message'] += f' ({result["total_files"]} files, {result["total_bytes"]} bytes)'
+                return result
 
             elif operation == 'delete':
-                if source_path.is_file():
+                if source_path.resolve() in (Path(source_path.anchor), Path.home()):
+                    return {'success': False, 'error': f'Refusing to delete {source_path}'}
+                if source_path.is_symlink() or source_path.is_file():
                     source_path.unlink()
                     return {'success': True, 'message': f'Deleted file {source}'}
                 elif source_path.is_dir():
-                    shutil.rmtree(source_path)
-                    return {'success': True, 'message': f'Deleted directory {source}'}
+                    result = file_engine.delete_tree(str(source_path))
+                    result['message'] = f'Deleted directory {source}'
+                    return result
+                return {'success': False, 'error': 'Path does not exist'}
 
             elif operation == 'create_dir':
                 source_path.mkdir(parents=True, exist_ok=True)
@@ -701,24 +1335,121 @@ Response format should be JSON with the following structure:
                 else:
                     return {'success': False, 'error': 'Path does not exist'}
 
+            elif operation == 'list':
+                return file_engine.list_directory(str(source_path), offset, limit,
+                                                  show_hidden=bool(options.get('show_hidden', False)),
+                                                  sort_by=options.get('sort_by', 'name'))
+
+            elif operation == 'du':
+                if source_path.is_dir() and not source_path.is_symlink():
+                    return self.du_cache.directory_size(str(source_path), offset=offset, limit=limit)
+                return file_engine.directory_size(str(source_path), offset=offset, limit=limit)
+
+            elif operation == 'largest_dirs':
+                max_depth = options.get('max_depth')
+                items = self.du_cache.largest_directories(str(source_path), limit,
+                                                          max_depth=int(max_depth) if max_depth is not None else None)
+                return {'success': True, 'path': str(source_path), 'items': items, 'total': len(items),
+                        'next_offset': None}
+
+            elif operation in ('glob', 'search'):
+                pattern = options.get('pattern') or '*'
+                return file_engine.glob_search(str(source_path), pattern, offset, limit)
+
+            elif operation in ('locate', 'largest', 'recent'):
+                return self._query_file_index(operation, source_path, options, limit)
+
+            elif operation == 'hash':
+                return file_engine.hash_path(str(source_path), options.get('algorithm', 'sha256'),
+                                             offset=offset, limit=limit)
+
             return {'success': False, 'error': 'Invalid operation'}
 
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
+    def _query_file_index(self, operation: str, source_path: Path, options: Dict[str, Any], limit: int) -> Dict[str, Any]:
+        """Answer name/size/recency queries from the filesystem index, walking the tree if it is not covered"""
+        kind = options.get('kind') or (None if operation == 'locate' else 'file')
+        pattern = options.get('pattern') or options.get('name') or ''
+        if operation == 'locate' and not pattern:
+            return {'success': False, 'error': 'locate needs a "pattern"'}
+
+        if self.fs_index is not None and self.fs_index.covers(str(source_path)):
+            if operation == 'locate':
+                items = self.fs_index.find(pattern, limit, under=str(source_path), kind=kind)
+            elif operation == 'largest':
+                items = self.fs_index.largest(limit, under=str(source_path), kind=kind)
+            else:
+                items = self.fs_index.recent(limit, under=str(source_path), kind=kind)
+            return {'success': True, 'root': str(source_path), 'source': 'index',
+                    'items': items, 'total': len(items), 'next_offset': None}
+
+        if operation == 'locate':
+            glob = pattern if any(c in pattern for c in '*?[') else f"*{pattern}*"
+            return file_engine.glob_search(str(source_path), glob, 0, limit, include_dirs=kind != 'file')
+        return file_engine.top_entries(str(source_path), 'modified' if operation == 'recent' else 'size', limit,
+                                       include_dirs=kind != 'file')
+
+    def _log_transfer_progress(self, event: Dict[str, Any]):
+        if event['event'] == 'file_done':
+            return
+        self.logger.info("Transfer %s %s: %s/%s files, %s/%s bytes", event['transfer_id'], event['event'],
+                         event['files_done'], event['total_files'], event['bytes_done'], event['total_bytes'])
+
+    def get_transfers(self, transfer_id: Optional[str] = None) -> Any:
+        """Progress of recent copy/move transfers, plus interrupted ones that can be resumed"""
+        if transfer_id is not None:
+            return self.transfers.status(transfer_id)
+        return {'transfers': self.transfers.status(), 'resumable': self.transfers.pending_checkpoints()}
+
+    @staticmethod
+    def _describe_file_operation(file_op: Dict[str, Any]) -> str:
+        """Stable one-line description, also used as the confirmation key"""
+        description = f"file_operation:{file_op.get('operation', '')} {file_op.get('source', '')}"
+        if file_op.get('destination'):
+            description += f" -> {file_op['destination']}"
+        if file_op.get('pattern'):
+            description += f" [{file_op['pattern']}]"
+        return description
+
+    def _run_file_operation(self, file_op: Dict[str, Any]) -> Dict[str, Any]:
+        """Execute a planner-issued file operation and shape it like a command result"""
+        operation = file_op.get('operation', '')
+        options = {k: v for k, v in file_op.items() if k not in ('operation', 'source', 'destination')}
+        self.logger.info("Executing file operation: %s", file_op)
+        result = self.manage_file_operations(operation, file_op.get('source', ''), file_op.get('destination'), **options)
+        if self.result_cache is not None and operation not in READ_ONLY_FILE_OPERATIONS:
+            self.result_cache.invalidate()
+        description = self._describe_file_operation(file_op)
+        self.memory.store_command_history(description, result.get('success', False), "file_operation")
+        return {
+            'command': description,
+            'success': result.get('success', False),
+            'output_message': file_engine.render_result(operation, result),
+            'data': result
+        }
+
     def get_memory_stats(self) -> Dict[str, Any]:
         """Get memory statistics"""
         try:
-            conversations = len(self.memory.get_recent_conversations(1000))
+            conversations = self.memory.count_conversations()
             command_patterns = self.memory.get_command_patterns()
-            system_facts = len(self.memory.get_system_facts())
+            system_facts = self.memory.count_system_facts()
 
             return {
                 'total_conversations': conversations,
                 'total_system_facts': system_facts,
                 'top_commands': list(command_patterns.keys())[:5],
                 'memory_location': str(self.memory.memory_dir),
-                'session_id': self.memory.session_id
+                'session_id': self.memory.session_id,
+                'retention': self.memory.retention.metrics.as_dict(),
+                'fs_index': self.fs_index.stats() if self.fs_index is not None else None,
+                'command_timings': self.memory.timings.stats(),
+                'sandbox': self.sandbox.describe(),
+                'jobs': self.jobs.stats(),
+                'result_cache': self.result_cache.stats() if self.result_cache is not None else None,
+                'log_records_dropped': dropped_records()
             }
         except Exception as e:
             return {'error': str(e)}
@@ -731,6 +1462,7 @@ Response format should be JSON with the following structure:
         print("Type 'processes' to list running processes.")
         print("Type 'memory_stats' for agent memory statistics.")
         print("Type 'cleanup_memory' to clean up old memory data.")
+        print("Type 'jobs' to list background jobs, 'attach <id>' to follow one, 'cancel <id>' to stop one.")
 
         while True:
             try:
@@ -748,6 +1480,23 @@ Response format should be JSON with the following structure:
                 elif user_input.lower() == 'memory_stats':
                     mem_stats = self.get_memory_stats()
                     print(json.dumps(mem_stats, indent=2))
+                elif user_input.lower() == 'jobs':
+                    print(json.dumps(self.jobs.list(), indent=2))
+                elif user_input.lower().startswith(('attach ', 'cancel ')):
+                    action, job_id = user_input.split(None, 1)
+                    job = self.jobs.get(job_id.strip())
+                    if job is None:
+                        print(f"No job {job_id.strip()}")
+                    elif action.lower() == 'cancel':
+                        print(json.dumps(self.jobs.cancel(job.job_id).as_dict(), indent=2))
+                    else:
+                        try:
+                            async for chunk in self.jobs.follow(job.job_id):
+                                sys.stdout.write(chunk.decode('utf-8', errors='replace'))
+                                sys.stdout.flush()
+                        except KeyboardInterrupt:
+                            pass
+                        print(f"\n[job {job.job_id}: {self.jobs.get(job.job_id).status}]")
                 elif user_input.lower() == 'cleanup_memory':
                     days = input("Enter number of days of data to keep (e.g., 30): ").strip()
                     try:
@@ -757,8 +1506,11 @@ Response format should be JSON with the following structure:
                     except ValueError:
                         print("Invalid number of days. Please enter an integer.")
                 else:
-                    # Process the request with Gemini
-                    response = await self.process_request(user_input)
+                    # Process the request with Gemini; "task <request>" runs it in iterative mode
+                    iterative = user_input.lower().startswith('task ')
+                    if iterative:
+                        user_input = user_input[5:].strip()
+                    response = await self.process_request(user_input, iterative=iterative)
 
                     if response.get('pending_confirmation_commands'):
                         print("\n--- ACTION REQUIRED: COMMANDS PENDING CONFIRMATION ---")
@@ -768,7 +1520,8 @@ Response format should be JSON with the following structure:
                         confirm = input("Do you want to execute these commands? (yes/no): ").strip().lower()
                         if confirm == 'yes':
                             # Re-process with confirmed commands
-                            final_response = await self.process_request(user_input, confirmed_commands=response['pending_confirmation_commands'])
+                            final_response = await self.process_request(user_input, confirmed_commands=response['pending_confirmation_commands'],
+                                                                        plan_id=response.get('plan_id'))
                             print("\n--- Agent Response ---")
                             print(f"User Message: {final_response.get('gemini_response', {}).get('user_message', 'No specific message.')}")
                             if final_response.get('execution_results'):
@@ -780,6 +1533,8 @@ Response format should be JSON with the following structure:
                             if final_response.get('error'):
                                 print(f"Error: {final_response['error']}")
                         else:
+                            if response.get('plan_id'):
+                                self.cancel_plan(response['plan_id'])
                             print("Commands not confirmed. Action aborted.")
                     else:
                         print("\n--- Agent Response ---")
@@ -797,7 +1552,7 @@ Response format should be JSON with the following structure:
 
 
             except Exception as e:
-                self.logger.error(f"Unhandled error in main loop: {e}")
+                self.logger.error("Unhandled error in main loop: %s", e)
                 print(f"An unexpected error occurred: {e}")
 
 if __name__ == "__main__":
@@ -0,0 +1,251 @@
+"""
+Bounded capture of command output for the OS Agent.
+Only the head and tail of a stream are kept in memory; when a stream grows
+beyond that window the complete output is spilled to a content-addressed
+file under agent_memory/outputs so it can be paged back later. Stored outputs
+are pruned by age and total size on the retention scheduler, and spill files
+left behind by an interrupted process are removed at startup.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, IO, Optional
+
+DEFAULT_HEAD_BYTES = 16 * 1024
+DEFAULT_TAIL_BYTES = 16 * 1024
+DEFAULT_PAGE_BYTES = 64 * 1024
+MAX_PAGE_BYTES = 1024 * 1024
+READ_CHUNK_BYTES = 64 * 1024
+DEFAULT_MAX_AGE_DAYS = 7
+DEFAULT_MAX_STORE_BYTES = 512 * 1024 * 1024
+# A spill file this old belongs to no running capture (another process sharing the directory
+# may still be writing younger ones)
+STALE_PART_SECONDS = 6 * 3600
+
+_OUTPUT_ID_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class BoundedCapture:
+    """Collects a single output stream with a fixed memory footprint"""
+
+    def __init__(self, store: 'OutputStore', head_bytes: int = DEFAULT_HEAD_BYTES,
+                 tail_bytes: int = DEFAULT_TAIL_BYTES):
+        self.store = store
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+
+        # Everything is buffered until the stream outgrows head + tail
+        self._buffer = bytearray()
+        self._head = b''
+        self._tail = bytearray()
+        self._spill_file: Optional[IO[bytes]] = None
+        self._spill_path: Optional[str] = None
+        self._hasher = hashlib.sha256()
+        self._lock = threading.Lock()
+
+        self.total_bytes = 0
+        self.last_activity = time.monotonic()
+
+    @property
+    def spilled(self) -> bool:
+        return self._spill_file is not None
+
+    def feed(self, chunk: bytes):
+        """Append a chunk of raw output"""
+        if not chunk:
+            return
+        with self._lock:
+            self.total_bytes += len(chunk)
+            self.last_activity = time.monotonic()
+            self._hasher.update(chunk)
+
+            if self._spill_file is None:
+                self._buffer.extend(chunk)
+                if len(self._buffer) <= self.head_bytes + self.tail_bytes:
+                    return
+                # Window exceeded: move the buffered bytes to disk and keep head/tail only
+                self._start_spill()
+                data = bytes(self._buffer)
+                self._buffer = bytearray()
+                self._head = data[:self.head_bytes]
+                self._spill_file.write(data)
+                self._tail = bytearray(data[-self.tail_bytes:])
+                return
+
+            self._spill_file.write(chunk)
+            self._tail.extend(chunk)
+            if len(self._tail) > self.tail_bytes:
+                del self._tail[:-self.tail_bytes]
+
+    def mark_activity(self):
+        """Record that the stream produced bytes that are being held back, not yet fed"""
+        self.last_activity = time.monotonic()
+
+    def _start_spill(self):
+        fd, path = tempfile.mkstemp(prefix='.capture-', suffix='.part', dir=self.store.output_dir)
+        self._spill_file = os.fdopen(fd, 'wb')
+        self._spill_path = path
+
+    def finish(self) -> Dict[str, Any]:
+        """Close the capture and return the bounded text plus a handle to the full output"""
+        with self._lock:
+            if self._spill_file is None:
+                return {
+                    'text': self._buffer.decode('utf-8', errors='replace'),
+                    'total_bytes': self.total_bytes,
+                    'truncated': False,
+                    'output_id': None
+                }
+
+            self._spill_file.close()
+            output_id = self.store.commit(self._spill_path, self._hasher.hexdigest())
+            self._spill_file = None
+
+            omitted = self.total_bytes - len(self._head) - len(self._tail)
+            text = (
+                self._head.decode('utf-8', errors='replace')
+                + f"\n... [{omitted} bytes omitted, full output id: {output_id}] ...\n"
+                + bytes(self._tail).decode('utf-8', errors='replace')
+            )
+            return {
+                'text': text,
+                'total_bytes': self.total_bytes,
+                'truncated': True,
+                'output_id': output_id
+            }
+
+
+class OutputStore:
+    """Content-addressed storage of full command outputs that exceeded the capture window"""
+
+    def __init__(self, output_dir: Path, head_bytes: int = DEFAULT_HEAD_BYTES,
+                 tail_bytes: int = DEFAULT_TAIL_BYTES, max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+                 max_bytes: int = DEFAULT_MAX_STORE_BYTES):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self._remove_stale_parts()
+
+    def _remove_stale_parts(self) -> int:
+        """Delete spill files of captures that never finished (the process died mid-command)"""
+        cutoff = time.time() - STALE_PART_SECONDS
+        removed = 0
+        for path in self.output_dir.glob('.capture-*.part'):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def prune(self) -> Dict[str, int]:
+        """Retention task: drop outputs older than max_age_days, then the oldest beyond max_bytes"""
+        cutoff = time.time() - self.max_age_days * 86400
+        entries = []
+        removed = 0
+        for path in self.output_dir.glob('*.log'):
+            try:
+                st = path.stat()
+                if st.st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+                else:
+                    entries.append((st.st_mtime, st.st_size, path))
+            except OSError:
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                removed += 1
+                total -= size
+            except OSError:
+                continue
+        return {'outputs_removed': removed, 'parts_removed': self._remove_stale_parts(), 'store_bytes': total}
+
+    def new_capture(self) -> BoundedCapture:
+        """Create a capture that spills into this store"""
+        return BoundedCapture(self, self.head_bytes, self.tail_bytes)
+
+    def _path_for(self, output_id: str) -> Path:
+        if not _OUTPUT_ID_RE.match(output_id or ''):
+            raise ValueError(f"Invalid output id: {output_id}")
+        return self.output_dir / f"{output_id}.log"
+
+    def commit(self, temp_path: str, digest: str) -> str:
+        """Move a finished spill file to its content address, dropping duplicates"""
+        final_path = self._path_for(digest)
+        if final_path.exists():
+            os.unlink(temp_path)
+            # Produced again: it ages from now
+            os.utime(final_path)
+        else:
+            os.replace(temp_path, final_path)
+        return digest
+
+    def discard(self, output_id: str):
+        """Delete a stored output no one will page back"""
+        try:
+            self._path_for(output_id).unlink()
+        except (ValueError, FileNotFoundError):
+            pass
+
+    def exists(self, output_id: str) -> bool:
+        try:
+            return self._path_for(output_id).exists()
+        except ValueError:
+            return False
+
+    def read_page(self, output_id: str, offset: int = 0, limit: int = DEFAULT_PAGE_BYTES) -> Dict[str, Any]:
+        """Read one page of a stored output starting at a byte offset"""
+        path = self._path_for(output_id)
+        if not path.exists():
+            raise FileNotFoundError(f"Output {output_id} not found")
+
+        offset = max(0, offset)
+        limit = max(1, min(limit, MAX_PAGE_BYTES))
+        total_size = path.stat().st_size
+
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(limit)
+
+        next_offset = offset + len(data)
+        return {
+            'output_id': output_id,
+            'offset': offset,
+            'next_offset': next_offset,
+            'total_bytes': total_size,
+            'eof': next_offset >= total_size,
+            'content': data.decode('utf-8', errors='replace')
+        }
+
+
+def pump_stream(stream: IO[bytes], capture: BoundedCapture):
+    """Drain a binary pipe into a capture until EOF (run in a reader thread)"""
+    try:
+        read = getattr(stream, 'read1', stream.read)
+        while True:
+            chunk = read(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            capture.feed(chunk)
+    except (OSError, ValueError):
+        pass
+    finally:
+        try:
+            stream.close()
+        except OSError:
+            pass
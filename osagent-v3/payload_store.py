@@ -0,0 +1,337 @@
+"""
+Compressed, deduplicated storage for conversation payloads.
+agent_response, execution_results and system_state used to be stored as full
+json.dumps text on every conversation row. They are now written as small
+reference strings pointing into a payload_blobs table where each distinct
+blob is stored once, compressed, and keyed by the SHA-256 of its canonical JSON.
+
+Reference formats stored in the conversations columns:
+    @blob:<hash>              a single JSON document
+    @list:<hash>,<hash>,...   a JSON list whose items are stored separately
+    @merge:<hash>,<hash>      JSON objects deep-merged in order (template + volatile)
+Anything else is legacy plain JSON text and is decoded as-is.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, zlib is always available
+    zstandard = None
+
+BLOB_PREFIX = '@blob:'
+LIST_PREFIX = '@list:'
+MERGE_PREFIX = '@merge:'
+
+# Recorded in PRAGMA user_version once legacy rows are migrated and their blob references backfilled
+PAYLOAD_SCHEMA_VERSION = 1
+
+# Payloads smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 96
+
+# Fields of a system_state snapshot that rarely change between requests. They are
+# stored as a shared "template" blob so only the volatile remainder is new per row.
+SYSTEM_STATE_TEMPLATE_FIELDS = {
+    'memory': ('total',),
+    'disk': ('total',),
+    'network_interfaces': None
+}
+
+
+def _canonical_json(obj: Any) -> bytes:
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def _deep_merge(base: Dict[str, Any], extra: Dict[str, Any]) -> Dict[str, Any]:
+    merged = dict(base)
+    for key, value in extra.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def split_system_state(state: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Split a system_state snapshot into its stable template and volatile remainder"""
+    template: Dict[str, Any] = {}
+    volatile: Dict[str, Any] = {}
+    for key, value in state.items():
+        if key not in SYSTEM_STATE_TEMPLATE_FIELDS:
+            volatile[key] = value
+            continue
+        fields = SYSTEM_STATE_TEMPLATE_FIELDS[key]
+        if fields is None or not isinstance(value, dict):
+            template[key] = value
+            continue
+        stable = {k: v for k, v in value.items() if k in fields}
+        rest = {k: v for k, v in value.items() if k not in fields}
+        if stable:
+            template[key] = stable
+        if rest:
+            volatile[key] = rest
+    return template, volatile
+
+
+class PayloadStore:
+    """Encodes JSON payloads into deduplicated, compressed blobs inside the agent database"""
+
+    def __init__(self, codec: Optional[str] = None, cache_size: int = 256, level: int = 6):
+        if codec is None:
+            codec = 'zstd' if zstandard is not None else 'zlib'
+        if codec == 'zstd' and zstandard is None:
+            raise ValueError("zstd codec requested but the zstandard package is not installed")
+        self.codec = codec
+        self.level = level
+        self.cache_size = cache_size
+
+        # Decompressed JSON bytes by hash; templates and common outputs are hit repeatedly
+        self._cache: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def init_schema(conn: sqlite3.Connection):
+        """Create the blob table"""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS payload_blobs (
+                hash TEXT PRIMARY KEY,
+                codec TEXT,
+                raw_size INTEGER,
+                data BLOB
+            )
+        ''')
+
+        # Which conversation uses which blob, so unreferenced blobs can be collected
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS payload_refs (
+                conversation_id INTEGER,
+                hash TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_payload_refs_hash ON payload_refs (hash)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_payload_refs_conversation ON payload_refs (conversation_id)')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_conversations_payload_refs
+            AFTER DELETE ON conversations
+            BEGIN
+                DELETE FROM payload_refs WHERE conversation_id = OLD.id;
+            END
+        ''')
+
+    # --- Compression -------------------------------------------------------
+
+    def _compress(self, raw: bytes) -> Tuple[str, bytes]:
+        if len(raw) < MIN_COMPRESS_BYTES:
+            return 'raw', raw
+        if self.codec == 'zstd':
+            return 'zstd', zstandard.ZstdCompressor(level=self.level).compress(raw)
+        return 'zlib', zlib.compress(raw, self.level)
+
+    @staticmethod
+    def _decompress(codec: str, data: bytes) -> bytes:
+        if codec == 'raw':
+            return bytes(data)
+        if codec == 'zlib':
+            return zlib.decompress(data)
+        if codec == 'zstd':
+            if zstandard is None:
+                raise ValueError("Blob is zstd-compressed but the zstandard package is not installed")
+            return zstandard.ZstdDecompressor().decompress(data)
+        raise ValueError(f"Unknown payload codec: {codec}")
+
+    def _cache_put(self, blob_hash: str, raw: bytes):
+        with self._cache_lock:
+            self._cache[blob_hash] = raw
+            self._cache.move_to_end(blob_hash)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_get(self, blob_hash: str) -> Optional[bytes]:
+        with self._cache_lock:
+            raw = self._cache.get(blob_hash)
+            if raw is not None:
+                self._cache.move_to_end(blob_hash)
+            return raw
+
+    # --- Blob level --------------------------------------------------------
+
+    def put(self, conn: sqlite3.Connection, obj: Any) -> str:
+        """Store a JSON-serializable object once and return its hash"""
+        raw = _canonical_json(obj)
+        blob_hash = hashlib.sha256(raw).hexdigest()
+
+        # Always ask the database: a cached hash may belong to a rolled back or collected blob
+        exists = conn.execute('SELECT 1 FROM payload_blobs WHERE hash = ?', (blob_hash,)).fetchone()
+        if not exists:
+            codec, data = self._compress(raw)
+            conn.execute(
+                'INSERT OR IGNORE INTO payload_blobs (hash, codec, raw_size, data) VALUES (?, ?, ?, ?)',
+                (blob_hash, codec, len(raw), sqlite3.Binary(data))
+            )
+        return blob_hash
+
+    def get(self, conn: sqlite3.Connection, blob_hash: str) -> Any:
+        """Load and decode a blob by hash"""
+        raw = self._cache_get(blob_hash)
+        if raw is None:
+            row = conn.execute('SELECT codec, data FROM payload_blobs WHERE hash = ?', (blob_hash,)).fetchone()
+            if row is None:
+                raise KeyError(f"Payload blob {blob_hash} is missing")
+            raw = self._decompress(row[0], row[1])
+            self._cache_put(blob_hash, raw)
+        return json.loads(raw)
+
+    # --- Column level ------------------------------------------------------
+
+    def encode(self, conn: sqlite3.Connection, obj: Any) -> str:
+        """Encode a generic payload as a single blob reference"""
+        return BLOB_PREFIX + self.put(conn, obj)
+
+    def encode_list(self, conn: sqlite3.Connection, items: List[Any]) -> str:
+        """Encode a list so identical items (e.g. repeated command outputs) are shared"""
+        return LIST_PREFIX + ','.join(self.put(conn, item) for item in items)
+
+    def encode_system_state(self, conn: sqlite3.Connection, state: Dict[str, Any]) -> str:
+        """Encode a system_state snapshot as a shared template plus a volatile blob"""
+        if not isinstance(state, dict):
+            return self.encode(conn, state)
+        template, volatile = split_system_state(state)
+        return MERGE_PREFIX + self.put(conn, template) + ',' + self.put(conn, volatile)
+
+    def decode(self, conn: sqlite3.Connection, text: Optional[str]) -> Any:
+        """Decode a column value written by any of the encode methods, or legacy JSON"""
+        if text is None:
+            return None
+        if text.startswith(BLOB_PREFIX):
+            return self.get(conn, text[len(BLOB_PREFIX):])
+        if text.startswith(LIST_PREFIX):
+            hashes = text[len(LIST_PREFIX):]
+            return [self.get(conn, h) for h in hashes.split(',')] if hashes else []
+        if text.startswith(MERGE_PREFIX):
+            merged: Dict[str, Any] = {}
+            for blob_hash in text[len(MERGE_PREFIX):].split(','):
+                merged = _deep_merge(merged, self.get(conn, blob_hash))
+            return merged
+        return json.loads(text)
+
+    @staticmethod
+    def is_encoded(text: Optional[str]) -> bool:
+        return bool(text) and text.startswith('@')
+
+    @staticmethod
+    def referenced_hashes(text: Optional[str]) -> List[str]:
+        """Blob hashes referenced by an encoded column value"""
+        if not text or not text.startswith('@'):
+            return []
+        _, _, body = text.partition(':')
+        return [h for h in body.split(',') if h]
+
+    def add_refs(self, conn: sqlite3.Connection, conversation_id: int, *texts: Optional[str]):
+        """Record the blobs used by a conversation row"""
+        hashes = {h for text in texts for h in self.referenced_hashes(text)}
+        conn.executemany('INSERT INTO payload_refs (conversation_id, hash) VALUES (?, ?)',
+                         [(conversation_id, h) for h in hashes])
+
+
+class LazyPayload:
+    """A stored payload that is only decompressed and parsed when first accessed"""
+
+    def __init__(self, db_path: Path, store: PayloadStore, text: Optional[str]):
+        self._db_path = db_path
+        self._store = store
+        self._text = text
+        self._value: Any = None
+        self._loaded = False
+
+    @property
+    def value(self) -> Any:
+        if not self._loaded:
+            if self._store.is_encoded(self._text):
+                with sqlite3.connect(self._db_path) as conn:
+                    self._value = self._store.decode(conn, self._text)
+            else:
+                self._value = self._store.decode(None, self._text)
+            self._loaded = True
+        return self._value
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self._loaded else 'pending'
+        return f"<LazyPayload {state} {str(self._text)[:24]!r}>"
+
+
+def migrate_conversation_payloads(conn: sqlite3.Connection, store: PayloadStore,
+                                  batch_size: int = 500) -> Optional[Dict[str, int]]:
+    """Rewrite legacy plain-JSON conversation rows into the blob format, one batch per transaction.
+    Runs once per database: None when it already has (PRAGMA user_version records it)"""
+    PayloadStore.init_schema(conn)
+    if conn.execute('PRAGMA user_version').fetchone()[0] >= PAYLOAD_SCHEMA_VERSION:
+        return None
+    stats = {'rows_migrated': 0, 'rows_skipped': 0}
+    last_id = 0
+
+    while True:
+        rows = conn.execute('''
+            SELECT id, agent_response, execution_results, system_state
+            FROM conversations
+            WHERE id > ? AND (agent_response NOT LIKE '@%' OR execution_results NOT LIKE '@%'
+                              OR system_state NOT LIKE '@%')
+            ORDER BY id
+            LIMIT ?
+        ''', (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+
+        for row_id, agent_response, execution_results, system_state in rows:
+            last_id = row_id
+            try:
+                encoded_response = agent_response if store.is_encoded(agent_response) \
+                    else store.encode(conn, json.loads(agent_response or 'null'))
+                if store.is_encoded(execution_results):
+                    encoded_results = execution_results
+                else:
+                    results = json.loads(execution_results or '[]')
+                    encoded_results = store.encode_list(conn, results) if isinstance(results, list) \
+                        else store.encode(conn, results)
+                encoded_state = system_state if store.is_encoded(system_state) \
+                    else store.encode_system_state(conn, json.loads(system_state or '{}'))
+            except (json.JSONDecodeError, TypeError):
+                # Leave rows we cannot parse untouched
+                stats['rows_skipped'] += 1
+                continue
+
+            conn.execute('''
+                UPDATE conversations
+                SET agent_response = ?, execution_results = ?, system_state = ?
+                WHERE id = ?
+            ''', (encoded_response, encoded_results, encoded_state, row_id))
+            conn.execute('DELETE FROM payload_refs WHERE conversation_id = ?', (row_id,))
+            store.add_refs(conn, row_id, encoded_response, encoded_results, encoded_state)
+            stats['rows_migrated'] += 1
+
+        conn.commit()
+
+    # Rows encoded before blob references were tracked
+    unreferenced = conn.execute('''
+        SELECT id, agent_response, execution_results, system_state FROM conversations c
+        WHERE agent_response LIKE '@%'
+          AND NOT EXISTS (SELECT 1 FROM payload_refs r WHERE r.conversation_id = c.id)
+    ''').fetchall()
+    for row_id, *texts in unreferenced:
+        store.add_refs(conn, row_id, *texts)
+    stats['refs_backfilled'] = len(unreferenced)
+    # Every row written from now on is encoded and referenced as it is stored
+    conn.execute(f'PRAGMA user_version = {PAYLOAD_SCHEMA_VERSION}')
+    conn.commit()
+
+    return stats
@@ -0,0 +1,97 @@
+"""
+Server-side store for plans that are waiting on user confirmation.
+When a plan contains steps that need approval, it is kept here under a plan
+ID instead of being thrown away. Confirming executes exactly the stored steps,
+without another planning call. Steps ahead of the first confirmation are run
+speculatively on a background thread while the user decides, and are not run
+again when the plan resumes.
+"""
+
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_TTL_SECONDS = 15 * 60
+DEFAULT_MAX_PLANS = 100
+
+
+@dataclass
+class PlanStep:
+    """One planner entry: a shell command or a native file operation"""
+    command: str
+    spec: Dict[str, Any]
+    requires_confirmation: bool = False
+
+
+@dataclass
+class PendingPlan:
+    plan_id: str
+    user_request: str
+    gemini_response: Dict[str, Any]
+    steps: List[PlanStep]
+    created: float = field(default_factory=time.monotonic)
+    next_index: int = 0
+    execution_results: List[Dict[str, Any]] = field(default_factory=list)
+    worker: Optional[threading.Thread] = None
+    # Set when the plan is one step of an iterative run, so confirming continues the loop
+    loop_state: Optional[Dict[str, Any]] = None
+
+    def wait(self):
+        """Block until the speculative part of the plan has finished"""
+        if self.worker is not None:
+            self.worker.join()
+            self.worker = None
+
+    def all_results(self) -> List[Dict[str, Any]]:
+        """Results of every step run so far, including earlier rounds of an iterative run"""
+        if self.loop_state is not None:
+            return [r for entry in self.loop_state['history'] for r in entry['results']]
+        return self.execution_results
+
+    def pending_commands(self) -> List[str]:
+        return [s.command for s in self.steps[self.next_index:] if s.requires_confirmation]
+
+
+class PlanStore:
+    """Plans awaiting confirmation, keyed by plan ID, dropped after a TTL"""
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_plans: int = DEFAULT_MAX_PLANS):
+        self.ttl_seconds = ttl_seconds
+        self.max_plans = max_plans
+        self._plans: Dict[str, PendingPlan] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    def add(self, plan: PendingPlan) -> List[PendingPlan]:
+        """Store a plan; returns plans evicted to make room or because they expired"""
+        with self._lock:
+            evicted = self._pop_expired()
+            while len(self._plans) >= self.max_plans:
+                oldest = min(self._plans.values(), key=lambda p: p.created)
+                evicted.append(self._plans.pop(oldest.plan_id))
+            self._plans[plan.plan_id] = plan
+        return evicted
+
+    def take(self, plan_id: str) -> Tuple[Optional[PendingPlan], bool]:
+        """Remove and return a plan and whether it had expired (None if unknown); an expired
+        plan is returned too, so its steps already run can still be recorded"""
+        with self._lock:
+            plan = self._plans.pop(plan_id, None)
+        return plan, plan is not None and time.monotonic() - plan.created > self.ttl_seconds
+
+    def pop_expired(self) -> List[PendingPlan]:
+        with self._lock:
+            return self._pop_expired()
+
+    def _pop_expired(self) -> List[PendingPlan]:
+        now = time.monotonic()
+        expired = [pid for pid, p in self._plans.items() if now - p.created > self.ttl_seconds]
+        return [self._plans.pop(pid) for pid in expired]
+
+    def __len__(self) -> int:
+        return len(self._plans)
@@ -0,0 +1,317 @@
+"""
+Process-table snapshot engine for the OS Agent.
+A background sampler reads the process table at a fixed interval (straight
+from /proc on Linux, through psutil elsewhere) and computes CPU% and IO rates
+from the delta between consecutive samples, so the very first query already
+returns real numbers. Each snapshot is stored column-wise in compact arrays
+and top-K queries use a heap instead of sorting every process.
+"""
+
+import heapq
+import logging
+import os
+import threading
+import time
+from array import array
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import psutil
+
+try:
+    import pwd
+except ImportError:  # Windows
+    pwd = None
+
+logger = logging.getLogger(__name__)
+
+SORT_KEYS = ('cpu', 'memory', 'io')
+
+
+class RawProcess(NamedTuple):
+    """One process as read from the OS; times in seconds, sizes in bytes"""
+    pid: int
+    ppid: int
+    name: str
+    uid: int
+    start_time: float
+    cpu_time: float
+    rss: int
+    io_bytes: int
+
+
+def read_proc_linux(proc_root: str = '/proc', collect_io: bool = True) -> Iterable[RawProcess]:
+    """Read the process table directly from procfs"""
+    clock_ticks = os.sysconf('SC_CLK_TCK')
+    page_size = os.sysconf('SC_PAGE_SIZE')
+
+    for entry in os.scandir(proc_root):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"{entry.path}/stat", 'rb') as f:
+                stat = f.read()
+            uid = entry.stat().st_uid
+        except OSError:
+            continue  # process exited while we were reading
+
+        # comm is wrapped in parentheses and may itself contain spaces or ')'
+        lparen = stat.find(b'(')
+        rparen = stat.rfind(b')')
+        name = stat[lparen + 1:rparen].decode('utf-8', errors='replace')
+        fields = stat[rparen + 2:].split()
+
+        io_bytes = 0
+        if collect_io:
+            try:
+                with open(f"{entry.path}/io", 'rb') as f:
+                    for line in f:
+                        if line.startswith(b'read_bytes') or line.startswith(b'write_bytes'):
+                            io_bytes += int(line.split()[1])
+            except (OSError, ValueError):
+                pass  # /proc/<pid>/io is only readable for our own processes unless privileged
+
+        yield RawProcess(
+            pid=int(entry.name),
+            ppid=int(fields[1]),
+            name=name,
+            uid=uid,
+            start_time=int(fields[19]) / clock_ticks,
+            cpu_time=(int(fields[11]) + int(fields[12])) / clock_ticks,
+            rss=int(fields[21]) * page_size,
+            io_bytes=io_bytes
+        )
+
+
+def read_proc_psutil(collect_io: bool = True) -> Iterable[RawProcess]:
+    """Portable process table reader for platforms without procfs"""
+    attrs = ['pid', 'ppid', 'name', 'uids', 'create_time', 'cpu_times', 'memory_info']
+    if collect_io:
+        attrs.append('io_counters')
+    for proc in psutil.process_iter(attrs):
+        info = proc.info
+        cpu = info.get('cpu_times')
+        mem = info.get('memory_info')
+        io = info.get('io_counters') if collect_io else None
+        uids = info.get('uids')
+        yield RawProcess(
+            pid=info['pid'],
+            ppid=info.get('ppid') or 0,
+            name=info.get('name') or '',
+            uid=uids.real if uids else -1,
+            start_time=info.get('create_time') or 0.0,
+            cpu_time=(cpu.user + cpu.system) if cpu else 0.0,
+            rss=mem.rss if mem else 0,
+            io_bytes=(io.read_bytes + io.write_bytes) if io else 0
+        )
+
+
+class ProcessTable:
+    """Column-oriented snapshot of all processes with rates computed from the previous sample"""
+
+    def __init__(self, sampled_at: float, interval: float):
+        self.sampled_at = sampled_at
+        self.interval = interval
+        self.pids = array('l')
+        self.ppids = array('l')
+        self.uids = array('l')
+        self.start_times = array('d')
+        self.cpu_percent = array('d')
+        self.rss = array('Q')
+        self.io_rate = array('d')
+        self.names: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.pids)
+
+    def append(self, raw: RawProcess, cpu_percent: float, io_rate: float):
+        self.pids.append(raw.pid)
+        self.ppids.append(raw.ppid)
+        self.uids.append(raw.uid)
+        self.start_times.append(raw.start_time)
+        self.cpu_percent.append(cpu_percent)
+        self.rss.append(raw.rss)
+        self.io_rate.append(io_rate)
+        self.names.append(raw.name)
+
+    def column(self, sort_by: str):
+        if sort_by == 'cpu':
+            return self.cpu_percent
+        if sort_by == 'memory':
+            return self.rss
+        if sort_by == 'io':
+            return self.io_rate
+        raise ValueError(f"Unknown sort key '{sort_by}', expected one of {', '.join(SORT_KEYS)}")
+
+
+class ProcessSampler:
+    """Keeps an up-to-date ProcessTable by sampling on a background thread"""
+
+    def __init__(self, interval: float = 2.0, collect_io: bool = True,
+                 source: Optional[Callable[[], Iterable[RawProcess]]] = None):
+        self.interval = interval
+        self.collect_io = collect_io
+        if source is None:
+            if os.path.isdir('/proc/self'):
+                source = lambda: read_proc_linux(collect_io=self.collect_io)
+            else:
+                source = lambda: read_proc_psutil(collect_io=self.collect_io)
+        self._source = source
+        self._total_memory = psutil.virtual_memory().total
+
+        # (pid, start_time) -> (cpu_time, io_bytes) from the previous sample; the start
+        # time in the key keeps a recycled pid from inheriting another process's counters
+        self._previous: Dict[Tuple[int, float], Tuple[float, int]] = {}
+        self._previous_at: Optional[float] = None
+        self._table: Optional[ProcessTable] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # System-wide CPU% over the same interval, so status queries never block to measure it
+        self.cpu_percent = 0.0
+        psutil.cpu_percent(interval=None)
+
+        self._user_names: Dict[int, str] = {}
+        self._cgroups: Dict[Tuple[int, float], str] = {}
+
+    # --- Lifecycle ---------------------------------------------------------
+
+    def start(self):
+        """Take a baseline sample and start the background thread (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self.sample()
+        self._thread = threading.Thread(target=self._loop, name='process-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        # The first delta comes quickly so early queries do not wait a full interval
+        wait = min(0.5, self.interval)
+        failure = None
+        while not self._stop.wait(wait):
+            try:
+                self.sample()
+                failure = None
+            except Exception as e:
+                # Once per distinct error rather than every interval; the last snapshot stays served
+                if str(e) != failure:
+                    logger.warning("Process sampling failed, serving the previous sample: %s", e)
+                failure = str(e)
+            wait = self.interval
+
+    # --- Sampling ----------------------------------------------------------
+
+    def sample(self) -> ProcessTable:
+        """Read the process table once and publish it as the current snapshot"""
+        now = time.monotonic()
+        elapsed = (now - self._previous_at) if self._previous_at is not None else None
+        previous = self._previous
+        current: Dict[Tuple[int, float], Tuple[float, int]] = {}
+        table = ProcessTable(time.time(), elapsed or 0.0)
+
+        for raw in self._source():
+            key = (raw.pid, raw.start_time)
+            current[key] = (raw.cpu_time, raw.io_bytes)
+            before = previous.get(key)
+            if before is None or not elapsed:
+                cpu_percent = 0.0
+                io_rate = 0.0
+            else:
+                cpu_percent = max(0.0, (raw.cpu_time - before[0]) / elapsed * 100.0)
+                io_rate = max(0.0, (raw.io_bytes - before[1]) / elapsed)
+            table.append(raw, cpu_percent, io_rate)
+
+        self._previous = current
+        self._previous_at = now
+        cpu_percent = psutil.cpu_percent(interval=None)
+        with self._lock:
+            self._table = table
+            if elapsed:
+                self.cpu_percent = cpu_percent
+            # Forget cgroups of processes that are gone
+            self._cgroups = {k: v for k, v in self._cgroups.items() if k in current}
+        if elapsed:
+            self._ready.set()
+        return table
+
+    def snapshot(self, wait: float = 1.0) -> Optional[ProcessTable]:
+        """Latest table with real rates, waiting briefly for the first delta if needed"""
+        self._ready.wait(wait)
+        with self._lock:
+            return self._table
+
+    # --- Queries -----------------------------------------------------------
+
+    def _user_name(self, uid: int) -> str:
+        name = self._user_names.get(uid)
+        if name is None:
+            try:
+                name = pwd.getpwuid(uid).pw_name if pwd and uid >= 0 else str(uid)
+            except KeyError:
+                name = str(uid)
+            self._user_names[uid] = name
+        return name
+
+    def _cgroup(self, table: ProcessTable, i: int) -> str:
+        # Looked up lazily and cached per process: reading /proc/<pid>/cgroup for every
+        # process on every sample would double the cost of sampling
+        key = (table.pids[i], table.start_times[i])
+        path = self._cgroups.get(key)
+        if path is None:
+            try:
+                with open(f"/proc/{table.pids[i]}/cgroup", 'r') as f:
+                    content = f.read()
+            except OSError:
+                content = ''
+            # cgroup v2 has a single "0::/path" line; with v1 all hierarchies are joined
+            path = ','.join(line.split(':', 2)[2] for line in content.splitlines() if line.count(':') >= 2)
+            with self._lock:
+                self._cgroups[key] = path
+        return path
+
+    def top(self, limit: int = 20, sort_by: str = 'cpu', name: Optional[str] = None,
+            user: Optional[str] = None, cgroup: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Top processes by cpu, memory or io, optionally filtered by name, user and cgroup"""
+        table = self.snapshot()
+        if table is None:
+            return []
+        column = table.column(sort_by)
+
+        indices: Iterable[int] = range(len(table))
+        if name:
+            needle = name.lower()
+            indices = [i for i in indices if needle in table.names[i].lower()]
+        if user:
+            indices = [i for i in indices if self._user_name(table.uids[i]) == user or str(table.uids[i]) == user]
+        if cgroup:
+            indices = [i for i in indices if cgroup in self._cgroup(table, i)]
+
+        best = heapq.nlargest(limit, indices, key=column.__getitem__)
+        return [self._row(table, i) for i in best]
+
+    def _row(self, table: ProcessTable, i: int) -> Dict[str, Any]:
+        return {
+            'pid': table.pids[i],
+            'ppid': table.ppids[i],
+            'name': table.names[i],
+            'user': self._user_name(table.uids[i]),
+            'cpu_percent': round(table.cpu_percent[i], 1),
+            'memory_percent': round(table.rss[i] / self._total_memory * 100, 2) if self._total_memory else 0.0,
+            'rss': table.rss[i],
+            'io_bytes_per_sec': round(table.io_rate[i], 1)
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        table = self.snapshot(wait=0)
+        return {
+            'process_count': len(table) if table else 0,
+            'sampled_at': table.sampled_at if table else None,
+            'interval': table.interval if table else None
+        }
@@ -0,0 +1,63 @@
+"""
+Which shell commands only read system state.
+One classifier shared by the iterative loop, which runs read-only probes
+concurrently, and the result cache, which may reuse their results. A command
+is read-only when every stage of its pipeline is a program from the
+allow-list, in an argument form that cannot write or change anything, and
+the shell is not asked to redirect, chain or substitute.
+"""
+
+from typing import Dict, List, Sequence, Tuple
+
+# Programs that only read state, in every argument form let through below. Anything that
+# can write through an option (sort -o, uniq IN OUT, find -delete, ...) is left out
+READ_ONLY_PROGRAMS = frozenset({
+    'ls', 'cat', 'head', 'tail', 'wc', 'grep', 'egrep', 'fgrep', 'stat', 'file', 'du', 'df', 'pwd',
+    'whoami', 'id', 'uname', 'uptime', 'free', 'ps', 'which', 'echo', 'printenv', 'lsblk', 'lscpu',
+    'nproc', 'md5sum', 'sha1sum', 'sha256sum', 'readlink', 'realpath', 'basename', 'dirname', 'cut',
+    'tr', 'tac', 'nl', 'dir', 'tasklist', 'systeminfo', 'ver', 'ipconfig', 'lsof',
+    'hostname', 'arch', 'lsb_release', 'ip'
+})
+SHELL_WRITE_TOKENS = ('>', ';', '&', '`', '$(', '<(', '\n')
+
+# Single-letter or long options that make an allowed program write or change state, or keep it
+# running until it is killed (tail -f), which would stall a whole batch of probes
+_WRITE_FLAGS: Dict[str, Tuple[str, ...]] = {
+    'hostname': ('F', 'b', '--file', '--boot'),
+    'tail': ('f', 'F', '--follow', '--retry'),
+    'free': ('s', 'c', '--seconds', '--count'),
+}
+# Programs that set what they would otherwise print when given an operand (hostname NAME)
+_NO_OPERANDS = frozenset({'hostname'})
+# ip objects and the verbs that only show them
+_IP_READ_ONLY = {'addr', 'a', 'address', 'link', 'l', 'route', 'r', 'neigh', 'n'}
+
+
+def flag_matches(token: str, flags: Sequence[str]) -> bool:
+    """Whether an option token (-abc, --long=value) sets any of flags"""
+    if token.startswith('--'):
+        return token.split('=', 1)[0] in flags
+    return any(letter in flags for letter in token[1:])
+
+
+def is_read_only_words(words: List[str]) -> bool:
+    """Whether one simple command, already split into words, only reads"""
+    if not words or words[0] not in READ_ONLY_PROGRAMS:
+        return False
+    program, args = words[0], words[1:]
+    flags = _WRITE_FLAGS.get(program, ())
+    if any(arg.startswith('-') and flag_matches(arg, flags) for arg in args):
+        return False
+    if program in _NO_OPERANDS and any(not arg.startswith('-') for arg in args):
+        return False
+    if program == 'ip':
+        return bool(args) and args[0] in _IP_READ_ONLY and all(a in ('show', 'list') or a.startswith('-')
+                                                               for a in args[1:])
+    return True
+
+
+def is_read_only_command(command: str) -> bool:
+    """Whether a shell command line only reads: no redirections or chaining, read-only stages"""
+    if any(token in command for token in SHELL_WRITE_TOKENS):
+        return False
+    return all(is_read_only_words(segment.split()) for segment in command.split('|'))
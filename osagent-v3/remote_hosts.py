@@ -0,0 +1,299 @@
+"""
+Remote execution on other machines through lightweight worker daemons.
+A worker (worker.py) runs on each managed host and serves a handful of agent
+methods (commands, system status, processes, file operations) over a compact
+RPC: length-prefixed JSON frames on a persistent TCP connection. The
+coordinator keeps one connection per host and reuses it for every call, and
+fans a call out to many hosts concurrently, collecting the results per host.
+
+Workers execute whatever the coordinator sends, so they always require a
+shared token (OSAGENT_WORKER_TOKEN), including on the loopback address where
+any local user could otherwise connect.
+"""
+
+import hmac
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from command_timeouts import TimeoutPolicy
+
+DEFAULT_PORT = 7070
+CONNECT_TIMEOUT = 10
+# Status queries and the like; calls that run commands or file operations get LONG_CALL_TIMEOUT
+DEFAULT_TIMEOUT = 90
+# A worker gives a command at most the timeout policy's hard limit, however much it prints
+LONG_CALL_TIMEOUT = TimeoutPolicy().max_seconds + 60
+LONG_METHODS = {'execute_command', 'file_operation'}
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+_HEADER = struct.Struct('>I')
+# Safe to send twice; a call that may have reached the worker is only retried if it is one of these
+IDEMPOTENT_METHODS = {'ping', 'get_system_status', 'list_processes'}
+
+
+class RemoteError(Exception):
+    """A worker could not be reached or failed to serve a call"""
+
+
+def _send_frame(sock: socket.socket, payload: Dict[str, Any]):
+    data = json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+def _peer_closed(sock: socket.socket) -> bool:
+    """Whether an idle connection has been closed (or reset) by the other side"""
+    timeout = sock.gettimeout()
+    sock.setblocking(False)
+    try:
+        # An idle connection has nothing to read; EOF or stray data both mean it is unusable
+        sock.recv(1, socket.MSG_PEEK)
+        return True
+    except BlockingIOError:
+        return False
+    except OSError:
+        return True
+    finally:
+        sock.settimeout(timeout)
+
+
+def _recv_frame(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    """Next frame, or None when the peer closed the connection"""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    (size,) = _HEADER.unpack(header)
+    if size > MAX_FRAME_BYTES:
+        raise RemoteError(f"Frame of {size} bytes exceeds the {MAX_FRAME_BYTES} byte limit")
+    data = _recv_exact(sock, size)
+    if data is None:
+        return None
+    return json.loads(data)
+
+
+# --- Worker side -----------------------------------------------------------
+
+def worker_methods(agent) -> Dict[str, Callable[..., Any]]:
+    """The agent methods a worker serves, by RPC method name"""
+    return {
+        'ping': lambda: {'host': socket.gethostname(), 'system': agent.system_info['system']},
+        # Confirmation is enforced by the coordinator before anything is sent
+        'execute_command': lambda command: _without_output_ids(agent, agent._execute_command(command, confirm=True)),
+        'get_system_status': agent.get_system_status,
+        'list_processes': agent.list_processes,
+        'file_operation': agent._run_file_operation,
+    }
+
+
+def _without_output_ids(agent, result: Dict[str, Any]) -> Dict[str, Any]:
+    """A command result without handles to spilled output, which only this host could page back"""
+    for key in ('output_id', 'error_id'):
+        output_id = result.pop(key, None)
+        if output_id:
+            agent.output_store.discard(output_id)
+    return result
+
+
+class _WorkerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server: WorkerServer = self.server
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        authenticated = False
+        while True:
+            try:
+                frame = _recv_frame(sock)
+            except (OSError, ValueError, RemoteError):
+                return
+            if frame is None:
+                return
+            call_id = frame.get('id')
+            if not authenticated:
+                if frame.get('method') == 'auth' and hmac.compare_digest(
+                        str(frame.get('params', {}).get('token', '')), server.token):
+                    authenticated = True
+                    _send_frame(sock, {'id': call_id, 'result': True})
+                    continue
+                _send_frame(sock, {'id': call_id, 'error': 'Authentication required'})
+                return
+            if frame.get('method') == 'auth':
+                _send_frame(sock, {'id': call_id, 'result': True})
+                continue
+            method = server.methods.get(frame.get('method'))
+            if method is None:
+                response = {'id': call_id, 'error': f"Unknown method: {frame.get('method')}"}
+            else:
+                try:
+                    response = {'id': call_id, 'result': method(**(frame.get('params') or {}))}
+                except Exception as e:
+                    response = {'id': call_id, 'error': f"{type(e).__name__}: {e}"}
+            try:
+                _send_frame(sock, response)
+            except OSError:
+                return
+
+
+class WorkerServer(socketserver.ThreadingTCPServer):
+    """Serves worker_methods(agent), one thread per coordinator connection"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, agent, token: str, host: str = '127.0.0.1', port: int = DEFAULT_PORT):
+        if not token:
+            raise ValueError("A worker needs a token (OSAGENT_WORKER_TOKEN)")
+        self.methods = worker_methods(agent)
+        self.token = token
+        super().__init__((host, port), _WorkerHandler)
+
+
+# --- Coordinator side ------------------------------------------------------
+
+class WorkerClient:
+    """One persistent connection to a worker, reconnected on demand"""
+
+    def __init__(self, address: Tuple[str, int], token: Optional[str] = None, timeout: float = DEFAULT_TIMEOUT):
+        self.address = address
+        self.token = token
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.create_connection(self.address, timeout=CONNECT_TIMEOUT)
+        sock.settimeout(self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.token:
+            _send_frame(sock, {'id': 0, 'method': 'auth', 'params': {'token': self.token}})
+            reply = _recv_frame(sock)
+            if not reply or reply.get('error'):
+                sock.close()
+                raise RemoteError((reply or {}).get('error', 'Worker closed the connection during authentication'))
+        return sock
+
+    def call(self, method: str, **params) -> Any:
+        with self._lock:
+            # A reused connection may have been closed by the worker since the last call.
+            # That is checked before sending; a failure after the request may have been
+            # delivered is retried on a fresh connection only for idempotent methods
+            if self._sock is not None and _peer_closed(self._sock):
+                self.close_locked()
+            for attempt in (0, 1):
+                reused = self._sock is not None
+                try:
+                    if self._sock is None:
+                        self._sock = self._connect()
+                    self._next_id += 1
+                    _send_frame(self._sock, {'id': self._next_id, 'method': method, 'params': params})
+                    if method in LONG_METHODS:
+                        self._sock.settimeout(max(self.timeout, LONG_CALL_TIMEOUT))
+                    try:
+                        reply = _recv_frame(self._sock)
+                    finally:
+                        if self._sock is not None:
+                            self._sock.settimeout(self.timeout)
+                    if reply is None:
+                        raise ConnectionResetError("Worker closed the connection")
+                except (OSError, ValueError) as e:
+                    self.close_locked()
+                    if (reused and attempt == 0 and method in IDEMPOTENT_METHODS
+                            and not isinstance(e, socket.timeout)):
+                        continue
+                    raise RemoteError(f"{self.address[0]}:{self.address[1]}: {e}") from e
+                if 'error' in reply:
+                    raise RemoteError(reply['error'])
+                return reply.get('result')
+
+    def close_locked(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def close(self):
+        with self._lock:
+            self.close_locked()
+
+
+def parse_hosts(spec: str) -> Dict[str, Tuple[str, int]]:
+    """'web1=10.0.0.5:7070,web2=10.0.0.6' -> {'web1': ('10.0.0.5', 7070), 'web2': ('10.0.0.6', 7070)}"""
+    hosts = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, address = item.partition('=')
+        if not address:
+            name, address = item, item
+        host, _, port = address.rpartition(':') if ':' in address else (address, '', '')
+        hosts[name.strip()] = (host or address, int(port) if port else DEFAULT_PORT)
+    return hosts
+
+
+class HostPool:
+    """Named workers with reused connections and concurrent fan-out"""
+
+    def __init__(self, hosts: Dict[str, Tuple[str, int]], token: Optional[str] = None,
+                 timeout: float = DEFAULT_TIMEOUT, max_parallel: int = 32):
+        self.clients = {name: WorkerClient(address, token, timeout) for name, address in hosts.items()}
+        self._executor = ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(hosts))),
+                                            thread_name_prefix='remote-host') if hosts else None
+
+    @classmethod
+    def from_env(cls) -> 'HostPool':
+        """Hosts from OSAGENT_HOSTS, authenticated with OSAGENT_WORKER_TOKEN"""
+        return cls(parse_hosts(os.getenv('OSAGENT_HOSTS', '')), os.getenv('OSAGENT_WORKER_TOKEN'))
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.clients)
+
+    def resolve(self, hosts: Any) -> List[str]:
+        """Planner host selection ('all', a name or a list of names) -> known host names"""
+        if hosts in ('all', '*', ['all'], ['*']):
+            return self.names
+        if isinstance(hosts, str):
+            hosts = [hosts]
+        unknown = [h for h in hosts if h not in self.clients]
+        if unknown:
+            raise ValueError(f"Unknown host(s): {', '.join(unknown)}. Known hosts: {', '.join(self.names) or 'none'}")
+        return list(hosts)
+
+    def call(self, host: str, method: str, **params) -> Any:
+        return self.clients[host].call(method, **params)
+
+    def fan_out(self, method: str, hosts: Optional[List[str]] = None, **params) -> Dict[str, Dict[str, Any]]:
+        """Call method on every host at once; {host: {'success', 'result' | 'error'}} in host order"""
+        hosts = self.names if hosts is None else hosts
+        if not hosts:
+            return {}
+        futures = {h: self._executor.submit(self.clients[h].call, method, **params) for h in hosts}
+        results = {}
+        for host, future in futures.items():
+            try:
+                results[host] = {'success': True, 'result': future.result()}
+            except Exception as e:
+                results[host] = {'success': False, 'error': str(e)}
+        return results
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def __len__(self) -> int:
+        return len(self.clients)
@@ -0,0 +1,256 @@
+"""
+Result cache for read-only, idempotent commands.
+Plans often repeat the same cheap queries within seconds, across turns and
+sessions: df -h, uname -a, free -m, or an ls of the same directory. Each one
+forks a process. A command is cacheable only when both hold:
+- it is a single simple command from an allow-list of read-only programs,
+  with no pipes, redirections, substitutions, globs or variable expansion;
+- it has none of the flags that make an allowed program read more than the
+  cache can validate (ls -l).
+
+Its successful result is then reused for that program's TTL. The TTL is
+minutes for facts that do not change (uname, hostname) and seconds for
+live figures (df, free, uptime).
+
+For commands that read paths (cat, stat, wc, ...), the mtime, ctime, size
+and inode of every path they name are recorded just before the command runs.
+For ls without arguments, the working directory is recorded. An entry is
+reused only while those still match. A named file edited or chmod'ed a
+moment ago is therefore never served stale. A directory's own stat only
+changes when entries are added, removed or renamed. So only a plain name
+listing (ls without -l, -s, -t, -R, ...) of a directory is cached, and
+recursive totals (du) never are.
+
+Entries that do not depend on named paths (df, free, ip, ...) cannot be
+validated that way, so whenever a command that is not cacheable runs (rm,
+apt install, a background job), they are dropped: `df -h; rm -rf big; df -h`
+measures the disk again.
+
+Which programs only read is decided by read_only, the classifier the
+iterative loop uses too; the rules here only say how long results of the
+cacheable ones stay valid.
+
+Concurrent identical commands (same command, same working directory) are
+coalesced: the first caller runs it and the others wait for and share its
+result rather than forking their own.
+"""
+
+import os
+import shlex
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from read_only import flag_matches, is_read_only_words
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+@dataclass(frozen=True)
+class CacheRule:
+    """How long one program's results stay valid, and whether they depend on paths"""
+    ttl_seconds: float
+    # Whether positional arguments are allowed at all
+    takes_args: bool = False
+    reads_paths: bool = False
+    # With no path arguments the program reads the working directory (ls)
+    reads_cwd: bool = False
+    # Single-letter or long flags whose output the cache cannot validate
+    forbidden_flags: Tuple[str, ...] = ()
+
+
+CACHE_RULES: Dict[str, CacheRule] = {
+    # Facts about the machine that do not change while the agent runs
+    'uname': CacheRule(300),
+    'hostname': CacheRule(300),
+    'whoami': CacheRule(300),
+    'id': CacheRule(300, takes_args=True),
+    'arch': CacheRule(300),
+    'nproc': CacheRule(300),
+    'lsb_release': CacheRule(300),
+    'lscpu': CacheRule(300),
+    'which': CacheRule(30, takes_args=True),
+    # Live figures: short enough that repeats within a plan or turn are shared
+    'df': CacheRule(5, takes_args=True),
+    'free': CacheRule(2),
+    'uptime': CacheRule(5),
+    'lsblk': CacheRule(10, takes_args=True),
+    'ip': CacheRule(5, takes_args=True),
+    # Path readers, additionally invalidated when a named path changes
+    # Names only: anything showing or sorting by the entries' own metadata, or recursing, reads
+    # more than the directory itself records
+    'ls': CacheRule(10, takes_args=True, reads_paths=True, reads_cwd=True,
+                    forbidden_flags=('l', 's', 'g', 'o', 'n', 't', 'S', 'u', 'c', 'R', 'F', 'i', 'k',
+                                     '--size', '--recursive', '--classify', '--sort', '--time', '--inode',
+                                     '--full-time', '--format', '--author', '--context', 'Z')),
+    'cat': CacheRule(10, takes_args=True, reads_paths=True),
+    'head': CacheRule(10, takes_args=True, reads_paths=True),
+    'tail': CacheRule(10, takes_args=True, reads_paths=True),
+    'wc': CacheRule(10, takes_args=True, reads_paths=True),
+    'stat': CacheRule(10, takes_args=True, reads_paths=True),
+    'file': CacheRule(10, takes_args=True, reads_paths=True),
+    'md5sum': CacheRule(10, takes_args=True, reads_paths=True),
+    'sha1sum': CacheRule(10, takes_args=True, reads_paths=True),
+    'sha256sum': CacheRule(10, takes_args=True, reads_paths=True),
+}
+
+# Anything that makes the shell do more than run one program with literal arguments
+_SHELL_SPECIAL = set('|&;<>()$`\\*?[]{}~!#\n')
+
+
+def _path_state(path: str) -> Optional[Tuple[int, int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    # ctime also moves on chmod, chown and link count changes, which mtime misses
+    return st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_ino
+
+
+def classify(command: str, rules: Dict[str, CacheRule] = CACHE_RULES) -> Optional[Tuple[CacheRule, List[str]]]:
+    """(rule, path arguments) for a cacheable command, or None"""
+    if not command or any(ch in _SHELL_SPECIAL for ch in command):
+        return None
+    try:
+        tokens = shlex.split(command)
+    except ValueError:
+        return None
+    if not tokens:
+        return None
+    rule = rules.get(tokens[0])
+    if rule is None or not is_read_only_words(tokens):
+        return None
+    args = tokens[1:]
+    if any(arg.startswith('-') and flag_matches(arg, rule.forbidden_flags) for arg in args):
+        return None
+    if not rule.takes_args and any(not arg.startswith('-') for arg in args):
+        return None
+    paths: List[str] = []
+    if rule.reads_paths:
+        paths = [arg for arg in args if not arg.startswith('-')]
+    return rule, paths
+
+
+class _Entry:
+    __slots__ = ('result', 'stored', 'expires', 'validators')
+
+    def __init__(self, result: Dict[str, Any], stored: float, expires: float,
+                 validators: List[Tuple[str, Optional[Tuple[int, int, int, int]]]]):
+        self.result = result
+        self.stored = stored
+        self.expires = expires
+        self.validators = validators
+
+    def valid(self, now: float) -> bool:
+        return now < self.expires and all(_path_state(path) == state for path, state in self.validators)
+
+
+class _Flight:
+    """One execution in progress, shared by every caller asking for the same command"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+
+
+class ResultCache:
+    """Reuses recent results of read-only commands and coalesces concurrent identical ones"""
+
+    def __init__(self, rules: Optional[Dict[str, CacheRule]] = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.rules = rules if rules is not None else CACHE_RULES
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Tuple[str, str], _Entry]' = OrderedDict()
+        self._flights: Dict[Tuple[str, str], _Flight] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.expired = 0
+        self.invalidated = 0
+        # Bumped by every command that may have changed state the entries cannot validate
+        self._generation = 0
+
+    def run(self, command: str, cwd: str, execute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Result of command in cwd: cached, shared with an identical run in flight, or from execute()"""
+        classified = classify(command.strip(), self.rules)
+        if classified is None:
+            # It may change what the path-less entries report, both right away and as it finishes
+            self.invalidate()
+            try:
+                return execute()
+            finally:
+                self.invalidate()
+        rule, paths = classified
+        key = (cwd, command.strip())
+
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.valid(now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(entry.result, cached=True, cache_age_s=round(now - entry.stored, 3))
+                del self._entries[key]
+                if now < entry.expires:
+                    self.invalidated += 1
+                else:
+                    self.expired += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                generation = self._generation
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return dict(flight.result, coalesced=True)
+
+        # Path state is taken before the run, so a change made while it runs invalidates the result
+        targets = [os.path.join(cwd, path) for path in paths] or ([cwd] if rule.reads_cwd else [])
+        validators = [(path, _path_state(path)) for path in targets]
+        try:
+            result = execute()
+            # Callers get their own copy; the cached one is never handed out
+            flight.result = dict(result)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                # Not stored if a state-changing command ran meanwhile; it may predate the change
+                current = validators or generation == self._generation
+                if current and flight.error is None and flight.result.get('success') and not flight.result.get('truncated'):
+                    now = time.monotonic()
+                    self._entries[key] = _Entry(flight.result, now, now + rule.ttl_seconds, validators)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            flight.done.set()
+        return result
+
+    def invalidate(self):
+        """Drop the entries that are not tied to paths, after a command that may have changed state"""
+        with self._lock:
+            self._generation += 1
+            for key in [key for key, entry in self._entries.items() if not entry.validators]:
+                del self._entries[key]
+                self.invalidated += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'coalesced': self.coalesced, 'expired': self.expired, 'invalidated': self.invalidated}
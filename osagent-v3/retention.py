@@ -0,0 +1,328 @@
+"""
+Retention and compaction for the agent memory database.
+A background scheduler applies per-table policies (age, row count, size),
+deletes in small batches so request-path writers are never blocked for long,
+rolls command history up into daily aggregates before deleting it, garbage
+collects unreferenced payload blobs and runs periodic incremental VACUUM.
+
+New databases are created with auto_vacuum = INCREMENTAL. A database created
+before that has to be converted by a full VACUUM, which rewrites the file
+under an exclusive lock, so it is a manual migration step rather than
+something the scheduler does behind the user's back. Run it once while the
+agent is stopped:
+
+    python -c "from retention import enable_incremental_vacuum; enable_incremental_vacuum('agent_memory/agent_memory.db')"
+
+Until then, retention still deletes rows but freed pages are only reused,
+not returned to the filesystem.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RetentionPolicy:
+    """Limits for one table; any limit left as None is not enforced"""
+    max_age_days: Optional[float] = None
+    max_rows: Optional[int] = None
+    max_bytes: Optional[int] = None
+    # Extra SQL condition restricting which rows the policy may delete
+    where: Optional[str] = None
+
+
+# Columns used to estimate a table's size and to order rows oldest first
+_TABLES = {
+    'conversations': {
+        'timestamp': 'timestamp',
+        'size_expr': "length(user_request) + length(agent_response) + length(execution_results) + length(system_state)"
+    },
+    'command_history': {
+        'timestamp': 'timestamp',
+        'size_expr': "length(command) + length(context) + 64"
+    },
+    'system_facts': {
+        'timestamp': 'timestamp',
+        'size_expr': "length(fact_key) + length(fact_value) + 64"
+    }
+}
+
+DEFAULT_POLICIES: Dict[str, RetentionPolicy] = {
+    'conversations': RetentionPolicy(max_age_days=30, max_rows=20000, max_bytes=256 * 1024 ** 2),
+    'command_history': RetentionPolicy(max_age_days=30, max_rows=100000),
+    # Only facts the model learned are expired; os_system, hostname etc. are kept
+    'system_facts': RetentionPolicy(max_age_days=90, max_rows=5000, where="fact_key LIKE 'learned\\_%' ESCAPE '\\'")
+}
+
+
+def enable_incremental_vacuum(db_path) -> bool:
+    """Switch an existing database to incremental auto_vacuum (one full VACUUM); False if it already was"""
+    with sqlite3.connect(db_path) as conn:
+        if _incremental(conn):
+            return False
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+    return True
+
+
+def _incremental(conn: sqlite3.Connection) -> bool:
+    return conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+
+
+@dataclass
+class RetentionMetrics:
+    """Counters accumulated across scheduler runs"""
+    runs: int = 0
+    rows_deleted: Dict[str, int] = field(default_factory=dict)
+    rows_rolled_up: int = 0
+    blobs_collected: int = 0
+    bytes_reclaimed: int = 0
+    last_run: Optional[str] = None
+    last_duration_seconds: float = 0.0
+    last_error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'runs': self.runs,
+            'rows_deleted': dict(self.rows_deleted),
+            'rows_rolled_up': self.rows_rolled_up,
+            'blobs_collected': self.blobs_collected,
+            'bytes_reclaimed': self.bytes_reclaimed,
+            'last_run': self.last_run,
+            'last_duration_seconds': round(self.last_duration_seconds, 3),
+            'last_error': self.last_error
+        }
+
+
+class RetentionScheduler:
+    """Runs retention policies against agent_memory.db on a background thread"""
+
+    def __init__(self, db_path: Path, policies: Optional[Dict[str, RetentionPolicy]] = None,
+                 interval_seconds: float = 3600, batch_size: int = 500,
+                 batch_pause_seconds: float = 0.05, vacuum_pages: int = 2000,
+                 initial_delay_seconds: float = 60):
+        self.db_path = db_path
+        self.policies = dict(DEFAULT_POLICIES if policies is None else policies)
+        unknown = set(self.policies) - set(_TABLES)
+        if unknown:
+            raise ValueError(f"No retention support for tables: {', '.join(sorted(unknown))}")
+
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.batch_pause_seconds = batch_pause_seconds
+        self.vacuum_pages = vacuum_pages
+        self.initial_delay_seconds = initial_delay_seconds
+
+        self.metrics = RetentionMetrics()
+        self._tasks: List[Callable[[], None]] = []
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._vacuum_hint_logged = False
+
+    # --- Lifecycle ---------------------------------------------------------
+
+    def start(self):
+        """Start the background thread (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='memory-retention', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def add_task(self, task: Callable[[], None]):
+        """Register extra maintenance work to run after each retention pass"""
+        self._tasks.append(task)
+
+    def _loop(self):
+        # First pass shortly after startup so summaries and limits apply without waiting an interval
+        if self._stop.wait(self.initial_delay_seconds):
+            return
+        self.run_once()
+        while not self._stop.wait(self.interval_seconds):
+            self.run_once()
+
+    # --- One pass ----------------------------------------------------------
+
+    def run_once(self, policies: Optional[Dict[str, RetentionPolicy]] = None) -> Dict[str, Any]:
+        """Apply all policies once and return this pass's metrics"""
+        policies = self.policies if policies is None else policies
+        started = time.monotonic()
+        run_stats: Dict[str, Any] = {'rows_deleted': {}, 'rows_rolled_up': 0, 'blobs_collected': 0,
+                                     'bytes_reclaimed': 0}
+
+        with self._run_lock:
+            try:
+                with sqlite3.connect(self.db_path, timeout=30) as conn:
+                    size_before = self._file_bytes(conn)
+
+                    for table, policy in policies.items():
+                        if table == 'command_history':
+                            run_stats['rows_rolled_up'] += self._rollup_command_history(conn, policy)
+                        run_stats['rows_deleted'][table] = self._apply_policy(conn, table, policy)
+
+                    run_stats['blobs_collected'] = self._collect_blobs(conn)
+                    self._incremental_vacuum(conn)
+                    run_stats['bytes_reclaimed'] = max(0, size_before - self._file_bytes(conn))
+
+                for task in self._tasks:
+                    task()
+                self.metrics.last_error = None
+            except Exception as e:
+                logger.warning("Memory retention pass failed: %s", e)
+                self.metrics.last_error = str(e)
+
+        self.metrics.runs += 1
+        for table, deleted in run_stats['rows_deleted'].items():
+            self.metrics.rows_deleted[table] = self.metrics.rows_deleted.get(table, 0) + deleted
+        self.metrics.rows_rolled_up += run_stats['rows_rolled_up']
+        self.metrics.blobs_collected += run_stats['blobs_collected']
+        self.metrics.bytes_reclaimed += run_stats['bytes_reclaimed']
+        self.metrics.last_run = datetime.now().isoformat()
+        self.metrics.last_duration_seconds = time.monotonic() - started
+
+        if any(run_stats['rows_deleted'].values()) or run_stats['bytes_reclaimed']:
+            logger.info("Memory retention: %s", run_stats)
+        return run_stats
+
+    # --- Helpers -----------------------------------------------------------
+
+    @staticmethod
+    def _file_bytes(conn: sqlite3.Connection) -> int:
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        return page_count * page_size
+
+    def _conditions(self, conn: sqlite3.Connection, table: str, policy: RetentionPolicy) -> List[str]:
+        """SQL conditions selecting rows that violate the policy, oldest first"""
+        ts_column = _TABLES[table]['timestamp']
+        scope = f"({policy.where})" if policy.where else "1"
+        conditions = []
+
+        if policy.max_age_days is not None:
+            cutoff = (datetime.now() - timedelta(days=policy.max_age_days)).isoformat()
+            conditions.append(f"{scope} AND {ts_column} < '{cutoff}'")
+
+        if policy.max_rows is not None or policy.max_bytes is not None:
+            total_rows, total_bytes = conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM({_TABLES[table]['size_expr']}), 0) FROM {table} WHERE {scope}"
+            ).fetchone()
+
+            excess = 0
+            if policy.max_rows is not None:
+                excess = max(excess, total_rows - policy.max_rows)
+            if policy.max_bytes is not None and total_bytes > policy.max_bytes and total_rows:
+                avg_row = total_bytes / total_rows
+                excess = max(excess, int((total_bytes - policy.max_bytes) / avg_row) + 1)
+
+            if excess > 0:
+                # Everything up to the id of the excess-th oldest row in scope
+                boundary = conn.execute(
+                    f"SELECT id FROM {table} WHERE {scope} ORDER BY {ts_column}, id LIMIT 1 OFFSET ?",
+                    (excess - 1,)
+                ).fetchone()
+                if boundary:
+                    conditions.append(f"{scope} AND id <= {int(boundary[0])}")
+
+        return conditions
+
+    def _delete_in_batches(self, conn: sqlite3.Connection, table: str, condition: str) -> int:
+        deleted = 0
+        while True:
+            cursor = conn.execute(
+                f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE {condition} ORDER BY id LIMIT ?)",
+                (self.batch_size,)
+            )
+            conn.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount < self.batch_size or self._stop.is_set():
+                break
+            # Give request-path writers a chance at the write lock between batches
+            time.sleep(self.batch_pause_seconds)
+        return deleted
+
+    def _apply_policy(self, conn: sqlite3.Connection, table: str, policy: RetentionPolicy) -> int:
+        return sum(self._delete_in_batches(conn, table, condition)
+                   for condition in self._conditions(conn, table, policy))
+
+    def _rollup_command_history(self, conn: sqlite3.Connection, policy: RetentionPolicy) -> int:
+        """Fold rows that are about to expire into per-day command_stats aggregates"""
+        rolled = 0
+        for condition in self._conditions(conn, 'command_history', policy):
+            while True:
+                rows = conn.execute(
+                    f"SELECT id, command, success, timestamp FROM command_history WHERE {condition} "
+                    f"ORDER BY id LIMIT ?", (self.batch_size,)
+                ).fetchall()
+                if not rows:
+                    break
+                aggregates: Dict[tuple, List[int]] = {}
+                for _, command, success, timestamp in rows:
+                    key = (command, (timestamp or '')[:10])
+                    counts = aggregates.setdefault(key, [0, 0])
+                    counts[0] += 1
+                    counts[1] += 1 if success else 0
+                conn.executemany('''
+                    INSERT INTO command_stats (command, day, runs, successes) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(command, day) DO UPDATE SET
+                        runs = runs + excluded.runs, successes = successes + excluded.successes
+                ''', [(cmd, day, c[0], c[1]) for (cmd, day), c in aggregates.items()])
+                # Delete in the same transaction so a row is never counted twice
+                conn.executemany('DELETE FROM command_history WHERE id = ?', [(r[0],) for r in rows])
+                conn.commit()
+                rolled += len(rows)
+                if len(rows) < self.batch_size:
+                    break
+                time.sleep(self.batch_pause_seconds)
+        return rolled
+
+    def _collect_blobs(self, conn: sqlite3.Connection) -> int:
+        """Delete payload blobs that no conversation references any more"""
+        has_blobs = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'payload_refs'"
+        ).fetchone()
+        if not has_blobs:
+            return 0
+
+        collected = 0
+        while True:
+            cursor = conn.execute('''
+                DELETE FROM payload_blobs WHERE hash IN (
+                    SELECT b.hash FROM payload_blobs b
+                    WHERE NOT EXISTS (SELECT 1 FROM payload_refs r WHERE r.hash = b.hash)
+                    LIMIT ?
+                )
+            ''', (self.batch_size,))
+            conn.commit()
+            collected += cursor.rowcount
+            if cursor.rowcount < self.batch_size:
+                break
+            time.sleep(self.batch_pause_seconds)
+        return collected
+
+    def _incremental_vacuum(self, conn: sqlite3.Connection):
+        if not _incremental(conn):
+            if not self._vacuum_hint_logged:
+                self._vacuum_hint_logged = True
+                logger.info("Memory database predates incremental vacuum; free pages are reused but not "
+                            "returned to the filesystem until it is converted (see retention.py)")
+            return
+        # Return free pages to the filesystem a slice at a time
+        while conn.execute('PRAGMA freelist_count').fetchone()[0] > 0:
+            conn.execute(f'PRAGMA incremental_vacuum({int(self.vacuum_pages)})').fetchall()
+            conn.commit()
+            if self._stop.is_set():
+                break
@@ -0,0 +1,399 @@
+"""
+Resource-limited execution for the OS Agent's commands.
+Every command is started through a Sandbox. The shell that runs it first
+lowers its rlimits with ulimit: CPU seconds, core dumps, open files and, if
+configured, address space and file size. The shell is started from a thread
+running at a lower CPU and IO priority, which the child inherits.
+
+On Linux with a writable cgroup v2 hierarchy the shell also moves itself into
+a cgroup before running the command. Pooled shells go into their session's
+shell cgroup; one-off commands get a cgroup of their own. Both sit under a
+per-session cgroup, and these cgroups carry cpu.max, memory.max, pids.max and
+io.weight quotas.
+
+The agent process keeps its full CPU and IO share, so its latency stays
+stable while a heavy command runs. Background commands get a lower priority
+still and the idle IO class.
+
+Per-command resource usage comes from:
+- wait4() for one-off commands;
+- the persistent shell's child CPU times for pooled commands;
+- the command's cgroup (IO bytes, CPU, peak memory) where there is one.
+
+Configuration (environment):
+    OSAGENT_SANDBOX=0          disable limits and priorities entirely
+    OSAGENT_SANDBOX_CGROUPS=0  rlimits and priorities only
+"""
+
+import logging
+import os
+import select
+import shlex
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import psutil
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, commands run unrestricted
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+CGROUP_MOUNT = Path('/sys/fs/cgroup')
+CGROUP_CONTROLLERS = ('cpu', 'memory', 'io', 'pids')
+CPU_PERIOD_USEC = 100000
+
+
+def _default_cpu_cores() -> float:
+    # Leave one core to the agent itself
+    return float(max(1, (psutil.cpu_count() or 1) - 1))
+
+
+def _default_memory_bytes() -> int:
+    return int(psutil.virtual_memory().total * 0.75)
+
+
+@dataclass
+class SandboxPolicy:
+    """Limits for commands and sessions; any limit left as None is not applied"""
+    # rlimits, per process
+    cpu_seconds: Optional[int] = 1800
+    open_files: Optional[int] = 65536
+    core_bytes: Optional[int] = 0
+    # Off by default: runtimes that reserve large address ranges (JVM, V8) fail under RLIMIT_AS
+    address_space_bytes: Optional[int] = None
+    file_size_bytes: Optional[int] = None
+    # Priorities relative to the agent (nice 0)
+    nice: int = 5
+    background_nice: int = 15
+    # cgroup v2 quotas
+    command_cpu_cores: Optional[float] = None
+    command_memory_bytes: Optional[int] = None
+    session_cpu_cores: Optional[float] = None
+    session_memory_bytes: Optional[int] = None
+    session_pids: Optional[int] = 4096
+    io_weight: Optional[int] = 50
+    background_io_weight: Optional[int] = 10
+
+    def __post_init__(self):
+        if self.command_cpu_cores is None:
+            self.command_cpu_cores = _default_cpu_cores()
+        if self.session_cpu_cores is None:
+            self.session_cpu_cores = self.command_cpu_cores
+        if self.session_memory_bytes is None:
+            self.session_memory_bytes = _default_memory_bytes()
+        if self.command_memory_bytes is None:
+            self.command_memory_bytes = self.session_memory_bytes
+
+
+def _write(path: Path, value: str) -> bool:
+    try:
+        path.write_text(value)
+        return True
+    except OSError:
+        return False
+
+
+class CgroupTree:
+    """Per-session and per-command cgroups under the agent's own cgroup (v2 only)"""
+
+    def __init__(self, root: Path, controllers: set):
+        self.root = root
+        self.controllers = controllers
+        self._counter = 0
+        self._sessions: set = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def detect(cls) -> Optional['CgroupTree']:
+        """The agent's cgroup if it is v2 and writable, with the agent moved into a leaf"""
+        if not (CGROUP_MOUNT / 'cgroup.controllers').exists():
+            return None  # cgroup v1 or hybrid hierarchy
+        try:
+            with open('/proc/self/cgroup') as f:
+                relative = next(line.split('::', 1)[1].strip() for line in f if line.startswith('0::'))
+        except (OSError, StopIteration):
+            return None
+        own = CGROUP_MOUNT / relative.lstrip('/')
+        # Controllers can only be enabled for children of a cgroup that has no processes
+        # of its own, so the agent first moves itself into a leaf next to the sessions
+        try:
+            agent = own / 'osagent'
+            agent.mkdir(exist_ok=True)
+            (agent / 'cgroup.procs').write_text(str(os.getpid()))
+        except OSError:
+            return None
+        try:
+            available = set((own / 'cgroup.controllers').read_text().split())
+        except OSError:
+            available = set()
+        enabled = {c for c in CGROUP_CONTROLLERS if c in available and _write(own / 'cgroup.subtree_control', f"+{c}")}
+        logger.info("Command cgroups under %s (controllers: %s)", own, ' '.join(sorted(enabled)) or 'none')
+        return cls(own, enabled)
+
+    def session(self, session_id: str, policy: SandboxPolicy) -> Path:
+        path = self.root / f"session-{session_id}"
+        if session_id not in self._sessions:
+            self._sessions.add(session_id)
+            path.mkdir(exist_ok=True)
+            self._apply(path, policy.session_cpu_cores, policy.session_memory_bytes, policy.session_pids, None)
+            for controller in self.controllers:
+                _write(path / 'cgroup.subtree_control', f"+{controller}")
+        return path
+
+    def leaf(self, session_id: str, name: Optional[str], policy: SandboxPolicy, background: bool) -> Optional[Path]:
+        """A cgroup for one command (name None) or a named long-lived one, e.g. the session shell"""
+        try:
+            session = self.session(session_id, policy)
+        except OSError:
+            return None
+        if name is None:
+            with self._lock:
+                self._counter += 1
+                name = f"cmd-{os.getpid()}-{self._counter}"
+        path = session / name
+        try:
+            path.mkdir(exist_ok=True)
+        except OSError:
+            return None
+        self._apply(path, policy.command_cpu_cores, policy.command_memory_bytes, None,
+                    policy.background_io_weight if background else policy.io_weight)
+        return path
+
+    def _apply(self, path: Path, cpu_cores: Optional[float], memory: Optional[int],
+               pids: Optional[int], io_weight: Optional[int]):
+        if cpu_cores and 'cpu' in self.controllers:
+            _write(path / 'cpu.max', f"{int(cpu_cores * CPU_PERIOD_USEC)} {CPU_PERIOD_USEC}")
+        if memory and 'memory' in self.controllers:
+            _write(path / 'memory.max', str(memory))
+        if pids and 'pids' in self.controllers:
+            _write(path / 'pids.max', str(pids))
+        if io_weight and 'io' in self.controllers:
+            _write(path / 'io.weight', f"default {io_weight}")
+
+    @staticmethod
+    def counters(path: Path) -> Dict[str, int]:
+        """Cumulative CPU (usec), IO (bytes) and peak memory of a cgroup"""
+        values: Dict[str, int] = {}
+        try:
+            for line in (path / 'cpu.stat').read_text().splitlines():
+                key, _, value = line.partition(' ')
+                if key in ('user_usec', 'system_usec'):
+                    values[key] = int(value)
+        except (OSError, ValueError):
+            pass
+        try:
+            read = written = 0
+            for line in (path / 'io.stat').read_text().splitlines():
+                for field in line.split()[1:]:
+                    key, _, value = field.partition('=')
+                    if key == 'rbytes':
+                        read += int(value)
+                    elif key == 'wbytes':
+                        written += int(value)
+            values['read_bytes'], values['write_bytes'] = read, written
+        except (OSError, ValueError):
+            pass
+        try:
+            values['memory_peak'] = int((path / 'memory.peak').read_text())
+        except (OSError, ValueError):
+            pass
+        return values
+
+    @staticmethod
+    def remove(path: Path):
+        # Fails while anything the command left running is still inside; such a
+        # cgroup stays until the session is gone
+        try:
+            path.rmdir()
+        except OSError:
+            pass
+
+
+# Shell ulimit flag and the unit it takes, per rlimit (POSIX sh: -c and -f in 512-byte blocks)
+_ULIMIT_FLAGS = (('RLIMIT_CPU', 't', 1), ('RLIMIT_CORE', 'c', 512), ('RLIMIT_NOFILE', 'n', 1),
+                 ('RLIMIT_AS', 'v', 1024), ('RLIMIT_FSIZE', 'f', 512))
+
+
+class Slot:
+    """Where and how one process runs: its rlimits, priority and cgroup"""
+
+    def __init__(self, sandbox: 'Sandbox', cgroup: Optional[Path], background: bool):
+        self.sandbox = sandbox
+        self.cgroup = cgroup
+        self.background = background
+
+        # A shell line run before the command: it moves the shell into the cgroup and
+        # lowers its limits with builtins only, so no process is spawned for it
+        policy = sandbox.policy
+        wanted = {'RLIMIT_CPU': policy.cpu_seconds, 'RLIMIT_CORE': policy.core_bytes,
+                  'RLIMIT_NOFILE': policy.open_files, 'RLIMIT_AS': policy.address_space_bytes,
+                  'RLIMIT_FSIZE': policy.file_size_bytes}
+        parts = []
+        if cgroup is not None:
+            parts.append(f"echo $$ > {shlex.quote(str(cgroup / 'cgroup.procs'))}")
+        for name, flag, unit in _ULIMIT_FLAGS:
+            value = wanted[name]
+            if value is None or not hasattr(resource, name):
+                continue
+            soft, _ = resource.getrlimit(getattr(resource, name))
+            # Only ever lower what the agent itself runs with
+            if soft == resource.RLIM_INFINITY or value < soft:
+                parts.append(f"ulimit -{flag} {value // unit}")
+        self.prefix = ''.join(f"{part} 2>/dev/null; " for part in parts)
+
+    def wrap(self, command: str) -> str:
+        """The command as a shell script that first applies the slot's limits"""
+        return f"{self.prefix}\n{command}" if self.prefix else command
+
+    def spawn(self, start: Callable[[], subprocess.Popen]) -> subprocess.Popen:
+        """Start the process from a thread running at the slot's CPU and IO priority"""
+        return self.sandbox.spawn(start, self.background)
+
+    def counters(self) -> Dict[str, int]:
+        return CgroupTree.counters(self.cgroup) if self.cgroup is not None else {}
+
+    def close(self):
+        if self.cgroup is not None:
+            CgroupTree.remove(self.cgroup)
+
+
+def usage_from_rusage(rusage: Any) -> Dict[str, Any]:
+    """Resource usage of a reaped child (and the descendants it waited for)"""
+    usage = {
+        'cpu_user_s': round(rusage.ru_utime, 3),
+        'cpu_system_s': round(rusage.ru_stime, 3),
+    }
+    # Between vfork and exec the child runs in the agent's address space, so a peak up to
+    # the agent's own says nothing about the command (ru_maxrss: KiB on Linux, bytes on macOS)
+    if rusage.ru_maxrss > resource.getrusage(resource.RUSAGE_SELF).ru_maxrss:
+        usage['max_rss_bytes'] = rusage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    if rusage.ru_inblock or rusage.ru_oublock:
+        usage['read_bytes'] = rusage.ru_inblock * 512
+        usage['write_bytes'] = rusage.ru_oublock * 512
+    return usage
+
+
+def usage_from_counters(before: Dict[str, int], after: Dict[str, int]) -> Dict[str, Any]:
+    """Usage between two cgroup counter readings"""
+    usage: Dict[str, Any] = {}
+    if 'user_usec' in after:
+        usage['cpu_user_s'] = round((after['user_usec'] - before.get('user_usec', 0)) / 1e6, 3)
+        usage['cpu_system_s'] = round((after['system_usec'] - before.get('system_usec', 0)) / 1e6, 3)
+    for key in ('read_bytes', 'write_bytes'):
+        if key in after:
+            usage[key] = after[key] - before.get(key, 0)
+    return usage
+
+
+class ChildWaiter:
+    """Deadline.wait() callback that reaps a child with wait4(), keeping its resource usage"""
+
+    def __init__(self, process: subprocess.Popen):
+        self.process = process
+        self.rusage = None
+        self._pidfd: Optional[int] = None
+        if hasattr(os, 'pidfd_open') and hasattr(os, 'wait4'):
+            try:
+                self._pidfd = os.pidfd_open(process.pid)
+            except OSError:
+                pass
+
+    def __call__(self, seconds: float) -> bool:
+        if self._pidfd is None:
+            try:
+                self.process.wait(timeout=seconds)
+                return True
+            except subprocess.TimeoutExpired:
+                return False
+        if self.process.returncode is not None:
+            return True
+        if not select.select([self._pidfd], [], [], seconds)[0]:
+            return False
+        try:
+            _, status, self.rusage = os.wait4(self.process.pid, 0)
+        except ChildProcessError:
+            # Reaped elsewhere (Popen.wait); its exit status, not its usage, is still known
+            self.process.poll()
+            return True
+        # Popen never waits itself once returncode is set
+        self.process.returncode = os.waitstatus_to_exitcode(status)
+        return True
+
+    def close(self):
+        if self._pidfd is not None:
+            os.close(self._pidfd)
+            self._pidfd = None
+
+
+class Sandbox:
+    """Hands out Slots for commands; a disabled sandbox applies nothing"""
+
+    def __init__(self, policy: Optional[SandboxPolicy] = None, cgroups: Optional[CgroupTree] = None,
+                 enabled: bool = True):
+        self.policy = policy or SandboxPolicy()
+        self.cgroups = cgroups
+        self.enabled = enabled and resource is not None
+        # Nice values and IO priorities are per thread on Linux and inherited by a child
+        # forked from that thread, so processes are started from dedicated threads at the
+        # commands' priority. The alternative, preexec_fn, rules out Popen's vfork fast path
+        # and makes every spawn from the (large, threaded) agent process a full fork
+        self._spawners: Dict[bool, ThreadPoolExecutor] = {}
+        self._spawners_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, policy: Optional[SandboxPolicy] = None) -> 'Sandbox':
+        if os.getenv('OSAGENT_SANDBOX', '1') == '0':
+            return cls(policy, enabled=False)
+        cgroups = CgroupTree.detect() if os.getenv('OSAGENT_SANDBOX_CGROUPS', '1') != '0' else None
+        return cls(policy, cgroups)
+
+    def slot(self, session_id: str, name: Optional[str] = None, background: bool = False) -> Optional[Slot]:
+        """A one-off command's slot (name None), or a named long-lived one"""
+        if not self.enabled:
+            return None
+        cgroup = self.cgroups.leaf(session_id, name, self.policy, background) if self.cgroups else None
+        return Slot(self, cgroup, background)
+
+    def _lower_priority(self, background: bool):
+        """Runs once in each spawner thread"""
+        tid = threading.get_native_id()
+        try:
+            nice = self.policy.background_nice if background else self.policy.nice
+            os.setpriority(os.PRIO_PROCESS, tid, os.getpriority(os.PRIO_PROCESS, tid) + nice)
+            if background:
+                psutil.Process(tid).ionice(psutil.IOPRIO_CLASS_IDLE)
+            else:
+                psutil.Process(tid).ionice(psutil.IOPRIO_CLASS_BE, 7)
+        except (OSError, psutil.Error, ValueError) as e:
+            logger.warning("Could not lower command priority: %s", e)
+
+    def spawn(self, start: Callable[[], subprocess.Popen], background: bool = False) -> subprocess.Popen:
+        if not self.enabled or not sys.platform.startswith('linux'):
+            return start()
+        with self._spawners_lock:
+            spawner = self._spawners.get(background)
+            if spawner is None:
+                spawner = ThreadPoolExecutor(max_workers=1, thread_name_prefix='spawn',
+                                             initializer=self._lower_priority, initargs=(background,))
+                self._spawners[background] = spawner
+        return spawner.submit(start).result()
+
+    def describe(self) -> Dict[str, Any]:
+        policy = self.policy
+        return {
+            'enabled': self.enabled,
+            'cgroup': str(self.cgroups.root) if self.cgroups else None,
+            'controllers': sorted(self.cgroups.controllers) if self.cgroups else [],
+            'cpu_seconds': policy.cpu_seconds,
+            'command_cpu_cores': policy.command_cpu_cores,
+            'command_memory_bytes': policy.command_memory_bytes,
+            'nice': policy.nice
+        }
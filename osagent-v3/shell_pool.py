@@ -0,0 +1,302 @@
+"""
+Pool of long-lived shell workers for the OS Agent.
+Instead of forking a fresh /bin/sh for every command, each session gets a
+persistent shell that commands are written to. Every command is framed by a
+random sentinel that carries its exit status and the shell's working
+directory, so `cd` and exported variables persist across a plan. A timeout
+(a number of seconds or a command_timeouts.Deadline) kills only the
+command's child processes; the shell itself is recycled only when it cannot
+be recovered, after a number of commands, or when idle.
+"""
+
+import os
+import subprocess
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple, Union
+
+import psutil
+
+from output_capture import BoundedCapture, READ_CHUNK_BYTES
+from command_timeouts import Deadline
+from sandbox import Sandbox, Slot, usage_from_counters
+
+DEFAULT_SHELL = '/bin/sh'
+
+
+class ShellWorkerDied(Exception):
+    """The worker shell exited before finishing the command (e.g. `exit` or a syntax error)"""
+
+    def __init__(self, returncode: int):
+        super().__init__(f"Shell worker exited with status {returncode}")
+        self.returncode = returncode
+
+
+class _FramedReader:
+    """Forwards one stream into a capture until the sentinel shows up"""
+
+    def __init__(self, fd: int, capture: Optional[BoundedCapture], sentinel: bytes):
+        self.fd = fd
+        self.capture = capture
+        self.sentinel = sentinel
+        self.trailer = b''
+        self.found = threading.Event()
+        self.eof = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _forward(self, data: bytes):
+        if data and self.capture is not None:
+            self.capture.feed(data)
+
+    def _run(self):
+        # Hold back enough bytes that a sentinel split across two reads is still found
+        keep = len(self.sentinel) - 1
+        pending = b''
+        while True:
+            try:
+                chunk = os.read(self.fd, READ_CHUNK_BYTES)
+            except OSError:
+                chunk = b''
+            if not chunk:
+                self._forward(pending)
+                self.eof = True
+                self.found.set()
+                return
+            if self.capture is not None:
+                # Bytes held back below still count as progress for the deadline
+                self.capture.mark_activity()
+            pending += chunk
+            index = pending.find(self.sentinel)
+            if index >= 0:
+                self._forward(pending[:index])
+                rest = pending[index + len(self.sentinel):]
+                # Read up to the end of the sentinel line (exit status and cwd)
+                while b'\n' not in rest:
+                    try:
+                        more = os.read(self.fd, 4096)
+                    except OSError:
+                        more = b''
+                    if not more:
+                        break
+                    rest += more
+                self.trailer = rest.split(b'\n', 1)[0]
+                self.found.set()
+                return
+            if len(pending) > keep:
+                self._forward(pending[:-keep] if keep else pending)
+                pending = pending[-keep:] if keep else b''
+
+
+class ShellWorker:
+    """One persistent shell process"""
+
+    def __init__(self, shell: str = DEFAULT_SHELL, cwd: Optional[str] = None, slot: Optional[Slot] = None):
+        self.shell = shell
+        # Limits and priority are set on the shell once and inherited by every command it runs
+        self.slot = slot
+        start = lambda: subprocess.Popen(
+            [shell],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=cwd,
+            start_new_session=True
+        )
+        self.process = slot.spawn(start) if slot is not None else start()
+        if slot is not None and slot.prefix:
+            self.process.stdin.write(slot.prefix.encode() + b'\n')
+            self.process.stdin.flush()
+        self.last_usage: Dict[str, Any] = {}
+        self.cwd = cwd or os.getcwd()
+        self.commands_run = 0
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.lock = threading.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def run(self, command: str, stdout_capture: Optional[BoundedCapture],
+            stderr_capture: Optional[BoundedCapture], timeout: Union[float, Deadline]) -> int:
+        """Run a command in this shell and return its exit status
+
+        Raises subprocess.TimeoutExpired if the command overran and ShellWorkerDied
+        if the shell exited; in both cases the worker may no longer be usable.
+        """
+        deadline = timeout if isinstance(timeout, Deadline) else Deadline(timeout)
+        token = f"__OSAGENT_{uuid.uuid4().hex}__"
+        sentinel = token.encode()
+        out_reader = _FramedReader(self.process.stdout.fileno(), stdout_capture, sentinel)
+        err_reader = _FramedReader(self.process.stderr.fileno(), stderr_capture, sentinel)
+
+        # The command runs in the shell itself (not a subshell) so cd/export persist.
+        # It goes through eval as a single-quoted word so an unbalanced quote cannot
+        # swallow the framing that follows, and its stdin is /dev/null for the same reason
+        quoted = "'" + command.replace("'", "'\\''") + "'"
+        script = (
+            f"{{ eval {quoted}\n}} </dev/null\n"
+            f"__osagent_rc=$?\n"
+            f"printf '%s:%d:%s\\n' '{token}' \"$__osagent_rc\" \"$PWD\"\n"
+            f"printf '%s\\n' '{token}' >&2\n"
+        )
+        self.commands_run += 1
+        self.last_used = time.monotonic()
+        before = self._counters()
+        try:
+            self.process.stdin.write(script.encode())
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self.kill()
+            raise ShellWorkerDied(self.process.wait())
+
+        if not deadline.wait(out_reader.found.wait) or not deadline.wait(err_reader.found.wait):
+            self._kill_children()
+            # Give the shell a moment to notice and print the sentinel; a builtin
+            # loop has no child to kill, in which case the whole worker goes
+            if not (out_reader.found.wait(2) and err_reader.found.wait(2)):
+                self.kill()
+            out_reader.thread.join(2)
+            err_reader.thread.join(2)
+            raise subprocess.TimeoutExpired(command, deadline.elapsed())
+
+        out_reader.thread.join()
+        err_reader.thread.join()
+        self.last_used = time.monotonic()
+        self.last_usage = self._usage_since(before)
+
+        if out_reader.eof:
+            raise ShellWorkerDied(self.process.wait())
+
+        # Trailer is ":<status>:<cwd>"
+        _, _, trailer = out_reader.trailer.decode('utf-8', errors='replace').partition(':')
+        status, _, cwd = trailer.partition(':')
+        if cwd:
+            self.cwd = cwd
+        try:
+            return int(status)
+        except ValueError:
+            return -1
+
+    def _counters(self) -> Dict[str, float]:
+        """CPU time of the commands the shell has waited for, plus its cgroup's IO counters"""
+        counters: Dict[str, float] = dict(self.slot.counters()) if self.slot is not None else {}
+        try:
+            times = psutil.Process(self.process.pid).cpu_times()
+            counters['children_user'] = times.children_user
+            counters['children_system'] = times.children_system
+        except (psutil.Error, AttributeError):
+            pass
+        return counters
+
+    def _usage_since(self, before: Dict[str, float]) -> Dict[str, Any]:
+        # Commands of one shell run one at a time, so the difference is this command's usage
+        after = self._counters()
+        usage = usage_from_counters(before, after)
+        if 'children_user' in after and 'children_user' in before:
+            usage['cpu_user_s'] = round(after['children_user'] - before['children_user'], 3)
+            usage['cpu_system_s'] = round(after['children_system'] - before['children_system'], 3)
+        return usage
+
+    def _kill_children(self):
+        """Kill everything the shell spawned, leaving the shell itself running"""
+        try:
+            children = psutil.Process(self.process.pid).children(recursive=True)
+        except psutil.NoSuchProcess:
+            return
+        for child in children:
+            try:
+                child.kill()
+            except psutil.NoSuchProcess:
+                pass
+        psutil.wait_procs(children, timeout=2)
+
+    def kill(self):
+        self._kill_children()
+        try:
+            self.process.kill()
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout, self.process.stderr):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+
+class ShellPool:
+    """Session-pinned pool of persistent shell workers"""
+
+    def __init__(self, shell: str = DEFAULT_SHELL, max_workers: int = 8,
+                 max_commands_per_worker: int = 500, max_idle_seconds: float = 900,
+                 sandbox: Optional[Sandbox] = None):
+        self.shell = shell
+        self.sandbox = sandbox
+        self.max_workers = max_workers
+        self.max_commands_per_worker = max_commands_per_worker
+        self.max_idle_seconds = max_idle_seconds
+        self._workers: Dict[str, ShellWorker] = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, session_id: str) -> ShellWorker:
+        with self._lock:
+            now = time.monotonic()
+            # Reap idle and dead workers of other sessions
+            for sid, worker in list(self._workers.items()):
+                if sid != session_id and not worker.lock.locked() and \
+                        (not worker.alive or now - worker.last_used > self.max_idle_seconds):
+                    worker.kill()
+                    del self._workers[sid]
+
+            worker = self._workers.get(session_id)
+            if worker is not None and not worker.lock.locked() and \
+                    (not worker.alive or worker.commands_run >= self.max_commands_per_worker):
+                # Recycle, but keep the session's working directory
+                cwd = worker.cwd
+                worker.kill()
+                worker = ShellWorker(self.shell, cwd=cwd if os.path.isdir(cwd) else None,
+                                     slot=self._slot(session_id))
+                self._workers[session_id] = worker
+
+            if worker is None:
+                if len(self._workers) >= self.max_workers:
+                    idle = [(w.last_used, sid) for sid, w in self._workers.items() if not w.lock.locked()]
+                    if idle:
+                        _, evicted = min(idle)
+                        self._workers.pop(evicted).kill()
+                worker = ShellWorker(self.shell, slot=self._slot(session_id))
+                self._workers[session_id] = worker
+            worker.last_used = now
+            return worker
+
+    def _slot(self, session_id: str) -> Optional[Slot]:
+        return self.sandbox.slot(session_id, name='shell') if self.sandbox is not None else None
+
+    def run(self, session_id: str, command: str, stdout_capture: Optional[BoundedCapture],
+            stderr_capture: Optional[BoundedCapture],
+            timeout: Union[float, Deadline]) -> Tuple[int, str, Dict[str, Any]]:
+        """Run a command in the session's shell; returns (exit status, cwd afterwards, resource usage)"""
+        worker = self._acquire(session_id)
+        # Commands of one session run one at a time, in order
+        with worker.lock:
+            if isinstance(timeout, Deadline):
+                # Waiting behind the session's previous command is not this command's run time
+                timeout.restart()
+            try:
+                returncode = worker.run(command, stdout_capture, stderr_capture, timeout)
+            except ShellWorkerDied as e:
+                return e.returncode, worker.cwd, {}
+            return returncode, worker.cwd, worker.last_usage
+
+    def cwd(self, session_id: str) -> Optional[str]:
+        worker = self._workers.get(session_id)
+        return worker.cwd if worker else None
+
+    def shutdown(self):
+        with self._lock:
+            for worker in self._workers.values():
+                worker.kill()
+            self._workers.clear()
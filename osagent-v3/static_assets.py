@@ -0,0 +1,123 @@
+"""
+In-memory, fingerprinted and precompressed frontend assets.
+Everything under frontend/ is read once at startup. Each asset gets a content
+hash in its URL (/static/script.<hash>.js), and index.html is rewritten to
+point at those URLs, so they can be cached forever (immutable) while the page
+itself is always revalidated by ETag. gzip and, when the brotli package is
+installed, brotli variants are built up front and picked by Accept-Encoding;
+a request is then a dictionary lookup with no disk reads or compression.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+# Compressing tiny or already-compressed files is not worth it
+MIN_COMPRESS_BYTES = 256
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+_ETAG_SUFFIXES = {'gzip': 'gz', 'br': 'br'}
+
+
+class Asset:
+    __slots__ = ('name', 'content_type', 'etag', 'variants')
+
+    def __init__(self, name: str, body: bytes, content_type: str):
+        self.name = name
+        self.content_type = content_type
+        self.etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self.variants: Dict[str, bytes] = {'identity': body}
+        if len(body) >= MIN_COMPRESS_BYTES and content_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants['br'] = compressed
+
+    def etag_for(self, encoding: str) -> str:
+        """Strong ETag of one variant; the encodings differ byte for byte, so they cannot share one"""
+        if encoding == 'identity':
+            return self.etag
+        return self.etag[:-1] + '-' + _ETAG_SUFFIXES.get(encoding, encoding) + '"'
+
+    def select(self, accept_encoding: str) -> Tuple[str, bytes]:
+        """Smallest variant the client accepts"""
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and encoding in accepted:
+                return encoding, self.variants[encoding]
+        return 'identity', self.variants['identity']
+
+
+def _accepted_encodings(header: str) -> List[str]:
+    accepted = []
+    for part in header.split(','):
+        token, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if token:
+            accepted.append(token.strip().lower())
+    return accepted
+
+
+class AssetBundle:
+    """All frontend assets, addressable by plain and fingerprinted name"""
+
+    def __init__(self, directory: str, index: str = 'index.html', url_prefix: str = '/static/'):
+        self.directory = Path(directory)
+        self.url_prefix = url_prefix
+        self.assets: Dict[str, Asset] = {}
+        self.fingerprinted: Dict[str, Asset] = {}
+        self.urls: Dict[str, str] = {}
+
+        for path in sorted(p for p in self.directory.rglob('*') if p.is_file()):
+            name = path.relative_to(self.directory).as_posix()
+            if name == index:
+                continue
+            asset = Asset(name, path.read_bytes(), _content_type(name))
+            stem, dot, suffix = name.rpartition('.')
+            hashed = f"{stem}.{asset.etag.strip(chr(34))[:12]}.{suffix}" if dot else f"{name}.{asset.etag.strip(chr(34))[:12]}"
+            self.assets[name] = asset
+            self.fingerprinted[hashed] = asset
+            self.urls[name] = url_prefix + hashed
+
+        self.index: Optional[Asset] = None
+        index_path = self.directory / index
+        if index_path.is_file():
+            html = self._rewrite(index_path.read_text(encoding='utf-8'))
+            self.index = Asset(index, html.encode('utf-8'), 'text/html; charset=utf-8')
+
+    def _rewrite(self, html: str) -> str:
+        """Point src/href references to /static/<name> at the fingerprinted URLs"""
+        pattern = re.compile(r'''((?:src|href)=["'])''' + re.escape(self.url_prefix) + r'''([^"'?#]+)''')
+        return pattern.sub(lambda m: m.group(1) + self.urls.get(m.group(2), self.url_prefix + m.group(2)), html)
+
+    def lookup(self, name: str) -> Tuple[Optional[Asset], str]:
+        """(asset, cache-control) for a /static/ path; fingerprinted names are immutable"""
+        asset = self.fingerprinted.get(name)
+        if asset is not None:
+            return asset, IMMUTABLE
+        return self.assets.get(name), REVALIDATE
+
+
+def _content_type(name: str) -> str:
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if content_type.startswith('text/') or content_type == 'application/javascript':
+        content_type += '; charset=utf-8'
+    return content_type
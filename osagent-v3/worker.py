@@ -0,0 +1,52 @@
+"""
+Worker daemon for remote execution.
+Runs on each managed host and serves commands, system status, process lists
+and file operations to a coordinator (app.py or os_agent.py with OSAGENT_HOSTS
+set). No Gemini key is needed: all planning happens on the coordinator.
+Its memory lives in agent_memory/worker, and it runs no filesystem index,
+job recovery or retention, so a worker next to a coordinator leaves the
+coordinator's jobs and databases alone.
+
+    OSAGENT_WORKER_TOKEN=secret python worker.py --host 0.0.0.0 --port 7070
+
+Without OSAGENT_WORKER_TOKEN a random token is generated and printed once;
+give it to the coordinator as its OSAGENT_WORKER_TOKEN.
+"""
+
+import argparse
+import logging
+import os
+import secrets
+
+from dotenv import load_dotenv
+
+from os_agent import OSAgent
+from remote_hosts import WorkerServer, DEFAULT_PORT
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="OS Agent worker daemon")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default: loopback only)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    token = os.getenv('OSAGENT_WORKER_TOKEN')
+    if not token:
+        token = secrets.token_urlsafe(32)
+        # Printed rather than logged, so the secret does not end up in log files
+        print(f"Generated worker token (set OSAGENT_WORKER_TOKEN={token} on the coordinator)", flush=True)
+
+    agent = OSAgent(gemini_api_key=None, worker=True)
+    server = WorkerServer(agent, token, args.host, args.port)
+    logging.getLogger(__name__).info("Worker listening on %s:%s", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()